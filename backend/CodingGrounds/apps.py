@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CodinggroundsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'CodingGrounds'
+
+    def ready(self):
+        from . import signals  # noqa: F401
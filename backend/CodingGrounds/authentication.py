@@ -0,0 +1,171 @@
+"""
+Token authentication without per-request database queries.
+
+``CachedTokenAuthentication`` resolves a token to its user and coding profile
+through a small per-process LRU and then Redis, falling back to the usual
+Token/User query on a miss. Cached tokens, users and profiles are deferred
+model instances holding only their keys and auth flags:
+``request.user.coding_profile.id`` is free, and any other field is loaded on
+first access, so nothing stale is ever written back.
+
+Entries are dropped from Redis when a token is deleted or its user is
+deactivated (see ``signals.py``); other processes may keep a local entry for
+at most ``AUTH_CACHE_LOCAL_TTL`` seconds.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS
+from redis.exceptions import RedisError
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from .models import CodingProfile
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+USER_FIELDS = ('id', 'username', 'is_active', 'is_staff', 'is_superuser')
+
+
+class LocalCache:
+    """Thread-safe LRU with per-entry expiry"""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+_local = LocalCache(
+    getattr(settings, 'AUTH_CACHE_LOCAL_ENTRIES', 10000),
+    getattr(settings, 'AUTH_CACHE_LOCAL_TTL', 5)
+)
+
+
+def get_cache_key(token_key):
+    # Raw tokens never leave the database
+    return f"auth:token:{hashlib.sha256(token_key.encode()).hexdigest()}"
+
+
+def invalidate_token(token_key):
+    """Forget a cached token in this process and in Redis"""
+    cache_key = get_cache_key(token_key)
+    _local.delete(cache_key)
+    try:
+        get_redis().delete(cache_key)
+    except RedisError as e:
+        logger.error(f"Error invalidating cached token: {str(e)}")
+
+
+def _deferred(model, values):
+    """Model instance with only the given attributes loaded"""
+    return model.from_db(DEFAULT_DB_ALIAS, list(values), [
+        values[field.attname] for field in model._meta.concrete_fields if field.attname in values
+    ])
+
+
+def _load_deferred_together(instance):
+    """Make touching one deferred field load all of them in a single query"""
+    refresh_from_db = instance.refresh_from_db
+
+    def refresh_deferred(using=None, fields=None, **kwargs):
+        if fields is not None:
+            fields = set(fields)
+            deferred_fields = instance.get_deferred_fields()
+            if fields & deferred_fields:
+                fields |= deferred_fields
+        refresh_from_db(using, fields, **kwargs)
+
+    instance.refresh_from_db = refresh_deferred
+
+
+def _to_instances(identity):
+    user = _deferred(User, {name: identity[name] for name in USER_FIELDS})
+    if identity['profile_id'] is not None:
+        profile = _deferred(CodingProfile, {'id': identity['profile_id'], 'user_id': user.id})
+        # Views read several profile fields, one query fetches them all
+        _load_deferred_together(profile)
+        # Populate the reverse one-to-one cache so user.coding_profile is free
+        CodingProfile.user.field.remote_field.set_cached_value(user, profile)
+        CodingProfile.user.field.set_cached_value(profile, user)
+    return user
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that caches token -> (user, profile id)"""
+
+    def authenticate_credentials(self, key):
+        cache_key = get_cache_key(key)
+        identity = _local.get(cache_key)
+        if identity is None:
+            identity = self._get_shared(cache_key)
+        if identity is None:
+            identity = self._load(key)
+            self._set_shared(cache_key, identity)
+        _local.set(cache_key, identity)
+
+        if not identity['is_active']:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        user = _to_instances(identity)
+        token = _deferred(self.get_model(), {'key': key, 'user_id': user.id})
+        token.user = user
+        return user, token
+
+    def _load(self, key):
+        model = self.get_model()
+        try:
+            token = model.objects.select_related('user__coding_profile').get(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed('Invalid token.')
+
+        identity = {name: getattr(token.user, name) for name in USER_FIELDS}
+        try:
+            identity['profile_id'] = token.user.coding_profile.id
+        except CodingProfile.DoesNotExist:
+            identity['profile_id'] = None
+        return identity
+
+    def _get_shared(self, cache_key):
+        try:
+            raw = get_redis().get(cache_key)
+        except RedisError as e:
+            logger.error(f"Error reading cached token: {str(e)}")
+            return None
+        return json.loads(raw) if raw is not None else None
+
+    def _set_shared(self, cache_key, identity):
+        try:
+            get_redis().set(cache_key, json.dumps(identity), ex=getattr(settings, 'AUTH_CACHE_TTL', 60))
+        except RedisError as e:
+            logger.error(f"Error caching token: {str(e)}")
@@ -0,0 +1,157 @@
+"""
+Content-addressed cache of compiled artifacts.
+
+Entries are keyed by hash(language, compiler command, source) and stored as
+directories under ``JUDGE_BUILD_CACHE_DIR``. Compilation errors are cached as
+well, so resubmitting identical broken code skips the compiler entirely. The
+cache is shared by every judge process on the host and trimmed in LRU order
+(by entry mtime, refreshed on every hit) to ``JUDGE_BUILD_CACHE_BYTES``.
+
+Hits, misses and evicted entries of every judge process are counted in the
+``metrics:build_cache`` hash (``HGETALL metrics:build_cache``).
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+META_FILE = 'meta.json'
+STATS_KEY = 'metrics:build_cache'
+
+
+class BuildCache:
+    """LRU cache of build outputs on local disk"""
+
+    def __init__(self, root=None, max_bytes=None):
+        self.root = root or getattr(settings, 'JUDGE_BUILD_CACHE_DIR', None) or os.path.join(
+            tempfile.gettempdir(), 'judge-build-cache'
+        )
+        self.max_bytes = max_bytes or getattr(settings, 'JUDGE_BUILD_CACHE_BYTES', 512 * 1024 * 1024)
+        # Only the judge's own user may publish builds, never the sandbox user
+        os.makedirs(self.root, mode=0o700, exist_ok=True)
+
+    @staticmethod
+    def make_key(language, command, source_code):
+        digest = hashlib.sha256()
+        for part in (language, json.dumps(command), source_code):
+            digest.update(part.encode('utf-8', errors='surrogatepass'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def restore(self, key, workdir):
+        """
+        Copy a cached build into workdir.
+
+        Returns (hit, error) where error is the cached compiler output for a
+        failed build and None for a successful one.
+        """
+        path = self._path(key)
+        try:
+            with open(os.path.join(path, META_FILE)) as f:
+                meta = json.load(f)
+            for name in meta['artifacts']:
+                shutil.copy2(os.path.join(path, name), os.path.join(workdir, name))
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            self._count('misses')
+            return False, None
+
+        self._count('hits')
+        return True, meta.get('error')
+
+    def store(self, key, workdir, patterns, error=None):
+        """Save the artifacts matching patterns in workdir (or a compile error)"""
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+
+        staging = tempfile.mkdtemp(prefix='.staging-', dir=self.root)
+        try:
+            artifacts = []
+            if error is None:
+                for pattern in patterns:
+                    for source in glob.glob(os.path.join(workdir, pattern)):
+                        name = os.path.basename(source)
+                        shutil.copy2(source, os.path.join(staging, name))
+                        artifacts.append(name)
+            size = sum(os.path.getsize(os.path.join(staging, name)) for name in artifacts)
+            with open(os.path.join(staging, META_FILE), 'w') as f:
+                json.dump({'artifacts': artifacts, 'error': error, 'size': size}, f)
+            # Publishing with a rename keeps readers from seeing half-written entries
+            os.rename(staging, path)
+        except OSError as e:
+            if not os.path.isdir(path):
+                logger.error(f"Error storing build cache entry {key}: {str(e)}")
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits its budget"""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.root):
+            if entry.name.startswith('.'):
+                continue
+            try:
+                with open(os.path.join(entry.path, META_FILE)) as f:
+                    size = json.load(f).get('size', 0)
+                entries.append((entry.stat().st_mtime, size, entry.path))
+                total += size
+            except (OSError, ValueError):
+                continue
+
+        entries.sort()
+        evicted = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            evicted += 1
+        if evicted:
+            self._count('evictions', evicted)
+
+    @staticmethod
+    def _count(outcome, n=1):
+        try:
+            get_redis().hincrby(STATS_KEY, outcome, n)
+        except RedisError as e:
+            logger.error(f"Error recording build cache metrics: {str(e)}")
+
+    @staticmethod
+    def stats():
+        """Counters shared by every judge process"""
+        try:
+            return {key.decode(): int(value) for key, value in get_redis().hgetall(STATS_KEY).items()}
+        except RedisError as e:
+            logger.error(f"Error reading build cache metrics: {str(e)}")
+            return {}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_build_cache():
+    """Return the process-wide build cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = BuildCache()
+        return _cache
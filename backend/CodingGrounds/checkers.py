@@ -0,0 +1,170 @@
+"""
+Output checkers.
+
+A problem picks how program output is compared with the expected output
+(``CodingProblem.checker``):
+
+- ``tokens``: whitespace-insensitive token comparison (the default)
+- ``exact``: byte-for-byte equality
+- ``float``: tokens, with numbers equal within ``checker_epsilon``,
+  absolute or relative
+- ``custom``: the problem's own Python checker, run in the sandbox launcher
+  as ``checker.py INPUT OUTPUT EXPECTED``. Exit code 0 accepts, and the
+  checker's output is reported to the player.
+
+The built-in checkers read both files in ``CHUNK_SIZE`` pieces and stop at
+the first difference, so memory stays bounded however large the output is,
+and a single huge token is compared by its digest instead of being held.
+Cases with JSON-structured expected output are still compared as JSON by
+the ``tokens`` checker, reading at most a little more output than expected.
+"""
+import hashlib
+import json
+import math
+from collections import namedtuple
+from itertools import zip_longest
+
+CHUNK_SIZE = 64 * 1024
+MAX_TOKEN_LENGTH = 4096  # longer tokens are compared by digest
+
+
+class LongToken(namedtuple('LongToken', 'length digest')):
+    """Stands in for a token longer than MAX_TOKEN_LENGTH, equal only to the same token"""
+
+
+def _long_token(hasher, length):
+    return LongToken(length, hasher.hexdigest())
+
+
+def iter_tokens(f, chunk_size=CHUNK_SIZE, max_length=MAX_TOKEN_LENGTH):
+    """
+    Whitespace separated tokens of a binary file, read chunk by chunk.
+
+    Tokens longer than ``max_length`` are hashed while they are read and
+    yielded as a LongToken, so a huge token costs linear time and no more
+    memory than a chunk.
+    """
+    pending, hasher, length = bytearray(), None, 0
+
+    def take(piece):
+        nonlocal hasher, length
+        length += len(piece)
+        if hasher is None:
+            pending.extend(piece)
+            if length > max_length:
+                hasher = hashlib.sha256(pending)
+                pending.clear()
+        else:
+            hasher.update(piece)
+
+    def finish():
+        nonlocal hasher, length
+        token = bytes(pending) if hasher is None else _long_token(hasher, length)
+        pending.clear()
+        hasher, length = None, 0
+        return token
+
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        tokens = chunk.split()
+        if length and (not tokens or chunk[:1].isspace()):
+            yield finish()
+        if not tokens:
+            continue
+        # The token touching the end of the chunk may continue in the next one
+        last = tokens.pop() if not chunk[-1:].isspace() else None
+        if length and tokens:
+            take(tokens.pop(0))
+            yield finish()
+        for token in tokens:
+            yield token if len(token) <= max_length else _long_token(hashlib.sha256(token), len(token))
+        if last is not None:
+            take(last)
+    if length:
+        yield finish()
+
+
+def check_exact(actual, expected, chunk_size=CHUNK_SIZE):
+    while True:
+        a, b = actual.read(chunk_size), expected.read(chunk_size)
+        if a != b:
+            return False
+        if not a:
+            return True
+
+
+def check_tokens(actual, expected):
+    return all(a == b for a, b in zip_longest(iter_tokens(actual), iter_tokens(expected)))
+
+
+def _floats_equal(a, b, epsilon):
+    if a == b:
+        return True
+    if a is None or b is None:
+        return False
+    try:
+        x, y = float(a), float(b)
+    except (TypeError, ValueError):
+        return False
+    if math.isnan(x) or math.isnan(y):
+        return False
+    return abs(x - y) <= epsilon * max(1.0, abs(y))
+
+
+def check_float(actual, expected, epsilon=1e-6):
+    return all(_floats_equal(a, b, epsilon) for a, b in zip_longest(iter_tokens(actual), iter_tokens(expected)))
+
+
+def _check_json(actual, expected):
+    # Structured expected output is small, it comes from inline JSON test cases.
+    # Output can differ from it only in whitespace, so anything much longer is wrong
+    # and is rejected without being read whole.
+    expected_text = expected.read()
+    limit = 2 * len(expected_text) + CHUNK_SIZE
+    actual_text = actual.read(limit + 1)
+    if len(actual_text) > limit:
+        return False
+    try:
+        return json.loads(actual_text) == json.loads(expected_text)
+    except ValueError:
+        return actual_text.split() == expected_text.split()
+
+
+CHECKERS = {
+    'tokens': check_tokens,
+    'exact': check_exact,
+    'float': check_float,
+}
+
+
+def get_problem_checker(problem):
+    """The checker settings the judge needs for a problem"""
+    checker = {'mode': problem.checker}
+    if problem.checker == 'float':
+        checker['epsilon'] = problem.checker_epsilon
+    elif problem.checker == 'custom':
+        checker['source'] = problem.checker_source
+    return checker
+
+
+def get_checker_version(problem):
+    """Part of the problem's judge_version, changes whenever verdicts could"""
+    parts = [problem.checker]
+    if problem.checker == 'float':
+        parts.append(repr(problem.checker_epsilon))
+    elif problem.checker == 'custom':
+        parts.append(hashlib.sha256(problem.checker_source.encode()).hexdigest())
+    return ':'.join(parts)
+
+
+def output_matches(output_path, case, checker=None):
+    """Compare a program's output file with a case's expected output using a built-in checker"""
+    checker = checker or {'mode': 'tokens'}
+    with open(output_path, 'rb') as actual, case.open_expected() as expected:
+        if checker['mode'] == 'tokens' and case.format == 'json':
+            return _check_json(actual, expected)
+        if checker['mode'] == 'float':
+            return check_float(actual, expected, checker.get('epsilon', 1e-6))
+        return CHECKERS[checker['mode']](actual, expected)
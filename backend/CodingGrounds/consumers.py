@@ -3,20 +3,27 @@ import logging
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.core.exceptions import PermissionDenied
-from .models import GameSession, GameParticipation, CodingProfile
+from redis.exceptions import RedisError
+from .models import GameSession, GameParticipation, CodingProfile, CodingProblem
+from .heartbeat import get_heartbeat_wheel
+from .matchmaking import get_matchmaking_queue
+from .membership import SessionMembership
 from .websocket_utils import WebSocketManager
-import asyncio
+import time
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
 class SessionConsumer(AsyncWebsocketConsumer):
     """Handles WebSocket connections for game sessions"""
+    last_ping = float('-inf')
     
     async def connect(self):
         """Handle WebSocket connection"""
         self.session_id = self.scope['url_route']['kwargs']['session_id']
         self.group_name = WebSocketManager.get_group_name(self.session_id)
+        started = time.perf_counter()
+        self.membership_cache_miss = False
         
         try:
             # Verify user is authenticated
@@ -24,7 +31,13 @@ class SessionConsumer(AsyncWebsocketConsumer):
                 raise PermissionDenied("User must be authenticated")
             
             # Verify user is a participant in the session
-            if not await self.is_session_participant():
+            allowed = await self.is_session_participant()
+            await SessionMembership.record_connect(
+                time.perf_counter() - started,
+                'accepted' if allowed else 'denied',
+                self.membership_cache_miss
+            )
+            if not allowed:
                 raise PermissionDenied("User is not a participant in this session")
             
             # Join session group
@@ -39,8 +52,8 @@ class SessionConsumer(AsyncWebsocketConsumer):
             # Log successful connection
             logger.info(f"WebSocket connection established - Session: {self.session_id}, User: {self.scope['user'].username}")
             
-            # Start heartbeat
-            self.heartbeat_task = asyncio.create_task(self.send_heartbeat())
+            # Heartbeats come from the shared per-process wheel
+            get_heartbeat_wheel().register(self)
             
         except Exception as e:
             logger.error(f"WebSocket connection failed - Session: {self.session_id}, Error: {str(e)}")
@@ -49,8 +62,7 @@ class SessionConsumer(AsyncWebsocketConsumer):
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection"""
         # Stop heartbeat
-        if hasattr(self, 'heartbeat_task'):
-            self.heartbeat_task.cancel()
+        get_heartbeat_wheel().unregister(self)
         
         # Leave session group
         await self.channel_layer.group_discard(
@@ -71,6 +83,8 @@ class SessionConsumer(AsyncWebsocketConsumer):
             logger.info(f"Incoming WebSocket message - Session: {self.session_id}, Type: {message_type}, Data: {json.dumps(data)}")
             
             if message_type == 'ping':
+                # A client that pings doesn't need our heartbeat
+                self.last_ping = time.monotonic()
                 await self.send(text_data=json.dumps({
                     'type': 'pong',
                     'timestamp': datetime.now().isoformat()
@@ -88,54 +102,166 @@ class SessionConsumer(AsyncWebsocketConsumer):
                 WebSocketManager.format_error_message(str(e))
             ))
     
-    async def send_heartbeat(self):
-        """Send periodic heartbeat messages"""
-        while True:
-            try:
-                await self.send(text_data=json.dumps(
-                    WebSocketManager.get_heartbeat_message()
-                ))
-                await asyncio.sleep(30)  # Send heartbeat every 30 seconds
-            except asyncio.CancelledError:
-                break
-            except Exception as e:
-                logger.error(f"Heartbeat error - Session: {self.session_id}, Error: {str(e)}")
-                await asyncio.sleep(5)  # Wait before retrying
-    
-    @database_sync_to_async
-    def is_session_participant(self):
+    async def is_session_participant(self):
         """Check if user is a participant in the session"""
+        user_id = self.scope["user"].id
         try:
-            session = GameSession.objects.get(id=self.session_id)
-            profile = CodingProfile.objects.get(user=self.scope["user"])
-            return session.participants.filter(id=profile.id).exists()
-        except (GameSession.DoesNotExist, CodingProfile.DoesNotExist):
+            member = await SessionMembership.is_member(self.session_id, user_id)
+        except RedisError as e:
+            logger.error(f"Error reading session members - Session: {self.session_id}, Error: {str(e)}")
+            member = None
+        if member is not None:
+            return member
+
+        # Not cached yet: load the members once and cache them for everyone else
+        self.membership_cache_miss = True
+        try:
+            version = await SessionMembership.get_version(self.session_id)
+        except RedisError as e:
+            logger.error(f"Error reading session members - Session: {self.session_id}, Error: {str(e)}")
+            version = None
+        user_ids = await self.get_participant_user_ids()
+        if user_ids is None:
             return False
+        try:
+            if version is not None:
+                await SessionMembership.fill(self.session_id, user_ids, version)
+        except RedisError as e:
+            logger.error(f"Error caching session members - Session: {self.session_id}, Error: {str(e)}")
+        return user_id in user_ids
+
+    @database_sync_to_async
+    def get_participant_user_ids(self):
+        """User ids of the session's participants, or None if there is no such session"""
+        if not GameSession.objects.filter(id=self.session_id).exists():
+            return None
+        return set(GameParticipation.objects.filter(
+            game_session_id=self.session_id,
+            profile__user__isnull=False
+        ).values_list('profile__user_id', flat=True))
     
     # Event handlers for different message types
     async def session_join(self, event):
         logger.info(f"Processing session_join event - Session: {self.session_id}")
-        await self.send(text_data=json.dumps(event['message']))
+        await self.send(text_data=event['text'])
     
     async def session_leave(self, event):
         logger.info(f"Processing session_leave event - Session: {self.session_id}")
-        await self.send(text_data=json.dumps(event['message']))
+        await self.send(text_data=event['text'])
     
     async def session_ready(self, event):
         logger.info(f"Processing session_ready event - Session: {self.session_id}")
-        await self.send(text_data=json.dumps(event['message']))
+        await self.send(text_data=event['text'])
     
     async def session_start(self, event):
         logger.info(f"Processing session_start event - Session: {self.session_id}")
-        await self.send(text_data=json.dumps(event['message']))
+        await self.send(text_data=event['text'])
     
     async def session_end(self, event):
         logger.info(f"Processing session_end event - Session: {self.session_id}")
-        await self.send(text_data=json.dumps(event['message']))
+        await self.send(text_data=event['text'])
+    
+    async def session_verdict(self, event):
+        logger.info(f"Processing session_verdict event - Session: {self.session_id}")
+        await self.send(text_data=event['text'])
+    
+    async def session_leaderboard_delta(self, event):
+        logger.info(f"Processing session_leaderboard_delta event - Session: {self.session_id}")
+        await self.send(text_data=event['text'])
     
     async def session_error(self, event):
-        logger.error(f"Processing session_error event - Session: {self.session_id}, Error: {event['message']}")
-        await self.send(text_data=json.dumps(event['message']))
+        logger.error(f"Processing session_error event - Session: {self.session_id}, Error: {event['text']}")
+        await self.send(text_data=event['text'])
+
+class UserConsumer(AsyncWebsocketConsumer):
+    """Per-user connection for matchmaking and notifications outside a session"""
+    
+    async def connect(self):
+        """Handle WebSocket connection"""
+        user = self.scope["user"]
+        if not user.is_authenticated:
+            logger.error("User WebSocket connection failed - Error: User must be authenticated")
+            await self.close(code=4000)
+            return
+        
+        self.profile = await self.get_profile()
+        if self.profile is None:
+            logger.error(f"User WebSocket connection failed - User: {user.username}, Error: No coding profile")
+            await self.close(code=4000)
+            return
+        
+        self.group_name = WebSocketManager.get_user_group_name(user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        logger.info(f"User WebSocket connection established - User: {user.username}")
+    
+    async def disconnect(self, close_code):
+        """Handle WebSocket disconnection"""
+        if getattr(self, 'group_name', None) is None:
+            return
+        # A player who goes away stops waiting for a match
+        try:
+            await get_matchmaking_queue().remove(self.profile.id)
+        except RedisError as e:
+            logger.error(f"Error leaving matchmaking - User: {self.scope['user'].username}, Error: {str(e)}")
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        logger.info(f"User WebSocket disconnected - User: {self.scope['user'].username}, Code: {close_code}")
+    
+    async def receive(self, text_data):
+        """Handle incoming WebSocket messages"""
+        try:
+            data = json.loads(text_data)
+            message_type = data.get('type')
+            
+            if message_type == 'matchmaking_join':
+                difficulty = int(data.get('difficulty', CodingProblem.Difficulty.EASY))
+                if difficulty not in CodingProblem.Difficulty.values:
+                    raise ValueError(f"Invalid difficulty: {difficulty}")
+                # Ratings change between matches, so read the current one
+                rating = await self.get_rating()
+                queue = get_matchmaking_queue()
+                await queue.add(self.profile.id, self.scope["user"].id, rating, difficulty)
+                await self.send(text_data=json.dumps({
+                    'type': 'matchmaking_queued',
+                    'difficulty': difficulty,
+                    'rating': rating,
+                    'waiting': await queue.count()
+                }))
+            elif message_type == 'matchmaking_leave':
+                removed = await get_matchmaking_queue().remove(self.profile.id)
+                await self.send(text_data=json.dumps({
+                    'type': 'matchmaking_left',
+                    'was_queued': removed is not None
+                }))
+            elif message_type == 'ping':
+                await self.send(text_data=json.dumps({
+                    'type': 'pong',
+                    'timestamp': datetime.now().isoformat()
+                }))
+            
+        except (json.JSONDecodeError, TypeError, ValueError, RedisError) as e:
+            logger.error(f"User WebSocket message error - User: {self.scope['user'].username}, Error: {str(e)}")
+            await self.send(text_data=json.dumps(
+                WebSocketManager.format_error_message(str(e))
+            ))
+    
+    @database_sync_to_async
+    def get_profile(self):
+        return CodingProfile.objects.only('id').filter(user_id=self.scope["user"].id).first()
+    
+    @database_sync_to_async
+    def get_rating(self):
+        return CodingProfile.objects.filter(pk=self.profile.id).values_list('rating', flat=True).get()
+    
+    async def user_match_found(self, event):
+        logger.info(f"Processing user_match_found event - User: {self.scope['user'].username}")
+        await self.send(text_data=event['text'])
+
+    async def user_matchmaking_expired(self, event):
+        await self.send(text_data=event['text'])
+
+    async def user_verdict(self, event):
+        await self.send(text_data=event['text'])
 
 class SimpleTestConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -0,0 +1,155 @@
+"""
+Global, weekly and per-tag solve leaderboards kept in Redis.
+
+Each board is a sorted set of profile ids scored by distinct problems solved:
+all time, first solved during the current ISO week, or solved among problems
+carrying a tag. Judge workers bump the boards on every first solve
+(``record_solve``) and ``manage.py rebuild_leaderboards`` recomputes them
+from accepted ``Submission`` rows, e.g. from cron.
+
+Every change bumps a per-board version which the API uses as its ETag, so
+polling clients get 304s until the board moves. Pages are read with
+ZREVRANGE, so a page costs O(log n + page size).
+"""
+import logging
+from collections import Counter, defaultdict
+
+from django.db.models import Min
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from .models import CodingProblem, CodingProfile, Submission
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_KEY = 'board:global'
+BUILT_KEY = 'board:built'
+# A week's board is kept for one more week after it closes
+WEEKLY_TTL = 14 * 24 * 60 * 60
+
+
+def get_weekly_key(when=None):
+    year, week, _ = (when or timezone.now()).isocalendar()
+    return f"board:weekly:{year}-W{week:02d}"
+
+
+def get_tag_key(tag):
+    return f"board:tag:{tag}"
+
+
+def get_version_key(key):
+    return f"{key}:version"
+
+
+def record_solve(submission):
+    """Credit a first solve to every board it belongs to"""
+    keys = [GLOBAL_KEY, get_weekly_key(submission.submitted_at)]
+    keys += [get_tag_key(tag) for tag in submission.problem.tags or []]
+    try:
+        pipe = get_redis().pipeline(transaction=True)
+        for key in keys:
+            pipe.zincrby(key, 1, submission.profile_id)
+            pipe.incr(get_version_key(key))
+        pipe.expire(keys[1], WEEKLY_TTL)
+        pipe.expire(get_version_key(keys[1]), WEEKLY_TTL)
+        pipe.execute()
+    except RedisError as e:
+        # The next rebuild picks the solve up from the database
+        logger.error(f"Error updating leaderboards - Submission: {submission.id}, Error: {str(e)}")
+
+
+def rebuild_boards():
+    """Recompute every board from the first accepted submission of each solve"""
+    tags = dict(CodingProblem.objects.values_list('id', 'tags'))
+    weekly_key = get_weekly_key()
+    boards = defaultdict(Counter)
+
+    first_solves = Submission.objects.filter(
+        status=Submission.Status.ACCEPTED
+    ).order_by().values_list('profile_id', 'problem_id').annotate(first=Min('submitted_at'))
+    for profile_id, problem_id, first in first_solves.iterator(chunk_size=2000):
+        boards[GLOBAL_KEY][profile_id] += 1
+        if get_weekly_key(first) == weekly_key:
+            boards[weekly_key][profile_id] += 1
+        for tag in tags.get(problem_id) or []:
+            boards[get_tag_key(tag)][profile_id] += 1
+
+    redis = get_redis()
+    for key in redis.scan_iter(match='board:tag:*'):
+        key = key.decode()
+        if key.endswith((':version', ':rebuild')) or key in boards:
+            continue
+        # Nobody has solved a problem with this tag any more
+        redis.delete(key)
+        redis.incr(get_version_key(key))
+
+    for key in {GLOBAL_KEY, weekly_key} | set(boards):
+        _replace(redis, key, boards[key])
+    redis.expire(weekly_key, WEEKLY_TTL)
+    redis.set(BUILT_KEY, timezone.now().isoformat())
+    return len(boards)
+
+
+def _replace(redis, key, scores, batch_size=1000):
+    # Built under a staging key and renamed so readers never see a partial board
+    staging_key = f"{key}:rebuild"
+    redis.delete(staging_key)
+    items = list(scores.items())
+    for start in range(0, len(items), batch_size):
+        redis.zadd(staging_key, dict(items[start:start + batch_size]))
+    pipe = redis.pipeline(transaction=True)
+    if items:
+        pipe.rename(staging_key, key)
+    else:
+        pipe.delete(key)
+    pipe.incr(get_version_key(key))
+    pipe.execute()
+
+
+def ensure_built():
+    if not get_redis().exists(BUILT_KEY):
+        rebuild_boards()
+
+
+def get_board_version(key):
+    return int(get_redis().get(get_version_key(key)) or 0)
+
+
+def read_board(key, page=1, page_size=50):
+    """Return one page of a board, ranked best first"""
+    redis = get_redis()
+    start = (page - 1) * page_size
+    pipe = redis.pipeline(transaction=False)
+    pipe.zcard(key)
+    pipe.zrevrange(key, start, start + page_size - 1, withscores=True)
+    total, members = pipe.execute()
+
+    # Ties share a rank: 1 + number of profiles with a strictly higher score
+    scores = sorted({score for _, score in members}, reverse=True)
+    pipe = redis.pipeline(transaction=False)
+    for score in scores:
+        pipe.zcount(key, f"({score}", '+inf')
+    ranks = {score: above + 1 for score, above in zip(scores, pipe.execute())}
+
+    profiles = CodingProfile.objects.only('id', 'display_name', 'rating').in_bulk(
+        [int(member) for member, _ in members]
+    )
+    results = []
+    for member, score in members:
+        profile = profiles.get(int(member))
+        if profile is None:
+            continue
+        results.append({
+            'rank': ranks[score],
+            'profile_id': profile.id,
+            'username': profile.display_name,
+            'rating': profile.rating,
+            'problems_solved': int(score)
+        })
+    return {
+        'count': total,
+        'page': page,
+        'next': page + 1 if start + page_size < total else None,
+        'results': results
+    }
@@ -0,0 +1,81 @@
+"""
+Shared heartbeat scheduler for WebSocket consumers.
+
+Instead of one sleeping task per connection, every event loop runs a single
+timer wheel with ``WEBSOCKET_HEARTBEAT_SLOTS`` buckets spanning
+``WEBSOCKET_HEARTBEAT_INTERVAL`` seconds. A consumer lives in one bucket and
+gets a heartbeat each time the wheel passes it, so registrations made at
+different times are spread over the interval. Each tick encodes the
+heartbeat frame once and skips consumers that pinged within the interval,
+since those connections are evidently alive.
+"""
+import asyncio
+import logging
+import time
+import weakref
+
+from django.conf import settings
+
+from .websocket_utils import WebSocketManager, encode_message
+
+logger = logging.getLogger(__name__)
+
+
+class HeartbeatWheel:
+    """Sends periodic heartbeats to registered consumers from one task"""
+
+    def __init__(self, interval=None, slots=None):
+        self.interval = interval or getattr(settings, 'WEBSOCKET_HEARTBEAT_INTERVAL', 30)
+        slots = slots or getattr(settings, 'WEBSOCKET_HEARTBEAT_SLOTS', 30)
+        self.buckets = [set() for _ in range(slots)]
+        self.position = 0
+        self._slot_of = {}
+        self._task = None
+
+    def register(self, consumer):
+        # The bucket just behind the hand comes up again after a full interval
+        slot = (self.position - 1) % len(self.buckets)
+        self.buckets[slot].add(consumer)
+        self._slot_of[consumer] = slot
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def unregister(self, consumer):
+        slot = self._slot_of.pop(consumer, None)
+        if slot is not None:
+            self.buckets[slot].discard(consumer)
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    async def _run(self):
+        tick = self.interval / len(self.buckets)
+        while self._slot_of:
+            await asyncio.sleep(tick)
+            self.position = (self.position + 1) % len(self.buckets)
+            await self._beat(self.buckets[self.position])
+
+    async def _beat(self, bucket):
+        if not bucket:
+            return
+        frame = encode_message(WebSocketManager.get_heartbeat_message())
+        alive_since = time.monotonic() - self.interval
+        for consumer in list(bucket):
+            if consumer.last_ping > alive_since:
+                continue
+            try:
+                await consumer.send(text_data=frame)
+            except Exception as e:
+                logger.error(f"Heartbeat error - Session: {consumer.session_id}, Error: {str(e)}")
+
+
+_wheels = weakref.WeakKeyDictionary()
+
+
+def get_heartbeat_wheel():
+    """Return the heartbeat wheel of the running event loop"""
+    loop = asyncio.get_running_loop()
+    wheel = _wheels.get(loop)
+    if wheel is None:
+        wheel = _wheels[loop] = HeartbeatWheel()
+    return wheel
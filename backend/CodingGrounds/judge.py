@@ -0,0 +1,629 @@
+"""
+Judge engine for code submissions.
+
+Every test case runs in its own sandboxed child process with rlimits (CPU,
+address space, output size) and, when ``JUDGE_CGROUP_ROOT`` points at a
+delegated cgroup v2 directory, a per-run cgroup for memory/pid accounting.
+
+Children are forked by warm launcher processes (see ``sandbox_launcher.py``)
+held in a fixed-size ``SandboxPool``, so the number of concurrent sandboxes is
+bounded no matter how many submissions arrive at once.
+
+Submitted code must run as a dedicated user and group
+(``JUDGE_SANDBOX_UID``/``JUDGE_SANDBOX_GID``) that owns nothing else on the
+host. The pool refuses to start without them, unless
+``JUDGE_ALLOW_UNSANDBOXED`` is set for development. In that mode stored test
+data is never judged, since its expected outputs would be readable.
+
+Submitted code also gets no network access: launchers run in an empty network
+namespace, and a launcher that cannot create one (the judge lacks
+CAP_SYS_ADMIN) is refused unless ``JUDGE_ALLOW_UNSANDBOXED`` is set. Unix
+sockets are files, so Redis and the database must not listen on a socket the
+sandbox user can open. Neither the launcher nor the children inherit this
+process's environment, which holds the application's secrets.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .build_cache import get_build_cache
+from .checkers import output_matches
+from .models import Submission
+from .testdata import load_cases
+
+logger = logging.getLogger(__name__)
+
+LAUNCHER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sandbox_launcher.py')
+
+# Python runs inside the warm launcher interpreter, everything else is
+# compiled once per distinct source (see build_cache.py) and exec'd for each
+# test case. 'artifacts' are the build outputs kept in the build cache.
+LANGUAGES = {
+    'python': {
+        'source': 'main.py',
+    },
+    'c': {
+        'source': 'main.c',
+        'compile': ['gcc', '-O2', '-std=c11', '-o', 'main', 'main.c', '-lm'],
+        'artifacts': ['main'],
+        'run': ['./main'],
+    },
+    'cpp': {
+        'source': 'main.cpp',
+        'compile': ['g++', '-O2', '-std=c++17', '-o', 'main', 'main.cpp'],
+        'artifacts': ['main'],
+        'run': ['./main'],
+    },
+    'java': {
+        'source': 'Main.java',
+        'compile': ['javac', '-encoding', 'UTF-8', 'Main.java'],
+        'artifacts': ['*.class'],
+        'run': ['java', '-Xmx{memory}m', '-Xss64m', '-cp', '.', 'Main'],
+        # The JVM reserves far more address space than it uses
+        'address_space': False,
+    },
+    'go': {
+        'source': 'main.go',
+        'compile': ['go', 'build', '-o', 'main', 'main.go'],
+        'artifacts': ['main'],
+        'run': ['./main'],
+        'address_space': False,
+    },
+}
+
+LANGUAGE_ALIASES = {
+    'python3': 'python',
+    'py': 'python',
+    'c++': 'cpp',
+    'golang': 'go',
+}
+
+OUTPUT_PREVIEW_BYTES = 1024
+ERROR_PREVIEW_BYTES = 4096
+
+
+class JudgeError(Exception):
+    """Raised when the judge itself (not the submission) fails"""
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def sandbox_drops_privileges():
+    """True if submissions run as a user and group other than this process's"""
+    uid, gid = _setting('JUDGE_SANDBOX_UID', None), _setting('JUDGE_SANDBOX_GID', None)
+    return uid is not None and gid is not None and uid != os.getuid() and gid != os.getgid()
+
+
+def check_sandbox_user():
+    """Refuse to judge as this process's own user unless explicitly allowed"""
+    if sandbox_drops_privileges():
+        return
+    if not _setting('JUDGE_ALLOW_UNSANDBOXED', False):
+        raise ImproperlyConfigured(
+            "JUDGE_SANDBOX_UID and JUDGE_SANDBOX_GID must name a dedicated user and group for submitted code"
+        )
+    logger.error(
+        "JUDGE_ALLOW_UNSANDBOXED is set: submitted code runs as the judge's own user and can read "
+        "its files and credentials. Stored test data is disabled. Never enable this in production."
+    )
+
+
+def normalize_language(language):
+    """Map a free-form language string onto a LANGUAGES key (or None)"""
+    name = (language or '').strip().lower()
+    name = LANGUAGE_ALIASES.get(name, name)
+    return name if name in LANGUAGES else None
+
+
+def _read_head(path, limit):
+    try:
+        with open(path, 'rb') as f:
+            return f.read(limit).decode('utf-8', errors='replace')
+    except OSError:
+        return ''
+
+
+def _read_tail(path, limit):
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - limit))
+            return f.read().decode('utf-8', errors='replace')
+    except OSError:
+        return ''
+
+
+class Launcher:
+    """A warm sandbox launcher process speaking line-delimited JSON"""
+
+    def __init__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, '-I', '-S', LAUNCHER_PATH],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            close_fds=True,
+            start_new_session=True,
+            env={'PATH': os.environ.get('PATH', '/usr/local/bin:/usr/bin:/bin'), 'LANG': 'C.UTF-8'},
+        )
+        line = self.process.stdout.readline()
+        if not line:
+            self.close()
+            raise JudgeError("Sandbox launcher failed to start")
+        if not json.loads(line).get('network_isolated'):
+            if not _setting('JUDGE_ALLOW_UNSANDBOXED', False):
+                self.close()
+                raise JudgeError("Sandbox launcher could not isolate the network, the judge needs CAP_SYS_ADMIN")
+            logger.warning("Sandbox launcher has network access because JUDGE_ALLOW_UNSANDBOXED is set")
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def run(self, job, on_start=None):
+        """Run one sandbox job and return the launcher's measurements"""
+        try:
+            self.process.stdin.write(json.dumps(job).encode() + b'\n')
+            self.process.stdin.flush()
+            while True:
+                line = self.process.stdout.readline()
+                if not line:
+                    break
+                result = json.loads(line)
+                if 'started' not in result:
+                    break
+                if on_start is not None:
+                    on_start(result['started'])
+        except OSError as e:
+            self.close()
+            raise JudgeError(f"Sandbox launcher died: {e}")
+        if not line:
+            self.close()
+            raise JudgeError("Sandbox launcher exited unexpectedly")
+
+        if result.get('error'):
+            raise JudgeError(f"Sandbox launcher error: {result['error']}")
+        return result
+
+    def close(self):
+        if self.alive():
+            self.process.kill()
+        self.process.wait()
+
+
+class SandboxPool:
+    """Fixed-size pool of warm launchers bounding concurrent sandboxes"""
+
+    def __init__(self, size):
+        check_sandbox_user()
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        # Threads only wait on launcher I/O; the slots above bound the sandboxes
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='judge-case')
+
+    @contextmanager
+    def acquire(self):
+        """Check out a launcher, blocking while all slots are busy"""
+        self._slots.acquire()
+        launcher = None
+        try:
+            try:
+                launcher = self._idle.get_nowait()
+                if not launcher.alive():
+                    launcher = Launcher()
+            except queue.Empty:
+                launcher = Launcher()
+            yield launcher
+        finally:
+            if launcher is not None and launcher.alive():
+                self._idle.put(launcher)
+            self._slots.release()
+
+    def warm_up(self):
+        """Start every launcher up front so the first submissions don't pay for it"""
+        while self._idle.qsize() < self.size:
+            self._idle.put(Launcher())
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide sandbox pool"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool(_setting('JUDGE_MAX_WORKERS', os.cpu_count() or 2))
+            atexit.register(_pool.close)
+        return _pool
+
+
+class Verdict:
+    """Outcome of judging a submission against all of its test cases"""
+
+    def __init__(self, results, execution_time=None, memory_usage=None):
+        self.results = results
+        self.execution_time = execution_time
+        self.memory_usage = memory_usage
+
+    @property
+    def status(self):
+        # Cases skipped after an early exit stay PENDING and don't decide the verdict
+        for result in self.results:
+            if result['status'] not in (Submission.Status.ACCEPTED, Submission.Status.PENDING):
+                return result['status']
+        return Submission.Status.ACCEPTED
+
+
+class _CaseBatch:
+    """Tracks the sandboxes of one submission so they can be cancelled together"""
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def started(self, index, pid):
+        with self._lock:
+            if self.cancelled.is_set():
+                self._kill(pid)
+            self._running[index] = pid
+
+    def finished(self, index):
+        with self._lock:
+            self._running.pop(index, None)
+
+    def cancel(self, failed_index):
+        """Stop every other case after failed_index reported a failure"""
+        with self._lock:
+            self.cancelled.set()
+            for index, pid in self._running.items():
+                if index != failed_index:
+                    self._kill(pid)
+
+    def _kill(self, pid):
+        # The child may not have called setsid yet, so fall back to the pid itself
+        for kill in (os.killpg, os.kill):
+            try:
+                kill(pid, signal.SIGKILL)
+                return
+            except OSError:
+                continue
+
+
+class Judge:
+    """Compiles a submission and runs it against a problem's test cases"""
+
+    def __init__(self, pool=None, build_cache=None):
+        self.pool = pool or get_pool()
+        self.build_cache = build_cache or get_build_cache()
+
+    def run(self, source_code, language, test_cases, time_limit=1.0, memory_limit=128, run_all=False,
+            checker=None):
+        """
+        Judge source_code and return a Verdict with one result per test case.
+
+        test_cases is a list of JSON test cases or the digest of a manifest in
+        the test data store. Test cases run in parallel across the pool. Unless
+        run_all is set, the first failing case cancels the rest, which are
+        reported as PENDING. checker selects how outputs are compared (see
+        checkers.py) and defaults to whitespace-insensitive tokens.
+        """
+        if isinstance(test_cases, str) and not sandbox_drops_privileges():
+            raise JudgeError("Stored test data is only judged in a sandbox that drops privileges")
+        test_cases = load_cases(test_cases)
+        checker = checker or {'mode': 'tokens'}
+        if checker['mode'] == 'custom' and not (checker.get('source') or '').strip():
+            # An empty checker.py would accept any output
+            raise JudgeError("Custom checker has no source")
+        name = normalize_language(language)
+        if name is None:
+            return self._failed(test_cases, Submission.Status.COMPILATION_ERROR,
+                                f"Unsupported language: {language}")
+
+        if name == 'python':
+            error = self._check_python_syntax(source_code)
+            if error:
+                return self._failed(test_cases, Submission.Status.COMPILATION_ERROR, error)
+
+        spec = LANGUAGES[name]
+        workdir = self._make_workdir()
+        if checker['mode'] == 'custom':
+            checker = self._prepare_checker(checker)
+        try:
+            with open(os.path.join(workdir, spec['source']), 'w') as f:
+                f.write(source_code)
+
+            if spec.get('compile'):
+                error = self._build(workdir, name, spec, source_code)
+                if error is not None:
+                    return self._failed(test_cases, Submission.Status.COMPILATION_ERROR, error)
+
+            batch = _CaseBatch()
+            futures = [
+                self.pool.executor.submit(
+                    self._run_case_in_batch, batch, run_all, workdir, spec,
+                    index, test_case, time_limit, memory_limit, checker
+                )
+                for index, test_case in enumerate(test_cases)
+            ]
+            measured = [future.result() for future in futures]
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+            if 'directory' in checker:
+                shutil.rmtree(checker['directory'], ignore_errors=True)
+
+        ran = [entry for entry in measured if entry[0]['status'] != Submission.Status.PENDING]
+        return Verdict(
+            [result for result, _, _ in measured],
+            execution_time=max((cpu for _, cpu, _ in ran), default=0.0),
+            memory_usage=max((peak for _, _, peak in ran), default=0),
+        )
+
+    def _run_case_in_batch(self, batch, run_all, workdir, spec, index, test_case, time_limit, memory_limit,
+                           checker):
+        if batch.cancelled.is_set():
+            return self._skipped(index, test_case), 0.0, 0
+
+        with self.pool.acquire() as launcher:
+            if batch.cancelled.is_set():
+                return self._skipped(index, test_case), 0.0, 0
+            try:
+                outcome = self._run_case(
+                    launcher, workdir, spec, index, test_case, time_limit, memory_limit, checker,
+                    on_start=lambda pid: batch.started(index, pid)
+                )
+            finally:
+                batch.finished(index)
+
+        if batch.cancelled.is_set() and outcome[0]['status'] != Submission.Status.ACCEPTED:
+            # Killed because another case failed first
+            return self._skipped(index, test_case), 0.0, 0
+        if not run_all and outcome[0]['status'] != Submission.Status.ACCEPTED:
+            batch.cancel(index)
+        return outcome
+
+    def _prepare_checker(self, checker):
+        # Kept out of the workdir, where the submission could read or replace it
+        directory = tempfile.mkdtemp(prefix='checker-', dir=_setting('JUDGE_WORK_DIR', None))
+        path = os.path.join(directory, 'checker.py')
+        with open(path, 'w') as f:
+            f.write(checker['source'])
+        return dict(checker, directory=directory, path=path)
+
+    def _make_workdir(self):
+        work_root = _setting('JUDGE_WORK_DIR', None)
+        if work_root:
+            os.makedirs(work_root, exist_ok=True)
+        workdir = tempfile.mkdtemp(prefix='judge-', dir=work_root)
+        uid = _setting('JUDGE_SANDBOX_UID', None)
+        if uid is not None:
+            os.chown(workdir, uid, _setting('JUDGE_SANDBOX_GID', None) or -1)
+        return workdir
+
+    def _environment(self, workdir):
+        return {
+            'PATH': os.environ.get('PATH', '/usr/local/bin:/usr/bin:/bin'),
+            'HOME': workdir,
+            'LANG': 'C.UTF-8',
+            'GOCACHE': os.path.join(tempfile.gettempdir(), 'judge-gocache'),
+        }
+
+    def _base_job(self, workdir):
+        return {
+            'cwd': workdir,
+            'env': self._environment(workdir),
+            'fsize': _setting('JUDGE_OUTPUT_LIMIT', 64 * 1024 * 1024),
+            'cgroup_root': _setting('JUDGE_CGROUP_ROOT', None),
+            'pids': _setting('JUDGE_CGROUP_PIDS_MAX', 64),
+            'uid': _setting('JUDGE_SANDBOX_UID', None),
+            'gid': _setting('JUDGE_SANDBOX_GID', None),
+        }
+
+    def _check_python_syntax(self, source_code):
+        try:
+            compile(source_code, 'main.py', 'exec')
+        except (SyntaxError, ValueError, OverflowError, MemoryError, RecursionError) as e:
+            return ''.join(traceback.format_exception_only(type(e), e))
+        return None
+
+    def _build(self, workdir, name, spec, source_code):
+        """Restore or compile the submission, returning the compiler output on failure"""
+        key = self.build_cache.make_key(name, spec['compile'], source_code)
+        hit, error = self.build_cache.restore(key, workdir)
+        if hit:
+            return error
+
+        with self.pool.acquire() as launcher:
+            error, cacheable = self._compile(launcher, workdir, spec)
+        if cacheable:
+            self.build_cache.store(key, workdir, spec['artifacts'], error)
+        return error
+
+    def _compile(self, launcher, workdir, spec):
+        """
+        Compile the submission.
+
+        Returns (error, cacheable); error is None on success. Timeouts and
+        compilers killed by a signal depend on load, so they are not cached.
+        """
+        compile_time = _setting('JUDGE_COMPILE_TIME_LIMIT', 10)
+        job = self._base_job(workdir)
+        job.update({
+            'argv': spec['compile'],
+            'stdin': os.devnull,
+            'stdout': os.path.join(workdir, 'compile.out'),
+            'stderr': os.path.join(workdir, 'compile.err'),
+            'cpu': compile_time,
+            'wall': compile_time * 2,
+            'memory': _setting('JUDGE_COMPILE_MEMORY_LIMIT', 1024) * 1024 * 1024,
+            'pids': None,
+        })
+        result = launcher.run(job)
+        if result['exit_code'] == 0:
+            return None, True
+        if result['timed_out']:
+            return "Compilation timed out", False
+        error = (_read_tail(job['stderr'], ERROR_PREVIEW_BYTES)
+                 or _read_tail(job['stdout'], ERROR_PREVIEW_BYTES)
+                 or "Compilation failed")
+        return error, result['signal'] is None
+
+    def _run_case(self, launcher, workdir, spec, index, test_case, time_limit, memory_limit, checker,
+                  on_start=None):
+        """Run a single test case; returns (result entry, cpu seconds, peak KB)"""
+        input_path = test_case.prepare_input(workdir, index)
+
+        memory_bytes = int(memory_limit * 1024 * 1024)
+        job = self._base_job(workdir)
+        job.update({
+            'stdin': input_path,
+            'stdout': os.path.join(workdir, f'output-{index}.txt'),
+            'stderr': os.path.join(workdir, f'error-{index}.txt'),
+            'cpu': time_limit,
+            'wall': time_limit * 2 + 1,
+            'memory': memory_bytes,
+        })
+        if spec.get('run'):
+            job['argv'] = [arg.format(memory=memory_limit) for arg in spec['run']]
+        else:
+            job['source'] = os.path.join(workdir, spec['source'])
+        if spec.get('address_space', True):
+            job['address_space'] = memory_bytes + _setting('JUDGE_ADDRESS_SPACE_SLACK', 64) * 1024 * 1024
+
+        measured = launcher.run(job, on_start=on_start)
+        status, error = self._classify(measured, job, time_limit, memory_limit)
+
+        output = _read_head(job['stdout'], OUTPUT_PREVIEW_BYTES)
+        if status is None:
+            if checker['mode'] == 'custom':
+                match, error = self._run_checker(launcher, checker, index, input_path, job['stdout'], test_case)
+            else:
+                match = output_matches(job['stdout'], test_case, checker)
+            status = Submission.Status.ACCEPTED if match else Submission.Status.WRONG_ANSWER
+        else:
+            match = False
+
+        return {
+            "test_case": index + 1,
+            "output": output,
+            "expected": test_case.expected_preview(),
+            "match": match,
+            "error": error,
+            "status": status,
+            "time": f"{measured['cpu']:.2f}s",
+            "memory": f"{measured['maxrss']}KB"
+        }, measured['cpu'], measured['maxrss']
+
+    def _run_checker(self, launcher, checker, index, input_path, output_path, test_case):
+        """Run the problem's checker program on one case; returns (accepted, message)"""
+        directory = checker['directory']
+        limit = _setting('JUDGE_CHECKER_TIME_LIMIT', 10)
+        job = self._base_job(directory)
+        job.update({
+            'source': checker['path'],
+            'args': [input_path, output_path, test_case.prepare_expected(directory, index)],
+            'stdin': os.devnull,
+            'stdout': os.path.join(directory, f'checker-{index}.out'),
+            'stderr': os.path.join(directory, f'checker-{index}.err'),
+            'cpu': limit,
+            'wall': limit * 2,
+            'memory': _setting('JUDGE_CHECKER_MEMORY_LIMIT', 512) * 1024 * 1024,
+            # Problem setters' code, and it must read expected outputs the sandbox user can't
+            'uid': None,
+            'gid': None,
+        })
+        measured = launcher.run(job)
+        message = (_read_head(job['stdout'], ERROR_PREVIEW_BYTES)
+                   or _read_tail(job['stderr'], ERROR_PREVIEW_BYTES)).strip() or None
+        if measured['exit_code'] in (0, 1) and not measured['signal'] and not measured['timed_out']:
+            return measured['exit_code'] == 0, message
+        logger.error(f"Checker failed - Case: {index + 1}, Exit code: {measured['exit_code']}, Error: {message}")
+        return False, "Checker failed"
+
+    def _classify(self, measured, job, time_limit, memory_limit):
+        """Map launcher measurements onto a failing status, or None if the run was clean"""
+        if measured['timed_out'] or measured['cpu'] > time_limit or measured['signal'] == signal.SIGXCPU:
+            return Submission.Status.TIME_LIMIT_EXCEEDED, None
+
+        stderr = _read_tail(job['stderr'], ERROR_PREVIEW_BYTES)
+        if (measured['oom_killed'] or measured['maxrss'] > memory_limit * 1024
+                or 'MemoryError' in stderr or 'std::bad_alloc' in stderr
+                or 'OutOfMemoryError' in stderr):
+            return Submission.Status.MEMORY_LIMIT_EXCEEDED, None
+
+        if measured['signal'] == signal.SIGXFSZ:
+            return Submission.Status.RUNTIME_ERROR, "Output limit exceeded"
+        if measured['signal']:
+            return Submission.Status.RUNTIME_ERROR, stderr or f"Killed by signal {measured['signal']}"
+        if measured['exit_code']:
+            return Submission.Status.RUNTIME_ERROR, stderr or f"Exited with code {measured['exit_code']}"
+        return None, None
+
+    def _skipped(self, index, test_case):
+        return {
+            "test_case": index + 1,
+            "output": "",
+            "expected": test_case.expected_preview(),
+            "match": False,
+            "error": "Not run: an earlier test case failed",
+            "status": Submission.Status.PENDING,
+            "time": "0.00s",
+            "memory": "0KB"
+        }
+
+    def _failed(self, test_cases, status, error):
+        results = [{
+            "test_case": index + 1,
+            "output": "",
+            "expected": test_case.expected_preview(),
+            "match": False,
+            "error": error,
+            "status": status,
+            "time": "0.00s",
+            "memory": "0KB"
+        } for index, test_case in enumerate(test_cases)]
+        if not results:
+            results.append({
+                "test_case": 0,
+                "output": "",
+                "expected": None,
+                "match": False,
+                "error": error,
+                "status": status,
+                "time": "0.00s",
+                "memory": "0KB"
+            })
+        return Verdict(results)
+
+
+def run_submission(source_code, language, test_cases, time_limit=1.0, memory_limit=128, run_all=False,
+                   checker=None):
+    """Judge source code against test cases using the shared sandbox pool"""
+    return Judge().run(source_code, language, test_cases, time_limit, memory_limit, run_all=run_all,
+                       checker=checker)
@@ -0,0 +1,278 @@
+"""
+Live session leaderboards kept in Redis.
+
+While a session is active its standings live in a sorted set keyed by
+profile id, scored by ``problems_solved * TIME_SCALE - total_time`` so that a
+single ZREVRANGE yields the ranking, plus a hash with the display fields of
+each row. Ended sessions are served from the database.
+
+Every change bumps a per-session version and is broadcast as a
+``leaderboard_delta`` event holding only the rows whose rank or score
+changed. Clients that see a version gap re-fetch ``/leaderboard/``, which
+reports the snapshot version in the ``X-Leaderboard-Version`` header.
+"""
+import json
+import logging
+
+from redis.exceptions import RedisError
+
+from .models import GameParticipation
+from .redis_client import get_redis
+from .websocket_utils import WebSocketManager
+
+logger = logging.getLogger(__name__)
+
+ROWS_CHUNK = 1000
+
+# HMGET in chunks, unpack() of a whole large session overflows the Lua stack
+ROWS_FUNCTION = f"""
+local function get_rows(key, members)
+    local rows = {{}}
+    for i = 1, #members, {ROWS_CHUNK} do
+        local chunk = redis.call('HMGET', key, unpack(members, i, math.min(i + {ROWS_CHUNK - 1}, #members)))
+        for j = 1, #chunk do
+            rows[#rows + 1] = chunk[j]
+        end
+    end
+    return rows
+end
+"""
+
+# Moves one member and returns the version plus every row whose rank changed,
+# or nil when the leaderboard has to be rebuilt from the database first.
+# KEYS: rank set, rows hash, version; ARGV: member, score, row, ttl
+UPDATE_SCRIPT = ROWS_FUNCTION + """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return false
+end
+local old = redis.call('ZREVRANK', KEYS[1], ARGV[1])
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+local new = redis.call('ZREVRANK', KEYS[1], ARGV[1])
+local version = redis.call('INCR', KEYS[3])
+for i = 1, 3 do redis.call('EXPIRE', KEYS[i], ARGV[4]) end
+local first, last = new, new
+if not old then
+    last = redis.call('ZCARD', KEYS[1]) - 1
+elseif old < new then
+    first, last = old, new
+else
+    last = old
+end
+local members = redis.call('ZREVRANGE', KEYS[1], first, last)
+return {version, first, get_rows(KEYS[2], members)}
+"""
+
+# Removes one member and returns the version plus the rows that moved up.
+# KEYS: rank set, rows hash, version; ARGV: member
+REMOVE_SCRIPT = ROWS_FUNCTION + """
+local old = redis.call('ZREVRANK', KEYS[1], ARGV[1])
+if not old then
+    return {redis.call('INCR', KEYS[3]), 0, {}}
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[1])
+local version = redis.call('INCR', KEYS[3])
+local members = redis.call('ZREVRANGE', KEYS[1], old, -1)
+return {version, old, get_rows(KEYS[2], members)}
+"""
+
+
+class LiveLeaderboard:
+    """Redis sorted-set leaderboard for active sessions"""
+
+    # total_time is in seconds and always far below this
+    TIME_SCALE = 10 ** 8
+    TTL = 24 * 60 * 60
+
+    @staticmethod
+    def get_keys(session_id):
+        return f"leaderboard:{session_id}", f"leaderboard:{session_id}:rows"
+
+    @staticmethod
+    def get_version_key(session_id):
+        return f"leaderboard:{session_id}:version"
+
+    @staticmethod
+    def composite_score(problems_solved, total_time):
+        return problems_solved * LiveLeaderboard.TIME_SCALE - total_time
+
+    @staticmethod
+    def to_row(participation):
+        return {
+            'profile_id': participation.profile.id,
+            'username': participation.profile.display_name,
+            'problems_solved': participation.problems_solved,
+            'total_time': participation.total_time,
+            'score': participation.score
+        }
+
+    @staticmethod
+    def update(session_id, participations):
+        """Write the current standings of the given participations"""
+        participations = list(participations)
+        if not participations:
+            return
+        rank_key, rows_key = LiveLeaderboard.get_keys(session_id)
+        scores = {}
+        rows = {}
+        for participation in participations:
+            scores[participation.profile.id] = LiveLeaderboard.composite_score(
+                participation.problems_solved, participation.total_time
+            )
+            rows[participation.profile.id] = json.dumps(LiveLeaderboard.to_row(participation))
+
+        version_key = LiveLeaderboard.get_version_key(session_id)
+        pipe = get_redis().pipeline(transaction=True)
+        pipe.zadd(rank_key, scores)
+        pipe.hset(rows_key, mapping=rows)
+        pipe.incr(version_key)
+        for key in (rank_key, rows_key, version_key):
+            pipe.expire(key, LiveLeaderboard.TTL)
+        pipe.execute()
+
+    @staticmethod
+    def move(session_id, participation):
+        """Update one participation; returns (version, changed rows with ranks) or None"""
+        rank_key, rows_key = LiveLeaderboard.get_keys(session_id)
+        result = get_redis().eval(
+            UPDATE_SCRIPT, 3, rank_key, rows_key, LiveLeaderboard.get_version_key(session_id),
+            participation.profile.id,
+            LiveLeaderboard.composite_score(participation.problems_solved, participation.total_time),
+            json.dumps(LiveLeaderboard.to_row(participation)),
+            LiveLeaderboard.TTL
+        )
+        if result is None:
+            return None
+        version, first, rows = result
+        return version, LiveLeaderboard._ranked(first, rows)
+
+    @staticmethod
+    def remove(session_id, profile_id):
+        """Drop a profile; returns (version, rows that moved up)"""
+        rank_key, rows_key = LiveLeaderboard.get_keys(session_id)
+        version, first, rows = get_redis().eval(
+            REMOVE_SCRIPT, 3, rank_key, rows_key, LiveLeaderboard.get_version_key(session_id),
+            profile_id
+        )
+        return version, LiveLeaderboard._ranked(first, rows)
+
+    @staticmethod
+    def _ranked(first, rows):
+        ranked = []
+        for offset, row in enumerate(rows):
+            if row is None:
+                continue
+            row = json.loads(row)
+            row['rank'] = first + offset + 1
+            ranked.append(row)
+        return ranked
+
+    @staticmethod
+    def get_version(session_id):
+        version = get_redis().get(LiveLeaderboard.get_version_key(session_id))
+        return int(version) if version is not None else None
+
+    @staticmethod
+    def read(session_id, limit=None):
+        """Return the top rows, or None if the leaderboard isn't in Redis"""
+        rank_key, rows_key = LiveLeaderboard.get_keys(session_id)
+        redis = get_redis()
+        profile_ids = redis.zrevrange(rank_key, 0, (limit or 0) - 1)
+        if not profile_ids:
+            return None if not redis.exists(rank_key) else []
+        return [json.loads(row) for row in redis.hmget(rows_key, profile_ids) if row is not None]
+
+
+def format_row(row):
+    minutes, seconds = divmod(row['total_time'], 60)
+    row['formatted_time'] = f"{minutes:02d}:{seconds:02d}"
+    return row
+
+
+def get_participations(session):
+    return GameParticipation.objects.filter(
+        game_session=session
+    ).select_related('profile').order_by('-problems_solved', 'total_time')
+
+
+def get_leaderboard_data(session, limit=None):
+    """Leaderboard rows for a session, from Redis while it's live"""
+    if session.is_active and session.start_time:
+        try:
+            rows = LiveLeaderboard.read(session.id, limit)
+            if rows is None:
+                participations = list(get_participations(session))
+                LiveLeaderboard.update(session.id, participations)
+                rows = [LiveLeaderboard.to_row(p) for p in participations[:limit]]
+            return [format_row(row) for row in rows]
+        except RedisError as e:
+            logger.error(f"Error reading live leaderboard - Session: {session.id}, Error: {str(e)}")
+
+    participations = get_participations(session)
+    if limit:
+        participations = participations[:limit]
+    return [format_row(LiveLeaderboard.to_row(p)) for p in participations]
+
+
+def publish_delta(session_id, version, rows, removed=None):
+    data = {
+        'type': 'leaderboard_delta',
+        'version': version,
+        'rows': [format_row(row) for row in rows]
+    }
+    if removed is not None:
+        data['removed'] = removed
+    WebSocketManager.notify_session_update(str(session_id), 'leaderboard_delta', data)
+
+
+def record_standing(participation):
+    """Push a participation's new standing to the live leaderboard"""
+    session_id = participation.game_session_id
+    try:
+        moved = LiveLeaderboard.move(session_id, participation)
+        if moved is None:
+            # Expired or never seeded: rebuild and send every row once
+            participations = list(get_participations(participation.game_session))
+            LiveLeaderboard.update(session_id, participations)
+            moved = LiveLeaderboard.get_version(session_id), [
+                dict(LiveLeaderboard.to_row(p), rank=rank)
+                for rank, p in enumerate(participations, 1)
+            ]
+    except RedisError as e:
+        # The next read rebuilds the leaderboard from the database
+        logger.error(f"Error updating live leaderboard - Session: {session_id}, Error: {str(e)}")
+        try:
+            get_redis().delete(*LiveLeaderboard.get_keys(session_id))
+        except RedisError:
+            pass
+        return
+    publish_delta(session_id, *moved)
+
+
+def remove_standing(session_id, profile_id):
+    try:
+        version, rows = LiveLeaderboard.remove(session_id, profile_id)
+    except RedisError as e:
+        logger.error(f"Error updating live leaderboard - Session: {session_id}, Error: {str(e)}")
+        return
+    publish_delta(session_id, version, rows, removed=[profile_id])
+
+
+def reset_leaderboard(session):
+    """Seed the live leaderboard from the database when a session starts"""
+    try:
+        get_redis().delete(*LiveLeaderboard.get_keys(session.id))
+        LiveLeaderboard.update(session.id, get_participations(session))
+    except RedisError as e:
+        logger.error(f"Error seeding live leaderboard - Session: {session.id}, Error: {str(e)}")
+
+
+def get_leaderboard_version(session):
+    """Version of the live leaderboard, read before a snapshot is built"""
+    if not (session.is_active and session.start_time):
+        return None
+    try:
+        return LiveLeaderboard.get_version(session.id)
+    except RedisError:
+        return None
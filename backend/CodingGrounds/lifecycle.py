@@ -0,0 +1,154 @@
+"""
+Session lifecycle: ending sessions when they are solved or run out of time.
+
+``GameSession.save`` registers a timer for every running session (see
+``timers.py``). ``manage.py run_session_timers`` runs
+``SessionTimerService``, an asyncio loop that ends each session once its
+``end_time`` passes. Ending a session means ranking and rating the
+participants and sending the ``end`` WebSocket event.
+
+Each session ends exactly once. The service first claims the timer in Redis,
+then locks the session row, and flipping ``is_active`` commits in the same
+transaction as the final ranks and ratings. A failure anywhere rolls the
+session back to active, so the retried timer ends it again. Redis and
+WebSocket side effects are sent only once that transaction commits. At
+startup the service re-registers every active session, plus any ended
+session left without final ranks, in bulk. Sessions that expired while
+nothing was running are therefore ended straight away, including any whose
+timer was claimed by a service that crashed.
+"""
+import asyncio
+import logging
+import time
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from .leaderboard import get_leaderboard_data
+from .models import GameParticipation, GameSession
+from .rankings import publish_ratings
+from .timers import SessionTimers
+from .websocket_utils import WebSocketManager
+
+logger = logging.getLogger(__name__)
+
+
+def close_session(session, detail, winner=None):
+    """
+    Rank and rate a session that the current transaction just marked
+    inactive, and announce the end once it commits. The winner defaults to
+    the leader, if they solved anything.
+    """
+    profiles = session.rank_participants()
+
+    def announce():
+        SessionTimers.cancel(session.id)
+        publish_ratings(profiles)
+        leaderboard = get_leaderboard_data(session)
+        WebSocketManager.notify_session_update(
+            str(session.id),
+            'end',
+            {
+                'type': 'session_end',
+                'detail': detail,
+                'winner': winner if winner is not None else _get_leader(leaderboard),
+                'leaderboard': leaderboard
+            }
+        )
+
+    transaction.on_commit(announce)
+
+
+def _get_leader(leaderboard):
+    return leaderboard[0]['username'] if leaderboard and leaderboard[0]['problems_solved'] else None
+
+
+def _unranked():
+    return Exists(GameParticipation.objects.filter(game_session=OuterRef('pk'), final_rank__isnull=True))
+
+
+def expire_session(session_id):
+    """
+    End a session whose time is up, or finish ranking one that ended without
+    final ranks. Returns False if it was still running or already over.
+    """
+    with transaction.atomic():
+        session = GameSession.objects.select_for_update().filter(pk=session_id).first()
+        if session is None:
+            return False
+        if session.is_active:
+            if session.end_time is None or session.end_time > timezone.now():
+                # The end time may have moved since the timer was set
+                if session.end_time is not None:
+                    end_time = session.end_time
+                    transaction.on_commit(lambda: SessionTimers.schedule(session_id, end_time))
+                return False
+            GameSession.objects.filter(pk=session_id).update(is_active=False)
+            session.is_active = False
+        elif not GameSession.objects.filter(pk=session_id).filter(_unranked()).exists():
+            return False
+        close_session(session, "Session has ended - time is up!")
+    return True
+
+
+def sweep_sessions():
+    """
+    Register a timer for every active session and every ended but unranked
+    one. Expired and unranked sessions fall due at once.
+    """
+    end_times = dict(
+        GameSession.objects.filter(end_time__isnull=False).filter(
+            Q(is_active=True) | Q(_unranked(), is_active=False)
+        ).values_list('id', 'end_time')
+    )
+    if end_times:
+        SessionTimers.schedule_many(end_times)
+    now = timezone.now()
+    return len(end_times), sum(1 for end_time in end_times.values() if end_time <= now)
+
+
+class SessionTimerService:
+    """Ends sessions as their timers fall due"""
+
+    def __init__(self, poll_interval=None, batch_size=None):
+        self.poll_interval = poll_interval or getattr(settings, 'SESSION_TIMER_POLL_INTERVAL', 1)
+        self.batch_size = batch_size or getattr(settings, 'SESSION_TIMER_BATCH', 100)
+
+    async def run(self, stop_event=None):
+        stop_event = stop_event or asyncio.Event()
+        scheduled, expired = await database_sync_to_async(sweep_sessions)()
+        logger.info(f"Session timer service started - Active: {scheduled}, Expired: {expired}")
+
+        while not stop_event.is_set():
+            try:
+                delay = await self.tick()
+            except RedisError as e:
+                logger.error(f"Error reading session timers: {str(e)}")
+                delay = self.poll_interval
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def tick(self):
+        """End every due session, returns how long to sleep until the next check"""
+        now = time.time()
+        due, upcoming = await SessionTimers.due(now, self.batch_size)
+        for session_id in due:
+            if not await SessionTimers.claim(session_id):
+                continue
+            try:
+                await database_sync_to_async(expire_session)(session_id)
+            except Exception as e:
+                logger.exception(f"Error ending session - Session: {session_id}, Error: {str(e)}")
+                await SessionTimers.retry(session_id, now + self.poll_interval)
+
+        if len(due) == self.batch_size:
+            return 0
+        if upcoming is None:
+            return self.poll_interval
+        return max(0, min(upcoming - time.time(), self.poll_interval))
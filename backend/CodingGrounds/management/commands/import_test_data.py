@@ -0,0 +1,78 @@
+import os
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+
+from CodingGrounds.models import CodingProblem
+from CodingGrounds.testdata import get_test_data_store
+
+
+def _natural_key(name):
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+
+class Command(BaseCommand):
+    help = "Move problem test cases into the test data store"
+
+    def add_arguments(self, parser):
+        parser.add_argument('problem_ids', nargs='*', type=int, help="Problems to import (defaults to all)")
+        parser.add_argument(
+            '--dir',
+            help="Directory of NAME.in / NAME.out pairs to use as the test data of a single problem"
+        )
+        parser.add_argument(
+            '--samples',
+            type=int,
+            default=3,
+            help="Inline test cases kept on the problem as samples for players"
+        )
+
+    def handle(self, *args, **options):
+        store = get_test_data_store()
+        if options['dir']:
+            if len(options['problem_ids']) != 1:
+                raise CommandError("--dir needs exactly one problem id")
+            problem = CodingProblem.objects.get(pk=options['problem_ids'][0])
+            manifest = self._import_dir(store, options['dir'])
+            problem.test_data = manifest
+            problem.save(update_fields=['test_data'])
+            self.stdout.write(f"{problem.title}: {manifest}")
+            return
+
+        problems = CodingProblem.objects.filter(test_data='')
+        if options['problem_ids']:
+            problems = problems.filter(pk__in=options['problem_ids'])
+        # One problem at a time, so only one set of test cases is in memory
+        for problem_id in problems.values_list('id', flat=True):
+            problem = CodingProblem.objects.get(pk=problem_id)
+            if not problem.test_cases:
+                continue
+            problem.test_data = store.put_inline_cases(problem.test_cases)
+            problem.test_cases = problem.test_cases[:options['samples']]
+            problem.save(update_fields=['test_data', 'test_cases'])
+            self.stdout.write(f"{problem.title}: {problem.test_data}")
+
+    def _import_dir(self, store, directory):
+        names = sorted(
+            (name[:-3] for name in os.listdir(directory) if name.endswith('.in')),
+            key=_natural_key
+        )
+        if not names:
+            raise CommandError(f"No .in files in {directory}")
+        cases = []
+        for name in names:
+            output_path = os.path.join(directory, f'{name}.out')
+            if not os.path.exists(output_path):
+                raise CommandError(f"Missing {name}.out")
+            with open(os.path.join(directory, f'{name}.in'), 'rb') as f:
+                input_digest, input_size = store.put_stream(f)
+            with open(output_path, 'rb') as f:
+                output_digest, output_size = store.put_stream(f)
+            cases.append({
+                'input': input_digest,
+                'input_size': input_size,
+                'output': output_digest,
+                'output_size': output_size,
+                'format': 'text'
+            })
+        return store.put_manifest(cases)
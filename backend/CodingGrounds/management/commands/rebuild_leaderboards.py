@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from CodingGrounds.global_leaderboard import rebuild_boards
+
+
+class Command(BaseCommand):
+    help = "Recompute the global, weekly and per-tag leaderboards from accepted submissions"
+
+    def handle(self, *args, **options):
+        boards = rebuild_boards()
+        self.stdout.write(f"Rebuilt {boards} leaderboards")
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import Rank
+
+from CodingGrounds.models import CodingProfile
+from CodingGrounds.rankings import rebuild_ratings_index
+
+
+class Command(BaseCommand):
+    help = "Recompute every profile's global rank and reload the Redis rating index"
+
+    def handle(self, *args, **options):
+        ranked = CodingProfile.objects.annotate(
+            new_rank=Window(expression=Rank(), order_by=F('rating').desc())
+        ).values_list('id', 'rank', 'new_rank')
+
+        with transaction.atomic():
+            # Sessions ending meanwhile renumber before or after this pass, never during
+            CodingProfile.lock_ranks()
+            changed = [
+                CodingProfile(id=profile_id, rank=new_rank)
+                for profile_id, rank, new_rank in ranked.iterator(chunk_size=1000)
+                if rank != new_rank
+            ]
+            CodingProfile.objects.bulk_update(changed, ['rank'], batch_size=1000)
+        self.stdout.write(f"Updated {len(changed)} ranks")
+
+        rebuild_ratings_index()
+        self.stdout.write("Rebuilt rating index")
@@ -0,0 +1,55 @@
+from itertools import groupby
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from CodingGrounds import ratings
+from CodingGrounds.models import CodingProfile, GameParticipation
+
+
+class Command(BaseCommand):
+    help = "Recompute every rating by replaying all finished sessions in order"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--system',
+            choices=['elo', 'glicko2'],
+            default=None,
+            help="Rating system to replay with (defaults to RATING_SYSTEM)"
+        )
+
+    def handle(self, *args, **options):
+        profiles = {
+            profile.id: profile
+            for profile in CodingProfile.objects.only('id', 'rating', 'rating_deviation', 'rating_volatility')
+        }
+        for profile in profiles.values():
+            profile.rating = ratings.DEFAULT_RATING
+            profile.rating_deviation = ratings.DEFAULT_DEVIATION
+            profile.rating_volatility = ratings.DEFAULT_VOLATILITY
+
+        participations = GameParticipation.objects.filter(
+            final_rank__isnull=False
+        ).only(
+            'game_session_id', 'profile_id', 'problems_solved', 'total_time'
+        ).order_by('game_session__end_time', 'game_session_id', 'final_rank')
+
+        sessions = 0
+        for _, group in groupby(participations.iterator(), key=lambda p: p.game_session_id):
+            group = list(group)
+            ratings.rate(
+                [profiles[p.profile_id] for p in group],
+                ratings.standing_ranks(group),
+                system=options['system']
+            )
+            sessions += 1
+
+        with transaction.atomic():
+            CodingProfile.objects.bulk_update(
+                profiles.values(),
+                ['rating', 'rating_deviation', 'rating_volatility'],
+                batch_size=1000
+            )
+        self.stdout.write(f"Replayed {sessions} sessions for {len(profiles)} profiles")
+        call_command('rebuild_ranks', stdout=self.stdout)
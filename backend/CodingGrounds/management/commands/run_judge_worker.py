@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from CodingGrounds.judge import get_pool
+from CodingGrounds.pipeline import run_worker
+
+
+class Command(BaseCommand):
+    help = "Judge queued submissions and publish their verdicts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=None,
+            help="Submissions judged in parallel (defaults to JUDGE_MAX_WORKERS)"
+        )
+
+    def handle(self, *args, **options):
+        get_pool().warm_up()
+        self.stdout.write("Judge worker running, press Ctrl+C to stop")
+        try:
+            run_worker(concurrency=options['concurrency'])
+        except KeyboardInterrupt:
+            self.stdout.write("Judge worker stopped")
@@ -0,0 +1,24 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from CodingGrounds.lifecycle import SessionTimerService
+
+
+class Command(BaseCommand):
+    help = "End game sessions when their time runs out"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=None,
+            help="Seconds between checks for due sessions (defaults to SESSION_TIMER_POLL_INTERVAL)"
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Session timer service running, press Ctrl+C to stop")
+        try:
+            asyncio.run(SessionTimerService(poll_interval=options['poll_interval']).run())
+        except KeyboardInterrupt:
+            self.stdout.write("Session timer service stopped")
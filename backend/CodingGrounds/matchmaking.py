@@ -0,0 +1,309 @@
+"""
+Skill-based matchmaking.
+
+Players queue over their user WebSocket (``ws/user/``) with a preferred
+difficulty. Waiting players are kept in Redis, so every web process shares
+one queue:
+
+- ``matchmaking:tickets``, a hash of tickets by profile id
+- ``matchmaking:queue``, profile ids by enqueue time
+- ``matchmaking:band:{difficulty}:{band}``, one sorted set per rating band
+  of ``MATCHMAKING_BAND_WIDTH`` points and difficulty, by enqueue time
+- ``matchmaking:due``, profile ids by the next time their search range
+  grows, i.e. when they have to be looked at again
+
+A player searches ``MATCHMAKING_BAND_WIDTH`` rating points either way to
+begin with. The range widens by one band every ``MATCHMAKING_WIDEN_INTERVAL``
+seconds of waiting, up to ``MATCHMAKING_MAX_BANDS`` bands, and two players
+may meet once either one's range covers the other.
+
+Every ``MATCHMAKING_TICK`` seconds each process with a running matcher takes
+the tickets that are due (new ones, and ones whose range just widened), the
+longest waiting first, and looks for opponents in the oldest tickets of the
+bands around each. No tick reads the whole queue: every step is a sorted set
+range of bounded size. A batch is claimed with one Lua script that removes
+its tickets only if none of them changed, so two processes never start a
+match with the same player. Tickets older than ``MATCHMAKING_TICKET_TTL``
+(e.g. left behind by a crashed process) are dropped and the player is told.
+
+A full batch of ``MATCHMAKING_SESSION_SIZE`` players becomes a started
+``GameSession`` whose participations are created in one bulk insert. Every
+player then gets a ``match_found`` event on their user group.
+"""
+import asyncio
+import json
+import logging
+import time
+import weakref
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from .leaderboard import reset_leaderboard
+from .membership import SessionMembership
+from .models import CodingProblem, GameParticipation, GameSession
+from .problem_picker import pick_problems
+from .redis_client import get_async_redis
+from .websocket_utils import WebSocketManager
+
+logger = logging.getLogger(__name__)
+
+QUEUE_KEY = 'matchmaking:queue'
+TICKETS_KEY = 'matchmaking:tickets'
+DUE_KEY = 'matchmaking:due'
+BAND_KEY = 'matchmaking:band:{}:{}'
+BAND_SCAN = 50  # oldest tickets of a band considered as opponents per anchor
+ANCHORS_PER_TICK = 1000  # due tickets looked at per tick, the rest wait for the next one
+
+# Removes a batch only if every ticket is still exactly the one that was matched.
+# KEYS: queue, tickets, due, band of each ticket; ARGV: profile id, ticket json, ...
+CLAIM_SCRIPT = """
+for i = 1, #ARGV, 2 do
+    if redis.call('HGET', KEYS[2], ARGV[i]) ~= ARGV[i + 1] then
+        return 0
+    end
+end
+for i = 1, #ARGV, 2 do
+    redis.call('ZREM', KEYS[1], ARGV[i])
+    redis.call('HDEL', KEYS[2], ARGV[i])
+    redis.call('ZREM', KEYS[3], ARGV[i])
+    redis.call('ZREM', KEYS[3 + (i + 1) / 2], ARGV[i])
+end
+return 1
+"""
+
+
+class Ticket:
+    """A player waiting for a match"""
+    __slots__ = ('profile_id', 'user_id', 'rating', 'difficulty', 'band', 'enqueued_at', 'raw')
+
+    def __init__(self, profile_id, user_id, rating, difficulty, band_width, enqueued_at=None):
+        self.profile_id = profile_id
+        self.user_id = user_id
+        self.rating = rating
+        self.difficulty = difficulty
+        self.band = rating // band_width
+        # Wall clock, tickets are compared across hosts
+        self.enqueued_at = enqueued_at if enqueued_at is not None else time.time()
+        self.raw = json.dumps([profile_id, user_id, rating, difficulty, self.enqueued_at])
+
+    @property
+    def band_key(self):
+        return BAND_KEY.format(self.difficulty, self.band)
+
+    @classmethod
+    def from_raw(cls, raw, band_width):
+        profile_id, user_id, rating, difficulty, enqueued_at = json.loads(raw)
+        ticket = cls(profile_id, user_id, rating, difficulty, band_width, enqueued_at)
+        # Claims compare the stored bytes, not a re-encoding
+        ticket.raw = raw.decode() if isinstance(raw, bytes) else raw
+        return ticket
+
+
+class MatchmakingQueue:
+    """Waiting players shared through Redis, matched by difficulty and rating band"""
+
+    def __init__(self, session_size=None, band_width=None, widen_interval=None, max_bands=None, tick=None,
+                 ticket_ttl=None):
+        self.session_size = session_size or getattr(settings, 'MATCHMAKING_SESSION_SIZE', 2)
+        self.band_width = band_width or getattr(settings, 'MATCHMAKING_BAND_WIDTH', 100)
+        self.widen_interval = widen_interval or getattr(settings, 'MATCHMAKING_WIDEN_INTERVAL', 10)
+        self.max_bands = max_bands or getattr(settings, 'MATCHMAKING_MAX_BANDS', 5)
+        self.tick = tick or getattr(settings, 'MATCHMAKING_TICK', 1)
+        self.ticket_ttl = ticket_ttl or getattr(settings, 'MATCHMAKING_TICKET_TTL', 15 * 60)
+        self._task = None
+
+    async def count(self):
+        return await get_async_redis().zcard(QUEUE_KEY)
+
+    async def add(self, profile_id, user_id, rating, difficulty):
+        # Queueing again replaces the old ticket, which may sit in another band
+        await self.remove(profile_id)
+        ticket = Ticket(profile_id, user_id, rating, difficulty, self.band_width)
+        pipe = get_async_redis().pipeline(transaction=True)
+        pipe.hset(TICKETS_KEY, profile_id, ticket.raw)
+        pipe.zadd(QUEUE_KEY, {profile_id: ticket.enqueued_at})
+        pipe.zadd(ticket.band_key, {profile_id: ticket.enqueued_at})
+        pipe.zadd(DUE_KEY, {profile_id: ticket.enqueued_at})
+        await pipe.execute()
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return ticket
+
+    async def remove(self, profile_id):
+        while True:
+            ticket = await self.get_ticket(profile_id)
+            # Retried if the player queued again in between
+            if ticket is None or await self.claim([ticket]):
+                return ticket
+
+    async def requeue(self, batch):
+        """Put tickets back, keeping the time they already waited, unless the player queued again"""
+        redis = get_async_redis()
+        pipe = redis.pipeline(transaction=True)
+        for ticket in batch:
+            pipe.hsetnx(TICKETS_KEY, ticket.profile_id, ticket.raw)
+        restored = await pipe.execute()
+        pipe = redis.pipeline(transaction=True)
+        for ticket, added in zip(batch, restored):
+            if added:
+                pipe.zadd(QUEUE_KEY, {ticket.profile_id: ticket.enqueued_at})
+                pipe.zadd(ticket.band_key, {ticket.profile_id: ticket.enqueued_at})
+                pipe.zadd(DUE_KEY, {ticket.profile_id: time.time()})
+        await pipe.execute()
+
+    async def get_ticket(self, profile_id):
+        raw = await get_async_redis().hget(TICKETS_KEY, profile_id)
+        return Ticket.from_raw(raw, self.band_width) if raw is not None else None
+
+    async def get_tickets(self, profile_ids):
+        """Tickets of the given profiles that are still waiting, in the same order"""
+        if not profile_ids:
+            return []
+        raws = await get_async_redis().hmget(TICKETS_KEY, profile_ids)
+        return [Ticket.from_raw(raw, self.band_width) for raw in raws if raw is not None]
+
+    async def claim(self, batch):
+        args = []
+        for ticket in batch:
+            args += [ticket.profile_id, ticket.raw]
+        keys = [QUEUE_KEY, TICKETS_KEY, DUE_KEY] + [ticket.band_key for ticket in batch]
+        return await get_async_redis().eval(CLAIM_SCRIPT, len(keys), *keys, *args) == 1
+
+    def get_bands(self, ticket, now):
+        """Bands either way a ticket searches after waiting"""
+        return min(1 + int((now - ticket.enqueued_at) // self.widen_interval), self.max_bands)
+
+    def get_reach(self, ticket, now):
+        """Rating points a ticket may be matched across after waiting"""
+        return self.get_bands(ticket, now) * self.band_width
+
+    async def find_opponents(self, anchor, now, taken=()):
+        """The longest waiting opponents for anchor, or None if there aren't enough"""
+        # Anyone within the widest range could have waited long enough to reach the anchor
+        bands = range(anchor.band - self.max_bands, anchor.band + self.max_bands + 1)
+        pipe = get_async_redis().pipeline(transaction=False)
+        for band in bands:
+            pipe.zrange(BAND_KEY.format(anchor.difficulty, band), 0, BAND_SCAN - 1)
+        profile_ids = [
+            int(profile_id) for members in await pipe.execute() for profile_id in members
+            if int(profile_id) != anchor.profile_id and int(profile_id) not in taken
+        ]
+        reach = self.get_reach(anchor, now)
+        candidates = [
+            ticket for ticket in await self.get_tickets(profile_ids)
+            if abs(ticket.rating - anchor.rating) <= max(reach, self.get_reach(ticket, now))
+        ]
+        needed = self.session_size - 1
+        if len(candidates) < needed:
+            return None
+        candidates.sort(key=lambda ticket: ticket.enqueued_at)
+        # The longest waiting player leads the batch
+        return sorted([anchor] + candidates[:needed], key=lambda ticket: ticket.enqueued_at)
+
+    async def expire(self, now):
+        """Drop tickets that waited longer than the TTL and tell their players"""
+        redis = get_async_redis()
+        profile_ids = await redis.zrangebyscore(QUEUE_KEY, '-inf', now - self.ticket_ttl, start=0, num=ANCHORS_PER_TICK)
+        for ticket in await self.get_tickets(profile_ids):
+            if await self.claim([ticket]):
+                WebSocketManager.notify_user(ticket.user_id, 'matchmaking_expired', {'type': 'matchmaking_expired'})
+
+    async def match(self, now=None):
+        """Claim every batch that can be formed now; returns the claimed batches"""
+        now = now if now is not None else time.time()
+        await self.expire(now)
+        redis = get_async_redis()
+        due = await redis.zrangebyscore(DUE_KEY, '-inf', now, start=0, num=ANCHORS_PER_TICK)
+        anchors = sorted(await self.get_tickets(due), key=lambda ticket: ticket.enqueued_at)
+        claimed, taken, next_due = [], set(), {}
+        for anchor in anchors:
+            if anchor.profile_id in taken:
+                continue
+            batch = await self.find_opponents(anchor, now, taken)
+            # Another process may have matched one of these players already
+            if batch is not None and await self.claim(batch):
+                claimed.append(batch)
+                taken.update(ticket.profile_id for ticket in batch)
+            elif batch is None:
+                bands = self.get_bands(anchor, now)
+                # Look again once the range widens; at full width only newcomers can match it
+                next_due[anchor.profile_id] = (
+                    anchor.enqueued_at + bands * self.widen_interval if bands < self.max_bands else float('inf')
+                )
+        if next_due:
+            await redis.zadd(DUE_KEY, next_due, xx=True)
+        return claimed
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                if not await self.count():
+                    return
+                batches = await self.match()
+            except RedisError as e:
+                logger.error(f"Error matching players: {str(e)}")
+                continue
+            for batch in batches:
+                try:
+                    await start_match(batch)
+                except Exception as e:
+                    logger.exception(f"Error starting match - Profiles: {[t.profile_id for t in batch]}, Error: {str(e)}")
+                    try:
+                        await self.requeue(batch)
+                    except RedisError as e:
+                        logger.error(f"Error requeueing players - Profiles: {[t.profile_id for t in batch]}, Error: {str(e)}")
+
+
+@database_sync_to_async
+def start_match(batch):
+    """Create and start a session for a batch of tickets and tell the players"""
+    profile_ids = [ticket.profile_id for ticket in batch]
+    problem_ids = pick_problems(profile_ids, [batch[0].difficulty]) or pick_problems(profile_ids)
+    if not problem_ids:
+        raise CodingProblem.DoesNotExist("No problems available")
+    problem = CodingProblem.objects.get(pk=problem_ids[0])
+
+    with transaction.atomic():
+        session = GameSession.objects.create(
+            title=f"Ranked match - {problem.get_difficulty_display()}",
+            created_by_id=batch[0].profile_id,
+            max_participants=len(batch),
+            is_private=True,
+            start_time=timezone.now()
+        )
+        session.problems.add(problem)
+        GameParticipation.objects.bulk_create([
+            GameParticipation(game_session=session, profile_id=ticket.profile_id, is_ready=True)
+            for ticket in batch
+        ])
+    # bulk_create sends no post_save, so the membership signals don't see these rows
+    SessionMembership.add(session.id, [ticket.user_id for ticket in batch])
+    reset_leaderboard(session)
+
+    for ticket in batch:
+        WebSocketManager.notify_user(ticket.user_id, 'match_found', {
+            'type': 'match_found',
+            'session_id': str(session.id),
+            'problem': {'id': problem.id, 'title': problem.title, 'difficulty': problem.difficulty},
+            'start_time': session.start_time.isoformat(),
+            'opponents': [t.profile_id for t in batch if t is not ticket]
+        })
+    logger.info(f"Match started - Session: {session.id}, Profiles: {[t.profile_id for t in batch]}")
+    return session
+
+
+_queues = weakref.WeakKeyDictionary()
+
+
+def get_matchmaking_queue():
+    """Return the matchmaking queue of the running event loop"""
+    loop = asyncio.get_running_loop()
+    queue = _queues.get(loop)
+    if queue is None:
+        queue = _queues[loop] = MatchmakingQueue()
+    return queue
@@ -0,0 +1,132 @@
+"""
+Session membership cache for WebSocket authorization.
+
+Each session keeps a Redis set of its participants' user ids (the WebSocket
+scope carries the user, not the profile). ``SessionConsumer.connect``
+authorizes with a single SMISMEMBER on the event loop instead of three
+queries on the database thread. The set also holds a sentinel once it has
+been filled from the database, so a missing member in a complete set is a
+definite no while an incomplete set falls back to the database once.
+
+The set follows ``GameParticipation`` through signals (see signals.py):
+joins add to it and leaves drop it. Both bump a version key, and a fill
+only marks the set complete if the version is still the one read before
+the database query, so a fill racing a join or leave can't cache a stale
+member list.
+
+Connect outcomes and latencies are counted in the ``metrics:ws_connect``
+hash (``HGETALL metrics:ws_connect``).
+"""
+import logging
+
+from redis.exceptions import RedisError
+
+from .redis_client import get_async_redis, get_redis
+
+logger = logging.getLogger(__name__)
+
+COMPLETE = '-'
+TTL = 24 * 60 * 60
+CONNECT_STATS_KEY = 'metrics:ws_connect'
+LATENCY_BUCKETS_MS = (1, 5, 25, 100)
+FILL_CHUNK = 1000
+
+# KEYS: members, version; ARGV: version read before loading, ttl, member ids...
+FILL_SCRIPT = f"""
+if tonumber(redis.call('GET', KEYS[2]) or '0') ~= tonumber(ARGV[1]) then
+    return 0
+end
+for i = 3, #ARGV, {FILL_CHUNK} do
+    redis.call('SADD', KEYS[1], unpack(ARGV, i, math.min(i + {FILL_CHUNK - 1}, #ARGV)))
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+
+class SessionMembership:
+    """Redis set of the user ids allowed to connect to a session"""
+
+    @staticmethod
+    def get_key(session_id):
+        return f"session:{session_id}:members"
+
+    @staticmethod
+    def get_version_key(session_id):
+        return f"session:{session_id}:members:version"
+
+    @staticmethod
+    def add(session_id, user_ids):
+        """Cache newly committed participants"""
+        key = SessionMembership.get_key(session_id)
+        version_key = SessionMembership.get_version_key(session_id)
+        try:
+            pipe = get_redis().pipeline(transaction=True)
+            pipe.sadd(key, *user_ids)
+            pipe.expire(key, TTL)
+            # A fill that read the database before this commit must not mark the set complete
+            pipe.incr(version_key)
+            pipe.expire(version_key, TTL)
+            pipe.execute()
+        except RedisError as e:
+            logger.error(f"Error caching session members - Session: {session_id}, Error: {str(e)}")
+            SessionMembership.invalidate(session_id)
+
+    @staticmethod
+    def invalidate(session_id):
+        """Drop the cached set after participants left, it is refilled on the next connect"""
+        version_key = SessionMembership.get_version_key(session_id)
+        try:
+            pipe = get_redis().pipeline(transaction=True)
+            pipe.delete(SessionMembership.get_key(session_id))
+            pipe.incr(version_key)
+            pipe.expire(version_key, TTL)
+            pipe.execute()
+        except RedisError as e:
+            # A stale member could still connect until the set expires
+            logger.error(f"Error dropping session members - Session: {session_id}, Error: {str(e)}")
+
+    @staticmethod
+    async def is_member(session_id, user_id):
+        """True or False, or None if the set hasn't been filled from the database"""
+        member, complete = await get_async_redis().smismember(
+            SessionMembership.get_key(session_id), [user_id, COMPLETE]
+        )
+        if member:
+            return True
+        return False if complete else None
+
+    @staticmethod
+    async def get_version(session_id):
+        """Read before loading members from the database, then passed to fill()"""
+        version = await get_async_redis().get(SessionMembership.get_version_key(session_id))
+        return int(version or 0)
+
+    @staticmethod
+    async def fill(session_id, user_ids, version):
+        """Store the members loaded from the database, unless they changed since version was read"""
+        filled = await get_async_redis().eval(
+            FILL_SCRIPT, 2,
+            SessionMembership.get_key(session_id), SessionMembership.get_version_key(session_id),
+            version, TTL, COMPLETE, *user_ids
+        )
+        return bool(filled)
+
+    @staticmethod
+    async def record_connect(elapsed, outcome, cache_miss):
+        """Count a connect attempt and its authorization latency"""
+        elapsed_ms = elapsed * 1000
+        bucket = next(
+            (f"le_{limit}ms" for limit in LATENCY_BUCKETS_MS if elapsed_ms <= limit),
+            f"gt_{LATENCY_BUCKETS_MS[-1]}ms"
+        )
+        try:
+            pipe = get_async_redis().pipeline(transaction=False)
+            pipe.hincrby(CONNECT_STATS_KEY, outcome, 1)
+            pipe.hincrby(CONNECT_STATS_KEY, bucket, 1)
+            pipe.hincrby(CONNECT_STATS_KEY, 'latency_us_total', int(elapsed * 1_000_000))
+            if cache_miss:
+                pipe.hincrby(CONNECT_STATS_KEY, 'cache_miss', 1)
+            await pipe.execute()
+        except RedisError as e:
+            logger.error(f"Error recording connect metrics: {str(e)}")
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CodingGrounds', '0004_remove_codingprofile_codinggroun_usernam_ffe44a_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submission',
+            name='results',
+            field=models.JSONField(blank=True, default=list, help_text='Per test case judge results'),
+        ),
+    ]
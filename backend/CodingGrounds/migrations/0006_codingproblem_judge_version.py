@@ -0,0 +1,32 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:58
+
+import hashlib
+import json
+
+from django.db import migrations, models
+
+
+def populate_judge_version(apps, schema_editor):
+    CodingProblem = apps.get_model('CodingGrounds', 'CodingProblem')
+    for problem in CodingProblem.objects.all():
+        digest = hashlib.sha256()
+        digest.update(json.dumps(problem.test_cases, sort_keys=True).encode())
+        digest.update(f"{problem.time_limit}:{problem.memory_limit}".encode())
+        problem.judge_version = digest.hexdigest()
+        problem.save(update_fields=['judge_version'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CodingGrounds', '0005_submission_results'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codingproblem',
+            name='judge_version',
+            field=models.CharField(blank=True, editable=False, help_text='Hash of test cases and limits, changes whenever judging would', max_length=64),
+        ),
+        migrations.RunPython(populate_judge_version, migrations.RunPython.noop),
+    ]
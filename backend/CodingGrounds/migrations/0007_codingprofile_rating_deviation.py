@@ -0,0 +1,23 @@
+# Generated by Django 5.1.5 on 2026-10-18 13:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CodingGrounds', '0006_codingproblem_judge_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codingprofile',
+            name='rating_deviation',
+            field=models.FloatField(default=350.0, help_text='Glicko-2 rating deviation'),
+        ),
+        migrations.AddField(
+            model_name='codingprofile',
+            name='rating_volatility',
+            field=models.FloatField(default=0.06, help_text='Glicko-2 volatility'),
+        ),
+    ]
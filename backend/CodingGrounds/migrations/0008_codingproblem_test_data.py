@@ -0,0 +1,23 @@
+# Generated by Django 5.1.5 on 2026-10-18 13:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CodingGrounds', '0007_codingprofile_rating_deviation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codingproblem',
+            name='test_data',
+            field=models.CharField(blank=True, help_text='Manifest hash of the hidden test cases in the test data store', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='codingproblem',
+            name='test_cases',
+            field=models.JSONField(help_text='Sample cases shown to players, judged when there is no test data'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.5 on 2026-10-18 13:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CodingGrounds', '0008_codingproblem_test_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codingproblem',
+            name='checker',
+            field=models.CharField(choices=[('tokens', 'Whitespace-insensitive tokens'), ('exact', 'Exact match'), ('float', 'Tokens, numbers within epsilon'), ('custom', 'Custom checker program')], default='tokens', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='codingproblem',
+            name='checker_epsilon',
+            field=models.FloatField(default=1e-06, help_text='Absolute or relative tolerance of the float checker'),
+        ),
+        migrations.AddField(
+            model_name='codingproblem',
+            name='checker_source',
+            field=models.TextField(blank=True, help_text='Python checker run as checker.py INPUT OUTPUT EXPECTED, exit code 0 accepts'),
+        ),
+    ]
@@ -1,9 +1,19 @@
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import connection, models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
 import uuid
+import hashlib
+import json
 from datetime import timedelta
 from django.utils import timezone
 
+from . import ratings
+from .checkers import get_checker_version
+from .timers import SessionTimers
+
+RANKS_LOCK_ID = 0x52414e4b  # pg advisory lock key held while ranks are renumbered
+
 class Badge(models.Model):
     """Badges that can be earned by users"""
     name = models.CharField(max_length=100)
@@ -24,7 +34,9 @@ class CodingProfile(models.Model):
         blank=True
     )
     display_name = models.CharField(max_length=200)
-    rating = models.IntegerField(default=1500)
+    rating = models.IntegerField(default=ratings.DEFAULT_RATING)
+    rating_deviation = models.FloatField(default=ratings.DEFAULT_DEVIATION, help_text="Glicko-2 rating deviation")
+    rating_volatility = models.FloatField(default=ratings.DEFAULT_VOLATILITY, help_text="Glicko-2 volatility")
     problems_solved = models.IntegerField(default=0)
     rank = models.IntegerField(default=0)
     bio = models.TextField(blank=True)
@@ -44,6 +56,49 @@ class CodingProfile(models.Model):
     def __str__(self):
         return self.user.username
 
+    def save(self, *args, **kwargs):
+        if self._state.adding and not self.rank:
+            # Profiles below keep their stored rank until the next rebuild_ranks run
+            self.rank = CodingProfile.objects.filter(rating__gt=self.rating).count() + 1
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def lock_ranks():
+        """
+        Serialize rank renumbering until the current transaction ends.
+
+        Renumbering counts profiles outside the rows it writes, so two
+        overlapping renumbers could each miss the other's rating changes.
+        """
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", [RANKS_LOCK_ID])
+        # SQLite already serializes writing transactions
+
+    @classmethod
+    def renumber_ranks(cls, low, high):
+        """
+        Recompute global ranks of profiles rated within [low, high].
+
+        Ranks are competition ranks (1 + profiles rated strictly higher), so a
+        rating change only moves profiles between its old and new value. Call
+        it in the transaction that saves the new ratings.
+        """
+        cls.lock_ranks()
+        rank = cls.objects.filter(rating__gt=high).count()
+        position, previous = rank, None
+        changed = []
+        in_range = cls.objects.filter(rating__gte=low, rating__lte=high).order_by('-rating')
+        for profile in in_range.only('id', 'rating', 'rank'):
+            position += 1
+            if profile.rating != previous:
+                rank, previous = position, profile.rating
+            if profile.rank != rank:
+                profile.rank = rank
+                changed.append(profile)
+        cls.objects.bulk_update(changed, ['rank'], batch_size=1000)
+        return len(changed)
+
     def update_streak(self):
         """Update the user's streak based on submissions"""
         latest_submission = self.submissions.order_by('-submitted_at').first()
@@ -62,7 +117,8 @@ class CodingProfile(models.Model):
         else:
             # Streak broken
             self.streak = 0
-        self.save()
+        # Only touch streak so concurrent counter increments aren't overwritten
+        self.save(update_fields=['streak'])
 
 class CodingProblem(models.Model):
     """Coding problems that users can solve"""
@@ -70,6 +126,12 @@ class CodingProblem(models.Model):
         EASY = 1, 'Easy'
         MEDIUM = 2, 'Medium'
         HARD = 3, 'Hard'
+
+    class Checker(models.TextChoices):
+        TOKENS = 'tokens', 'Whitespace-insensitive tokens'
+        EXACT = 'exact', 'Exact match'
+        FLOAT = 'float', 'Tokens, numbers within epsilon'
+        CUSTOM = 'custom', 'Custom checker program'
     
     title = models.CharField(max_length=200)
     description = models.TextField()
@@ -77,7 +139,12 @@ class CodingProblem(models.Model):
         choices=Difficulty.choices,
         default=Difficulty.EASY
     )
-    test_cases = models.JSONField()
+    test_cases = models.JSONField(help_text="Sample cases shown to players, judged when there is no test data")
+    test_data = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="Manifest hash of the hidden test cases in the test data store"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(
         CodingProfile, 
@@ -88,6 +155,21 @@ class CodingProblem(models.Model):
     time_limit = models.FloatField(default=1.0, help_text="Time limit in seconds")
     memory_limit = models.IntegerField(default=128, help_text="Memory limit in MB")
     tags = models.JSONField(default=list, blank=True, help_text="List of tags for the problem")
+    checker = models.CharField(max_length=10, choices=Checker.choices, default=Checker.TOKENS)
+    checker_epsilon = models.FloatField(
+        default=1e-6,
+        help_text="Absolute or relative tolerance of the float checker"
+    )
+    checker_source = models.TextField(
+        blank=True,
+        help_text="Python checker run as checker.py INPUT OUTPUT EXPECTED, exit code 0 accepts"
+    )
+    judge_version = models.CharField(
+        max_length=64,
+        blank=True,
+        editable=False,
+        help_text="Hash of test cases and limits, changes whenever judging would"
+    )
     
     class Meta:
         ordering = ['difficulty', 'created_at']
@@ -99,6 +181,25 @@ class CodingProblem(models.Model):
     def __str__(self):
         return self.title
 
+    def clean(self):
+        if self.checker == self.Checker.CUSTOM and not self.checker_source.strip():
+            raise ValidationError({'checker_source': "A custom checker needs its source."})
+
+    def compute_judge_version(self):
+        """Hash everything that affects a verdict for this problem"""
+        digest = hashlib.sha256()
+        # The manifest hash covers every stored input and output
+        digest.update((self.test_data or json.dumps(self.test_cases, sort_keys=True)).encode())
+        digest.update(f"{self.time_limit}:{self.memory_limit}:{get_checker_version(self)}".encode())
+        return digest.hexdigest()
+
+    def save(self, *args, **kwargs):
+        self.judge_version = self.compute_judge_version()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'judge_version' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'judge_version']
+        super().save(*args, **kwargs)
+
 class Submission(models.Model):
     """Code submissions for solving problems"""
     class Status(models.TextChoices):
@@ -121,6 +222,7 @@ class Submission(models.Model):
     )
     execution_time = models.FloatField(null=True, blank=True)
     memory_usage = models.FloatField(null=True, blank=True)
+    results = models.JSONField(default=list, blank=True, help_text="Per test case judge results")
     submitted_at = models.DateTimeField(auto_now_add=True)
     game_session = models.ForeignKey(
         'GameSession', 
@@ -146,33 +248,44 @@ class Submission(models.Model):
         super().save(*args, **kwargs)
         
         if is_new and self.status == self.Status.ACCEPTED:
-            # Check if this is the first time this user solved this problem
-            previous_accepted = Submission.objects.filter(
-                profile=self.profile,
-                problem=self.problem,
-                status=self.Status.ACCEPTED
-            ).exclude(pk=self.pk).exists()
-            
-            if not previous_accepted:
-                # Increment problems_solved count
-                self.profile.problems_solved += 1
-                self.profile.save()
-                
-                # Update game participation if part of a session
-                if self.game_session:
-                    participation = GameParticipation.objects.get(
-                        game_session=self.game_session,
-                        profile=self.profile
-                    )
-                    participation.problems_solved += 1
-                    
-                    # Calculate time since session start
-                    time_delta = self.submitted_at - self.game_session.start_time
-                    seconds = int(time_delta.total_seconds())
-                    
-                    # Add to total time (used for tie-breaking)
-                    participation.total_time += seconds
-                    participation.save()
+            self.credit_solve()
+
+    def credit_solve(self):
+        """
+        Count this accepted submission towards the solver's totals.
+
+        Only the first accepted submission for a problem counts, per profile and
+        per session. Counters are bumped with single UPDATE ... SET x = x + n
+        statements so concurrent verdicts can't lose increments. Returns
+        (first solve of the problem, session participation changed).
+        """
+        accepted = Submission.objects.filter(
+            profile_id=self.profile_id,
+            problem_id=self.problem_id,
+            status=self.Status.ACCEPTED
+        ).exclude(pk=self.pk)
+
+        solved_before = accepted.exists()
+        if not solved_before:
+            CodingProfile.objects.filter(pk=self.profile_id).update(
+                problems_solved=F('problems_solved') + 1
+            )
+
+        if self.game_session_id is None:
+            return not solved_before, False
+        if solved_before and accepted.filter(game_session_id=self.game_session_id).exists():
+            return False, False
+
+        # Time since session start is used for tie-breaking
+        start_time = self.game_session.start_time
+        time_delta = self.submitted_at - start_time if start_time else timedelta(0)
+        return not solved_before, GameParticipation.objects.filter(
+            game_session_id=self.game_session_id,
+            profile_id=self.profile_id
+        ).update(
+            problems_solved=F('problems_solved') + 1,
+            total_time=F('total_time') + int(time_delta.total_seconds())
+        ) > 0
 
 class GameSession(models.Model):
     """Competitive coding sessions with multiple participants"""
@@ -231,59 +344,40 @@ class GameSession(models.Model):
 
     def end_session(self):
         """End the game session and calculate final rankings"""
-        self.is_active = False
-        self.end_time = timezone.now()
-        self.save()
-        
-        # Calculate and update participant rankings
-        participations = self.participations.all()
-        sorted_participations = sorted(
-            participations, 
+        with transaction.atomic():
+            self.is_active = False
+            self.end_time = timezone.now()
+            self.save()
+            transaction.on_commit(lambda: SessionTimers.cancel(self.id))
+            return self.rank_participants()
+
+    def rank_participants(self):
+        """Assign final ranks and scores, rate the players and return their profiles"""
+        participations = sorted(
+            self.participations.select_related('profile'),
             key=lambda p: (p.problems_solved, -p.total_time),
             reverse=True
         )
-        
-        for rank, participation in enumerate(sorted_participations, 1):
+        for rank, participation in enumerate(participations, 1):
             participation.final_rank = rank
             # Calculate score based on rank and problems solved
             participation.score = max(0, 100 - (rank - 1) * 10) * participation.problems_solved
-            participation.save()
-            
-            # Update user ratings based on performance
-            self._update_user_rating(participation)
-
-    def _update_user_rating(self, participation):
-        """Update a user's rating based on their performance in this session"""
-        # Simple ELO-like rating adjustment
-        profile = participation.profile
-        expected_rank = self._get_expected_rank(profile)
-        actual_rank = participation.final_rank
-        
-        # Calculate rating change based on expected vs actual performance
-        # Higher ranks (lower numbers) are better
-        rank_diff = expected_rank - actual_rank
-        rating_change = int(rank_diff * 10)
-        
-        # Apply rating change with some constraints
-        profile.rating = max(0, profile.rating + rating_change)
-        profile.save()
-    
-    def _get_expected_rank(self, profile):
-        """Calculate expected rank based on current rating"""
-        participants = self.participants.all()
-        ratings = [p.rating for p in participants]
-        ratings.sort(reverse=True)
-        
-        try:
-            expected_rank = ratings.index(profile.rating) + 1
-        except ValueError:
-            # If rating not found, estimate position
-            for i, rating in enumerate(ratings, 1):
-                if profile.rating >= rating:
-                    return i
-            return len(ratings) + 1
-            
-        return expected_rank
+
+        # Players with equal standings draw for rating purposes
+        profiles = [participation.profile for participation in participations]
+        old_ratings = [profile.rating for profile in profiles]
+        ratings.rate(profiles, ratings.standing_ranks(participations))
+
+        with transaction.atomic():
+            GameParticipation.objects.bulk_update(participations, ['final_rank', 'score'])
+            CodingProfile.objects.bulk_update(
+                profiles, ['rating', 'rating_deviation', 'rating_volatility']
+            )
+            if profiles:
+                # Only profiles rated between the lowest and highest moved rating change place
+                moved = old_ratings + [profile.rating for profile in profiles]
+                CodingProfile.renumber_ranks(min(moved), max(moved))
+        return profiles
 
     def __str__(self):
         return f"{self.title} - {self.start_time}"
@@ -292,6 +386,8 @@ class GameSession(models.Model):
         if not self.end_time and self.start_time:
             self.end_time = self.start_time + timedelta(minutes=15)
         super().save(*args, **kwargs)
+        if self.is_active and self.end_time:
+            SessionTimers.schedule(self.id, self.end_time)
 
 class GameParticipation(models.Model):
     """Junction table between GameSession and CodingProfile with additional data"""
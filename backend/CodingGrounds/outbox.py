@@ -0,0 +1,319 @@
+"""
+Background publisher for WebSocket events.
+
+Views and judge workers hand encoded events to ``get_outbox().put()``,
+which only appends to an in-process queue. A daemon thread with its own
+event loop drains the queue in batches of up to ``WEBSOCKET_OUTBOX_BATCH``
+events. Different sessions are sent concurrently, while each session's
+events go out strictly in order. A failed send is retried with exponential
+backoff (holding back that session's later events) up to
+``WEBSOCKET_OUTBOX_RETRIES`` times.
+
+Events that cannot be delivered from this process are not simply dropped.
+They are spilled to the ``websocket:outbox`` Redis list when the queue is
+full, when a send runs out of retries (together with the rest of that
+session's batch) and at exit for whatever is still queued. Any process's
+publisher drains the list whenever its own queue is idle, and between
+batches while it is holding sessions back. The list is capped at
+``WEBSOCKET_OUTBOX_SPILL_SIZE`` events, oldest first out.
+
+Spilling keeps each session's order. ``websocket:outbox:held`` counts the
+spilled events of every group. Once this process has spilled an event of a
+group, its later events for that group are spilled behind it instead of
+being sent, until the group's count drops to zero. Events queued before the
+spilled one still go out directly, and if they fail too they are put back at
+the head of the list, ahead of it.
+
+Outcomes are counted in the ``metrics:ws_outbox`` hash (``sent``,
+``retried``, ``spilled``, ``recovered``, ``dropped``), so loss stays visible
+and bounded by the cap plus whatever is lost while Redis itself is down.
+
+The publisher runs its own event loop, so it needs a channel layer shared
+across loops and processes such as channels_redis. Each ``group_send`` is a
+separate call because the channels API has no batched send.
+"""
+import asyncio
+import atexit
+import itertools
+import json
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+SPILL_KEY = 'websocket:outbox'
+HELD_KEY = 'websocket:outbox:held'
+STATS_KEY = 'metrics:ws_outbox'
+
+# Adds events at either end, counts them per group and trims the oldest past the cap.
+# KEYS: spill list, held counts; ARGV: cap, RPUSH or LPUSH, group, event json, ...
+SPILL_SCRIPT = """
+for i = 3, #ARGV, 2 do
+    redis.call(ARGV[2], KEYS[1], ARGV[i + 1])
+    redis.call('HINCRBY', KEYS[2], ARGV[i], 1)
+end
+local dropped = 0
+while redis.call('LLEN', KEYS[1]) > tonumber(ARGV[1]) do
+    local group = cjson.decode(redis.call('LPOP', KEYS[1]))[1]
+    if redis.call('HINCRBY', KEYS[2], group, -1) <= 0 then
+        redis.call('HDEL', KEYS[2], group)
+    end
+    dropped = dropped + 1
+end
+return dropped
+"""
+
+# Takes events from the head of the list and uncounts them.
+# KEYS: spill list, held counts; ARGV: count
+RECOVER_SCRIPT = """
+local items = redis.call('LPOP', KEYS[1], ARGV[1])
+if not items then
+    return {}
+end
+for _, item in ipairs(items) do
+    local group = cjson.decode(item)[1]
+    if redis.call('HINCRBY', KEYS[2], group, -1) <= 0 then
+        redis.call('HDEL', KEYS[2], group)
+    end
+end
+return items
+"""
+
+
+class EventOutbox:
+    """Queue of (group, event) pairs published from a background thread"""
+
+    def __init__(self, max_size=None, batch_size=None, retries=None, spill_size=None, poll_interval=None):
+        self.batch_size = batch_size or getattr(settings, 'WEBSOCKET_OUTBOX_BATCH', 200)
+        self.retries = retries or getattr(settings, 'WEBSOCKET_OUTBOX_RETRIES', 5)
+        self.spill_size = spill_size or getattr(settings, 'WEBSOCKET_OUTBOX_SPILL_SIZE', 100000)
+        self.poll_interval = poll_interval or getattr(settings, 'WEBSOCKET_OUTBOX_POLL_INTERVAL', 1)
+        self._queue = queue.Queue(max_size or getattr(settings, 'WEBSOCKET_OUTBOX_SIZE', 10000))
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._stats = Counter()
+        self._stats_lock = threading.Lock()
+        self._sequence = itertools.count()
+        # group -> sequence number of this process's first spilled event still in Redis
+        self._held = {}
+        self._held_lock = threading.Lock()
+
+    def put(self, group_name, event):
+        """Queue an event without waiting for the channel layer"""
+        self._ensure_started()
+        item = (next(self._sequence), group_name, event)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            logger.warning(f"WebSocket outbox full, spilling event - Group: {group_name}, Type: {event['type']}")
+            self._spill([item])
+
+    def flush(self, timeout=5):
+        """Wait until every queued event has been handled"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return not self._queue.unfinished_tasks
+
+    def close(self, timeout=5):
+        """Flush, stop the publisher, then spill anything still queued so another process can publish it"""
+        self.flush(timeout)
+        with self._lock:
+            self._stopping.set()
+            if self._thread is not None:
+                self._thread.join(self.poll_interval + timeout)
+        pending = []
+        while True:
+            try:
+                pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if pending:
+            self._spill(pending)
+            for _ in pending:
+                self._queue.task_done()
+        self._record_stats()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name='websocket-outbox', daemon=True)
+                self._thread.start()
+
+    def _count(self, outcome, n=1):
+        with self._stats_lock:
+            self._stats[outcome] += n
+
+    def _record_stats(self):
+        with self._stats_lock:
+            stats, self._stats = self._stats, Counter()
+        if not stats:
+            return
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for outcome, n in stats.items():
+                pipe.hincrby(STATS_KEY, outcome, n)
+            pipe.execute()
+        except RedisError as e:
+            logger.error(f"Error recording WebSocket outbox metrics: {str(e)}")
+            # Kept for the next attempt
+            with self._stats_lock:
+                self._stats.update(stats)
+
+    def _spill(self, items, front=False):
+        """Append undeliverable (sequence, group, event) items to the shared Redis list, or put them back in front"""
+        args = []
+        try:
+            for _, group_name, event in (reversed(items) if front else items):
+                args += [group_name, json.dumps([group_name, event])]
+            dropped = get_redis().eval(
+                SPILL_SCRIPT, 2, SPILL_KEY, HELD_KEY, self.spill_size, 'LPUSH' if front else 'RPUSH', *args
+            )
+        except (RedisError, TypeError, ValueError) as e:
+            logger.error(f"Dropping {len(items)} WebSocket events, could not spill them: {str(e)}")
+            self._count('dropped', len(items))
+            return
+        with self._held_lock:
+            for sequence, group_name, _ in items:
+                self._held[group_name] = min(sequence, self._held.get(group_name, sequence))
+        self._count('spilled', len(items))
+        if dropped:
+            logger.error(f"WebSocket outbox spill list full, dropped {dropped} oldest events")
+            self._count('dropped', dropped)
+
+    def _recover(self):
+        """Take a batch of spilled events back from Redis"""
+        try:
+            raw = get_redis().eval(RECOVER_SCRIPT, 2, SPILL_KEY, HELD_KEY, self.batch_size)
+        except RedisError as e:
+            logger.error(f"Error reading spilled WebSocket events: {str(e)}")
+            return []
+        batch = []
+        for item in raw:
+            try:
+                group_name, event = json.loads(item)
+            except ValueError:
+                self._count('dropped')
+                continue
+            # Spilled events are older than anything still queued
+            batch.append((-1, group_name, event))
+        self._count('recovered', len(batch))
+        return batch
+
+    def _hold_back(self, batch):
+        """Spill the events of groups whose earlier events are still spilled; returns the rest"""
+        with self._held_lock:
+            held = dict(self._held)
+        if not held:
+            return batch
+        try:
+            counts = get_redis().hmget(HELD_KEY, list(held))
+        except RedisError as e:
+            logger.error(f"Error reading held WebSocket groups: {str(e)}")
+            counts = [1] * len(held)
+        with self._held_lock:
+            for group_name, count in zip(list(held), counts):
+                if not count and self._held.get(group_name) == held[group_name]:
+                    # Everything spilled for the group has been published
+                    del self._held[group_name]
+                    del held[group_name]
+        if not held:
+            return batch
+        send, spill = [], []
+        for item in batch:
+            sequence, group_name, _ = item
+            (spill if group_name in held and sequence > held[group_name] else send).append(item)
+        if spill:
+            self._spill(spill)
+        return send
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        last_recovery = 0
+        while not self._stopping.is_set():
+            if self._held and time.monotonic() - last_recovery >= self.poll_interval:
+                # Held groups only move on once their spilled events are published
+                last_recovery = time.monotonic()
+                recovered = self._recover()
+                if recovered:
+                    self._send_batch(loop, recovered)
+            try:
+                batch = [self._queue.get(timeout=self.poll_interval)]
+            except queue.Empty:
+                # Idle: publish what this or another process could not deliver
+                recovered = self._recover()
+                if recovered:
+                    self._send_batch(loop, recovered)
+                self._record_stats()
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._send_batch(loop, self._hold_back(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            self._record_stats()
+        loop.close()
+
+    def _send_batch(self, loop, batch):
+        by_group = {}
+        for item in batch:
+            by_group.setdefault(item[1], []).append(item)
+        try:
+            loop.run_until_complete(asyncio.gather(*(
+                self._publish(group_name, items) for group_name, items in by_group.items()
+            )))
+        except Exception as e:
+            logger.error(f"WebSocket outbox error: {str(e)}")
+
+    async def _publish(self, group_name, items):
+        channel_layer = get_channel_layer()
+        for index, (_, _, event) in enumerate(items):
+            for attempt in range(self.retries):
+                try:
+                    await channel_layer.group_send(group_name, event)
+                    self._count('sent')
+                    break
+                except Exception as e:
+                    logger.warning(f"Error sending WebSocket event - Group: {group_name}, Attempt: {attempt + 1}, Error: {str(e)}")
+                    self._count('retried')
+                    await asyncio.sleep(min(0.05 * 2 ** attempt, 2))
+            else:
+                logger.error(f"Spilling WebSocket events after {self.retries} attempts - Group: {group_name}, Type: {event['type']}")
+                # Events older than ones already spilled (recovered ones, or overtaken by a spill
+                # from a full queue) go back to the head of the list, ahead of those
+                with self._held_lock:
+                    front = items[index][0] < self._held.get(group_name, 0)
+                self._spill(items[index:], front=front)
+                return
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox():
+    """Return the process-wide WebSocket outbox"""
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = EventOutbox()
+            # Short-lived processes (management commands) publish or spill what they queued
+            atexit.register(_outbox.close)
+        return _outbox
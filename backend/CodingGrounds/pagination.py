@@ -0,0 +1,10 @@
+from rest_framework.pagination import CursorPagination
+
+
+class SubmissionCursorPagination(CursorPagination):
+    """Keyset pagination over a user's submission history"""
+    # Walks the -submitted_at index instead of OFFSET scanning older pages
+    ordering = '-submitted_at'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
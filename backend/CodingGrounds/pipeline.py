@@ -0,0 +1,209 @@
+"""
+Asynchronous submission pipeline.
+
+``SolveProblemView.submit`` only creates a pending ``Submission`` and pushes its
+id onto a Redis list. Judge workers (``manage.py run_judge_worker``) pop ids,
+judge them, write the verdict and notify the session over WebSocket.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from .checkers import get_problem_checker
+from .global_leaderboard import record_solve
+from .judge import run_submission, sandbox_drops_privileges
+from .leaderboard import record_standing
+from .lifecycle import close_session
+from .models import CodingProfile, GameParticipation, GameSession, Submission
+from .problem_picker import mark_solved
+from .redis_client import get_redis
+from .testdata import get_problem_cases
+from .verdict_cache import get_verdict_cache
+from .websocket_utils import WebSocketManager
+
+logger = logging.getLogger(__name__)
+
+QUEUE_KEY = 'judge:queue'
+
+
+def enqueue_submission(submission_id):
+    """Queue a submission for judging once the current transaction commits"""
+    transaction.on_commit(lambda: _push(submission_id))
+
+
+def _push(*submission_ids):
+    try:
+        get_redis().lpush(QUEUE_KEY, *submission_ids)
+    except RedisError as e:
+        # Pending submissions are re-queued when a worker starts
+        logger.error(f"Error queueing submissions {submission_ids}: {str(e)}")
+
+
+def requeue_pending():
+    """Queue every submission still waiting for a verdict"""
+    pending = list(
+        Submission.objects.filter(status=Submission.Status.PENDING)
+        .order_by('submitted_at')
+        .values_list('id', flat=True)
+    )
+    if pending:
+        _push(*pending)
+    return len(pending)
+
+
+def process_submission(submission_id):
+    """Judge a pending submission, store the verdict and notify its session"""
+    try:
+        submission = Submission.objects.select_related(
+            'problem', 'profile', 'game_session'
+        ).get(pk=submission_id)
+    except Submission.DoesNotExist:
+        logger.warning(f"Submission {submission_id} no longer exists")
+        return None
+
+    if submission.status != Submission.Status.PENDING:
+        return submission
+
+    problem = submission.problem
+    # Practice submissions (outside a session) get feedback on every case
+    run_all = submission.game_session_id is None
+    # Without a real sandbox only the inline cases are judged, and those verdicts must not be cached
+    stored = sandbox_drops_privileges()
+    cache = get_verdict_cache()
+    verdict = cache.get(problem, submission.language, submission.code, run_all=run_all) if stored else None
+    if verdict is None:
+        verdict = run_submission(
+            submission.code,
+            submission.language,
+            get_problem_cases(problem, stored=stored),
+            time_limit=problem.time_limit,
+            memory_limit=problem.memory_limit,
+            run_all=run_all,
+            checker=get_problem_checker(problem)
+        )
+        if stored:
+            cache.set(problem, submission.language, submission.code, verdict, run_all=run_all)
+
+    record_verdict(submission, verdict)
+    return submission
+
+
+def record_verdict(submission, verdict):
+    """Store a verdict on a pending submission and notify its session"""
+    accepted = verdict.status == Submission.Status.ACCEPTED
+    with transaction.atomic():
+        if accepted:
+            # Serialize accepted verdicts per profile so only one is the first solve
+            list(CodingProfile.objects.select_for_update().filter(
+                pk=submission.profile_id
+            ).values_list('pk', flat=True))
+
+        # Only the first worker to finish a duplicated job records the verdict
+        updated = Submission.objects.filter(
+            pk=submission.pk,
+            status=Submission.Status.PENDING
+        ).update(
+            status=verdict.status,
+            execution_time=verdict.execution_time,
+            memory_usage=verdict.memory_usage,
+            results=verdict.results
+        )
+        if not updated:
+            return False
+        first_solve, credited = submission.credit_solve() if accepted else (False, False)
+
+    submission.status = verdict.status
+    submission.execution_time = verdict.execution_time
+    submission.memory_usage = verdict.memory_usage
+    submission.results = verdict.results
+    if first_solve:
+        record_solve(submission)
+        mark_solved(submission.profile_id, submission.problem_id)
+
+    event = {
+        'type': 'submission_verdict',
+        'submission_id': submission.id,
+        'profile_id': submission.profile.id,
+        'username': submission.profile.display_name,
+        'problem_id': submission.problem.id,
+        'status': submission.status,
+        'passed': sum(1 for r in verdict.results if r['status'] == Submission.Status.ACCEPTED),
+        'total': len(verdict.results),
+        'execution_time': submission.execution_time,
+        'memory_usage': submission.memory_usage
+    }
+    session = submission.game_session
+    if session is None:
+        # Practice verdicts go to the player alone, with every case's result
+        WebSocketManager.notify_user(submission.profile.user_id, 'verdict', dict(event, results=verdict.results))
+        return True
+
+    WebSocketManager.notify_session_update(str(session.id), 'verdict', event)
+
+    if credited:
+        _record_accepted(submission, session)
+    return True
+
+
+def _record_accepted(submission, session):
+    """Update session standings for a first solve and end the session once it's all solved"""
+    participation = GameParticipation.objects.select_related('profile').get(
+        game_session=session,
+        profile=submission.profile
+    )
+    record_standing(participation)
+    if participation.problems_solved < session.problems.count():
+        return
+
+    # Someone solved every problem; only the first verdict ends the session.
+    # Ranking commits together with the flip, or neither does.
+    with transaction.atomic():
+        ended = GameSession.objects.filter(pk=session.pk, is_active=True).update(
+            is_active=False,
+            end_time=timezone.now()
+        )
+        if ended:
+            session.is_active = False
+            close_session(session, "Session has ended - all problems solved!", submission.profile.display_name)
+
+
+def _handle(submission_id, slots):
+    try:
+        process_submission(submission_id)
+    except Exception as e:
+        logger.exception(f"Error judging submission {submission_id}: {str(e)}")
+    finally:
+        close_old_connections()
+        slots.release()
+
+
+def run_worker(concurrency=None, stop_event=None):
+    """Pop submission ids from the queue and judge them until stopped"""
+    concurrency = concurrency or getattr(settings, 'JUDGE_MAX_WORKERS', 2)
+    poll_timeout = getattr(settings, 'JUDGE_QUEUE_POLL_TIMEOUT', 2)
+    stop_event = stop_event or threading.Event()
+    slots = threading.BoundedSemaphore(concurrency)
+
+    requeued = requeue_pending()
+    logger.info(f"Judge worker started - Concurrency: {concurrency}, Requeued: {requeued}")
+
+    redis = get_redis()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='judge') as executor:
+        while not stop_event.is_set():
+            slots.acquire()
+            try:
+                item = redis.brpop(QUEUE_KEY, timeout=poll_timeout)
+            except RedisError as e:
+                slots.release()
+                logger.error(f"Error reading judge queue: {str(e)}")
+                stop_event.wait(poll_timeout)
+                continue
+            if item is None:
+                slots.release()
+                continue
+            executor.submit(_handle, int(item[1]), slots)
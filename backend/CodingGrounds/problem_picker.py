@@ -0,0 +1,200 @@
+"""
+Problem selection for sessions without loading problem rows.
+
+Problem ids are indexed in Redis sets by difficulty, by tag and by both:
+``problems:all``, ``problems:difficulty:{d}``, ``problems:tag:{tag}`` and
+``problems:tag:{tag}:difficulty:{d}``. The index is built from a single
+``values_list`` query, with no test case blobs, and is dropped whenever a
+problem changes (see ``signals.py``).
+
+Every profile has a bitmap of the problems it has solved at
+``solved:{profile_id}``. Bit 0 marks a bitmap as complete, since problem ids
+start at 1. Judge workers set a bit on every first solve, and a bitmap
+missing its marker is filled from accepted submissions once.
+
+A pick draws ``CANDIDATES`` random ids with SRANDMEMBER, up to
+``SAMPLE_ROUNDS`` times, and keeps one nobody in the session has solved,
+checked with pipelined GETBITs. While most of the pool is unsolved that
+costs the same however many problems there are. If sampling finds nothing,
+the whole pool is scanned with SSCAN, so a problem someone already solved is
+only picked when every problem of the pool has been solved.
+"""
+import logging
+import random
+
+from redis.exceptions import RedisError
+
+from .models import CodingProblem, Submission
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+BUILT_KEY = 'problems:built'
+CANDIDATES = 16
+SAMPLE_ROUNDS = 4
+SCAN_BATCH = 500
+MAX_SESSION_PROBLEMS = 10
+SOLVED_TTL = 7 * 24 * 60 * 60
+
+
+def get_index_key(difficulty=None, tag=None):
+    key = f"problems:tag:{tag}" if tag else 'problems:all'
+    if difficulty:
+        key = f"{key}:difficulty:{difficulty}" if tag else f"problems:difficulty:{difficulty}"
+    return key
+
+
+def get_solved_key(profile_id):
+    return f"solved:{profile_id}"
+
+
+def rebuild_index():
+    """Index every problem id by difficulty and tag"""
+    redis = get_redis()
+    keys = {}
+    for problem_id, difficulty, tags in CodingProblem.objects.values_list('id', 'difficulty', 'tags').iterator(chunk_size=2000):
+        for tag in [None] + list(tags or []):
+            keys.setdefault(get_index_key(tag=tag), []).append(problem_id)
+            keys.setdefault(get_index_key(difficulty, tag), []).append(problem_id)
+
+    pipe = redis.pipeline(transaction=True)
+    for key in redis.scan_iter(match='problems:*'):
+        pipe.delete(key)
+    for key, problem_ids in keys.items():
+        pipe.sadd(key, *problem_ids)
+    pipe.set(BUILT_KEY, 1)
+    pipe.execute()
+
+
+def invalidate_index():
+    try:
+        get_redis().delete(BUILT_KEY)
+    except RedisError as e:
+        logger.error(f"Error invalidating problem index: {str(e)}")
+
+
+def mark_solved(profile_id, problem_id):
+    """Record a first solve in the profile's solved bitmap"""
+    key = get_solved_key(profile_id)
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.setbit(key, problem_id, 1)
+        pipe.expire(key, SOLVED_TTL)
+        pipe.execute()
+    except RedisError as e:
+        # Without the marker bit the bitmap is refilled from the database
+        logger.error(f"Error updating solved bitmap - Profile: {profile_id}, Error: {str(e)}")
+
+
+def _ensure_solved(redis, profile_ids):
+    pipe = redis.pipeline(transaction=False)
+    for profile_id in profile_ids:
+        pipe.getbit(get_solved_key(profile_id), 0)
+    missing = [profile_id for profile_id, built in zip(profile_ids, pipe.execute()) if not built]
+    if not missing:
+        return
+
+    pipe = redis.pipeline(transaction=False)
+    solved = Submission.objects.filter(
+        profile_id__in=missing,
+        status=Submission.Status.ACCEPTED
+    ).order_by().values_list('profile_id', 'problem_id').distinct()
+    for profile_id, problem_id in solved.iterator(chunk_size=2000):
+        pipe.setbit(get_solved_key(profile_id), problem_id, 1)
+    for profile_id in missing:
+        pipe.setbit(get_solved_key(profile_id), 0, 1)
+        pipe.expire(get_solved_key(profile_id), SOLVED_TTL)
+    pipe.execute()
+
+
+def pick_problems(profile_ids, difficulties=(None,), tag=None):
+    """
+    Pick one problem id per requested difficulty (None for any), preferring
+    problems none of the profiles has solved and never repeating a problem.
+    Returns fewer ids when the pool runs out.
+    """
+    profile_ids = list(profile_ids)
+    try:
+        return _pick_from_index(profile_ids, difficulties, tag)
+    except RedisError as e:
+        logger.error(f"Error picking problems from the index: {str(e)}")
+        return _pick_from_database(profile_ids, difficulties, tag)
+
+
+def _count_solvers(redis, profile_ids, candidates):
+    """How many of the profiles solved each candidate"""
+    pipe = redis.pipeline(transaction=False)
+    for problem_id in candidates:
+        for profile_id in profile_ids:
+            pipe.getbit(get_solved_key(profile_id), problem_id)
+    solved = pipe.execute()
+    per_problem = len(profile_ids)
+    return [sum(solved[i * per_problem:(i + 1) * per_problem]) for i in range(len(candidates))]
+
+
+def _pick_one(redis, key, profile_ids, picked):
+    """A problem of the pool nobody solved, else the one the fewest solved, else None"""
+    best, best_solvers = None, None
+
+    def consider(candidates):
+        nonlocal best, best_solvers
+        candidates = [problem_id for problem_id in candidates if problem_id not in picked]
+        if not candidates:
+            return False
+        solvers = _count_solvers(redis, profile_ids, candidates)
+        fewest = min(solvers)
+        if best_solvers is None or fewest < best_solvers:
+            best, best_solvers = candidates[solvers.index(fewest)], fewest
+        return fewest == 0
+
+    for _ in range(SAMPLE_ROUNDS):
+        sample = [int(problem_id) for problem_id in redis.srandmember(key, CANDIDATES)]
+        if consider(sample) or len(sample) < CANDIDATES:
+            # Found a fresh one, or the sample was the whole pool
+            return best
+
+    batch = []
+    for problem_id in redis.sscan_iter(key, count=SCAN_BATCH):
+        batch.append(int(problem_id))
+        if len(batch) == SCAN_BATCH:
+            if consider(batch):
+                return best
+            batch = []
+    consider(batch)
+    return best
+
+
+def _pick_from_index(profile_ids, difficulties, tag):
+    redis = get_redis()
+    if not redis.exists(BUILT_KEY):
+        rebuild_index()
+    _ensure_solved(redis, profile_ids)
+
+    picked = []
+    for difficulty in difficulties:
+        problem_id = _pick_one(redis, get_index_key(difficulty, tag), profile_ids, picked)
+        if problem_id is not None:
+            picked.append(problem_id)
+    return picked
+
+
+def _pick_from_database(profile_ids, difficulties, tag):
+    solved = set(Submission.objects.filter(
+        profile_id__in=profile_ids,
+        status=Submission.Status.ACCEPTED
+    ).values_list('problem_id', flat=True))
+
+    picked = []
+    for difficulty in difficulties:
+        problems = CodingProblem.objects.all()
+        if difficulty:
+            problems = problems.filter(difficulty=difficulty)
+        problem_ids = [
+            problem_id for problem_id, tags in problems.values_list('id', 'tags')
+            if problem_id not in picked and (not tag or tag in (tags or []))
+        ]
+        if not problem_ids:
+            continue
+        fresh = [problem_id for problem_id in problem_ids if problem_id not in solved]
+        picked.append(random.choice(fresh or problem_ids))
+    return picked
@@ -0,0 +1,81 @@
+"""
+Global rank lookups served from Redis.
+
+Every profile's rating is mirrored in a Redis sorted set, so the live rank
+and percentile of a profile are two ZCOUNTs instead of a table scan.
+
+``CodingProfile.rank`` is kept in the database for list views. Ending a
+session renumbers only the profiles rated between the lowest and highest
+rating that moved (see ``CodingProfile.renumber_ranks``), under a lock so
+overlapping sessions don't interleave. A new profile starts at its place
+without shifting the ones below, and ``manage.py rebuild_ranks`` corrects
+those in one pass.
+"""
+import logging
+
+from redis.exceptions import RedisError
+
+from .models import CodingProfile
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+RATINGS_KEY = 'ratings:global'
+BATCH_SIZE = 1000
+
+
+def publish_ratings(profiles):
+    """Mirror the current ratings of the given profiles"""
+    scores = {profile.id: profile.rating for profile in profiles}
+    if not scores:
+        return
+    try:
+        get_redis().zadd(RATINGS_KEY, scores)
+    except RedisError as e:
+        logger.error(f"Error publishing ratings: {str(e)}")
+
+
+def rebuild_ratings_index():
+    """Replace the sorted set with every profile's rating from the database"""
+    staging_key = f"{RATINGS_KEY}:rebuild"
+    redis = get_redis()
+    redis.delete(staging_key)
+    batch = {}
+    for profile_id, rating in CodingProfile.objects.values_list('id', 'rating').iterator(chunk_size=BATCH_SIZE):
+        batch[profile_id] = rating
+        if len(batch) == BATCH_SIZE:
+            redis.zadd(staging_key, batch)
+            batch = {}
+    if batch:
+        redis.zadd(staging_key, batch)
+    # Swapped in at once so lookups never see a half-built set
+    if redis.exists(staging_key):
+        redis.rename(staging_key, RATINGS_KEY)
+    else:
+        redis.delete(RATINGS_KEY)
+
+
+def get_percentile(profile):
+    """Rank and percentile of a profile among all rated profiles"""
+    redis = get_redis()
+    pipe = redis.pipeline(transaction=False)
+    pipe.zscore(RATINGS_KEY, profile.id)
+    pipe.zcard(RATINGS_KEY)
+    rating, total = pipe.execute()
+    if not total:
+        rebuild_ratings_index()
+        rating = redis.zscore(RATINGS_KEY, profile.id)
+        total = redis.zcard(RATINGS_KEY)
+    rating = int(rating) if rating is not None else profile.rating
+
+    pipe = redis.pipeline(transaction=False)
+    pipe.zcount(RATINGS_KEY, f"({rating}", '+inf')
+    pipe.zcount(RATINGS_KEY, '-inf', f"({rating}")
+    above, below = pipe.execute()
+    return {
+        'profile_id': profile.id,
+        'rating': rating,
+        'rank': above + 1,
+        'total': total,
+        'percentile': round(100 * below / total, 2) if total else 100.0
+    }
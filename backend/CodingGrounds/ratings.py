@@ -0,0 +1,164 @@
+"""
+Multi-player rating engine.
+
+A session with N participants is rated as N*(N-1)/2 pairwise games: a player
+beats everyone ranked below them and draws with players on the same rank.
+Expected scores are computed as NumPy matrices in row blocks of
+``RATING_BLOCK_SIZE`` rows, so thousands of participants need no Python
+level pairwise loops and memory stays bounded.
+
+Two systems are supported, selected by ``RATING_SYSTEM``:
+
+* ``elo``: classic Elo with the K factor spread over the N-1 games.
+* ``glicko2``: Glicko-2 (Glickman, 2012) treating each session as one rating
+  period, using ``CodingProfile.rating_deviation`` and ``rating_volatility``.
+"""
+import numpy as np
+from django.conf import settings
+
+DEFAULT_RATING = 1500
+DEFAULT_DEVIATION = 350.0
+DEFAULT_VOLATILITY = 0.06
+
+# Glicko-2 scale factor between the public and internal rating scales
+GLICKO2_SCALE = 173.7178
+CONVERGENCE_TOLERANCE = 1e-6
+MAX_ITERATIONS = 100
+
+
+def _row_blocks(n):
+    size = getattr(settings, 'RATING_BLOCK_SIZE', 1024)
+    for start in range(0, n, size):
+        yield slice(start, min(start + size, n))
+
+
+def _actual_scores(ranks, rows):
+    """Pairwise results of the given rows against everyone: 1 win, 0.5 draw, 0 loss"""
+    return (ranks[rows, None] < ranks[None, :]) + 0.5 * (ranks[rows, None] == ranks[None, :])
+
+
+def elo(ratings, ranks, k=None):
+    """Return new Elo ratings for one session"""
+    ratings = np.asarray(ratings, dtype=float)
+    ranks = np.asarray(ranks)
+    n = len(ratings)
+    if n < 2:
+        return ratings.copy()
+    k = k or getattr(settings, 'RATING_ELO_K', 32)
+
+    # Self-pairs contribute S - E = 0.5 - 0.5, so the diagonal needs no masking
+    surplus = np.empty(n)
+    for rows in _row_blocks(n):
+        expected = 1.0 / (1.0 + 10.0 ** ((ratings[None, :] - ratings[rows, None]) / 400.0))
+        surplus[rows] = (_actual_scores(ranks, rows) - expected).sum(axis=1)
+    return ratings + k / (n - 1) * surplus
+
+
+def glicko2(ratings, deviations, volatilities, ranks, tau=None):
+    """Return new (ratings, deviations, volatilities) for one session"""
+    ratings = np.asarray(ratings, dtype=float)
+    deviations = np.asarray(deviations, dtype=float)
+    volatilities = np.asarray(volatilities, dtype=float)
+    ranks = np.asarray(ranks)
+    n = len(ratings)
+    if n < 2:
+        return ratings.copy(), deviations.copy(), volatilities.copy()
+    tau = tau or getattr(settings, 'RATING_GLICKO2_TAU', 0.5)
+
+    mu = (ratings - DEFAULT_RATING) / GLICKO2_SCALE
+    phi = deviations / GLICKO2_SCALE
+    g = 1.0 / np.sqrt(1.0 + 3.0 * phi ** 2 / np.pi ** 2)
+
+    information = np.empty(n)
+    surplus = np.empty(n)
+    for rows in _row_blocks(n):
+        expected = 1.0 / (1.0 + np.exp(-g[None, :] * (mu[rows, None] - mu[None, :])))
+        information[rows] = (g[None, :] ** 2 * expected * (1.0 - expected)).sum(axis=1)
+        surplus[rows] = (g[None, :] * (_actual_scores(ranks, rows) - expected)).sum(axis=1)
+    # Nobody plays themselves: drop the diagonal's E = 0.5 term (its S - E is already 0)
+    information -= g ** 2 * 0.25
+
+    variance = 1.0 / information
+    delta = variance * surplus
+    sigma = _glicko2_volatility(phi, volatilities, variance, delta, tau)
+
+    phi_star = np.sqrt(phi ** 2 + sigma ** 2)
+    new_phi = 1.0 / np.sqrt(1.0 / phi_star ** 2 + information)
+    new_mu = mu + new_phi ** 2 * surplus
+    return (
+        new_mu * GLICKO2_SCALE + DEFAULT_RATING,
+        np.minimum(new_phi * GLICKO2_SCALE, DEFAULT_DEVIATION),
+        sigma
+    )
+
+
+def _glicko2_volatility(phi, sigma, variance, delta, tau):
+    """Step 5 of Glicko-2 (Illinois algorithm), run for every player at once"""
+    a = np.log(sigma ** 2)
+
+    def f(x):
+        ex = np.exp(x)
+        return (
+            ex * (delta ** 2 - phi ** 2 - variance - ex) / (2.0 * (phi ** 2 + variance + ex) ** 2)
+            - (x - a) / tau ** 2
+        )
+
+    A = a.copy()
+    big = delta ** 2 > phi ** 2 + variance
+    B = np.where(big, np.log(np.maximum(delta ** 2 - phi ** 2 - variance, np.finfo(float).tiny)), a - tau)
+    # Step B down until f(B) < 0 where delta is small
+    f_B = f(B)
+    for _ in range(MAX_ITERATIONS):
+        pending = ~big & (f_B >= 0)
+        if not pending.any():
+            break
+        B = np.where(pending, B - tau, B)
+        f_B = f(B)
+
+    f_A = f(A)
+    for _ in range(MAX_ITERATIONS):
+        active = np.abs(B - A) > CONVERGENCE_TOLERANCE
+        if not active.any():
+            break
+        C = A + (A - B) * f_A / (f_B - f_A)
+        f_C = f(C)
+        swap = f_C * f_B <= 0
+        A = np.where(active, np.where(swap, B, A), A)
+        f_A = np.where(active, np.where(swap, f_B, f_A / 2.0), f_A)
+        B = np.where(active, C, B)
+        f_B = np.where(active, f_C, f_B)
+    return np.exp(A / 2.0)
+
+
+def rate(profiles, ranks, system=None):
+    """Apply one session's result to the given profiles in place"""
+    system = system or getattr(settings, 'RATING_SYSTEM', 'glicko2')
+    ratings = [profile.rating for profile in profiles]
+    if system == 'elo':
+        new_ratings = elo(ratings, ranks)
+    elif system == 'glicko2':
+        new_ratings, deviations, volatilities = glicko2(
+            ratings,
+            [profile.rating_deviation for profile in profiles],
+            [profile.rating_volatility for profile in profiles],
+            ranks
+        )
+        for profile, deviation, volatility in zip(profiles, deviations, volatilities):
+            profile.rating_deviation = float(deviation)
+            profile.rating_volatility = float(volatility)
+    else:
+        raise ValueError(f"Unknown rating system: {system}")
+
+    for profile, rating in zip(profiles, new_ratings):
+        profile.rating = max(0, int(round(rating)))
+
+
+def standing_ranks(participations):
+    """Competition ranks ("1224") of participations sorted best first; ties share a rank"""
+    ranks = []
+    previous = None
+    for position, participation in enumerate(participations, 1):
+        key = (participation.problems_solved, participation.total_time)
+        ranks.append(ranks[-1] if key == previous else position)
+        previous = key
+    return ranks
@@ -0,0 +1,38 @@
+"""Shared Redis connection for application data (queues, caches, leaderboards)"""
+import asyncio
+import threading
+import weakref
+
+import redis
+import redis.asyncio
+from django.conf import settings
+
+_client = None
+_client_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_redis():
+    """Return the process-wide Redis client"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = redis.Redis.from_url(
+                getattr(settings, 'REDIS_URL', 'redis://127.0.0.1:6379/0'),
+                socket_timeout=5,
+                socket_connect_timeout=1,
+            )
+        return _client
+
+
+def get_async_redis():
+    """Return the asyncio Redis client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = redis.asyncio.Redis.from_url(
+            getattr(settings, 'REDIS_URL', 'redis://127.0.0.1:6379/0'),
+            socket_timeout=5,
+            socket_connect_timeout=1,
+        )
+    return client
@@ -3,6 +3,7 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/session/(?P<session_id>[^/]+)/$', consumers.SessionConsumer.as_asgi()),
+    re_path(r'ws/user/$', consumers.UserConsumer.as_asgi()),
     re_path(r'ws/test/(?P<session_id>\w+)/$', consumers.SimpleTestConsumer.as_asgi()),
 
 ]
\ No newline at end of file
@@ -0,0 +1,298 @@
+"""
+Sandbox launcher process used by the judge.
+
+This script is started with ``python -I -S`` and must only depend on the
+standard library. It reads one JSON job per line on stdin, forks a sandboxed
+child for it, announces the child's pid and then writes one JSON result per
+line on stdout.
+
+Because the launcher is a small, already initialised interpreter, Python
+submissions are executed directly in the forked child and skip interpreter
+startup. Other languages are exec'd from the child. Forking from this process
+instead of the Django process also keeps ``ru_maxrss`` of the child from
+inheriting the web worker's resident set size.
+
+The judge starts the launcher with a minimal environment, and every child
+replaces it with the job's ``env`` before running anything. At startup the
+launcher moves itself into a new, empty network namespace, so no child can
+reach Redis, the database or anything else over the network. Whether that
+worked is reported in the ready message.
+"""
+import ctypes
+import json
+import os
+import resource
+import select
+import signal
+import sys
+import time
+import traceback
+import types
+import warnings  # noqa: F401 - os.execvpe imports it lazily, after the child can no longer read the stdlib
+
+_job_counter = 0
+
+CLONE_NEWNET = 0x40000000
+
+
+def _write_file(path, value):
+    with open(path, 'w') as f:
+        f.write(value)
+
+
+def _read_int(path, default=0):
+    try:
+        with open(path) as f:
+            return int(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return default
+
+
+def _read_events(path):
+    events = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                key, _, value = line.partition(' ')
+                events[key] = int(value or 0)
+    except (OSError, ValueError):
+        pass
+    return events
+
+
+def _isolate_network():
+    """Move this process into a new network namespace with only a down loopback"""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        return libc.unshare(CLONE_NEWNET) == 0
+    except (OSError, AttributeError):
+        return False
+
+
+def _create_cgroup(root, job):
+    """Create a per-job cgroup v2 directory with memory and pid limits"""
+    global _job_counter
+    _job_counter += 1
+    path = os.path.join(root, f'job-{os.getpid()}-{_job_counter}')
+    try:
+        os.mkdir(path)
+        if job.get('memory'):
+            _write_file(os.path.join(path, 'memory.max'), str(job['memory']))
+            try:
+                _write_file(os.path.join(path, 'memory.swap.max'), '0')
+            except OSError:
+                pass
+        if job.get('pids'):
+            _write_file(os.path.join(path, 'pids.max'), str(job['pids']))
+    except OSError:
+        _remove_cgroup(path)
+        return None
+    return path
+
+
+def _remove_cgroup(path):
+    for _ in range(2):
+        try:
+            os.rmdir(path)
+            return
+        except FileNotFoundError:
+            return
+        except OSError:
+            try:
+                _write_file(os.path.join(path, 'cgroup.kill'), '1')
+            except OSError:
+                pass
+            time.sleep(0.01)
+
+
+def _redirect(fd, path, flags):
+    target = os.open(path, flags, 0o600)
+    if target != fd:
+        os.dup2(target, fd)
+        os.close(target)
+
+
+def _run_child(job, cgroup):
+    """Executed in the forked child; never returns"""
+    try:
+        os.setsid()
+        if cgroup:
+            _write_file(os.path.join(cgroup, 'cgroup.procs'), '0')
+        _redirect(0, job['stdin'], os.O_RDONLY)
+        _redirect(1, job['stdout'], os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        _redirect(2, job['stderr'], os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        max_fd = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+        os.closerange(3, max_fd if max_fd > 0 else 65536)
+        os.chdir(job['cwd'])
+
+        if job.get('gid') is not None:
+            os.setgroups([])
+            os.setgid(job['gid'])
+        if job.get('uid') is not None:
+            os.setuid(job['uid'])
+
+        used = resource.getrusage(resource.RUSAGE_SELF)
+        cpu = int(used.ru_utime + used.ru_stime + job['cpu']) + 1
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+        if job.get('fsize'):
+            resource.setrlimit(resource.RLIMIT_FSIZE, (job['fsize'], job['fsize']))
+        if job.get('address_space'):
+            resource.setrlimit(resource.RLIMIT_AS, (job['address_space'], job['address_space']))
+        for sig in (signal.SIGPIPE, signal.SIGXFSZ):
+            signal.signal(sig, signal.SIG_DFL)
+        os.environ.clear()
+        os.environ.update(job.get('env') or {})
+    except BaseException as e:
+        os.write(2, f'sandbox setup failed: {e}\n'.encode())
+        os._exit(126)
+
+    if job.get('argv'):
+        try:
+            os.execvpe(job['argv'][0], job['argv'], job.get('env') or {})
+        except OSError as e:
+            os.write(2, f'exec failed: {e}\n'.encode())
+        os._exit(127)
+
+    os._exit(_exec_python(job['source'], job.get('args', [])))
+
+
+def _exec_python(source_path, args=()):
+    """Run a Python source file as __main__ in this (already warm) interpreter"""
+    exit_code = 0
+    try:
+        with open(source_path, 'rb') as f:
+            code = compile(f.read(), os.path.basename(source_path), 'exec')
+        module = types.ModuleType('__main__')
+        module.__file__ = source_path
+        sys.modules['__main__'] = module
+        sys.argv = [os.path.basename(source_path), *args]
+        exec(code, module.__dict__)
+    except SystemExit as e:
+        if e.code is None:
+            exit_code = 0
+        elif isinstance(e.code, int):
+            exit_code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except BaseException:
+        traceback.print_exc()
+        exit_code = 1
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except BaseException:
+            exit_code = exit_code or 1
+    return exit_code
+
+
+def _wait(pid, wall, cgroup):
+    """Wait for the child, killing its process group once the wall clock runs out"""
+    deadline = time.monotonic() + wall
+    timed_out = False
+    try:
+        pidfd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        pidfd = None
+
+    try:
+        while True:
+            wpid, status, usage = os.wait4(pid, os.WNOHANG)
+            if wpid:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                timed_out = True
+                try:
+                    os.killpg(pid, signal.SIGKILL)
+                except OSError:
+                    pass
+                if cgroup:
+                    try:
+                        _write_file(os.path.join(cgroup, 'cgroup.kill'), '1')
+                    except OSError:
+                        pass
+                _, status, usage = os.wait4(pid, 0)
+                break
+            if pidfd is not None:
+                select.select([pidfd], [], [], remaining)
+            else:
+                time.sleep(min(remaining, 0.005))
+    finally:
+        if pidfd is not None:
+            os.close(pidfd)
+
+    # Reap anything the child left behind in its process group
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        pass
+    return status, usage, timed_out
+
+
+def run_job(job, announce):
+    cgroup = _create_cgroup(job['cgroup_root'], job) if job.get('cgroup_root') else None
+    started = time.monotonic()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            _run_child(job, cgroup)
+        except BaseException as e:
+            # Never fall back into the launcher loop from the child
+            os.write(2, f'sandbox failed: {e!r}\n'.encode())
+        os._exit(126)
+
+    # Lets the judge cancel the run by killing the child directly
+    announce(pid)
+
+    status, usage, timed_out = _wait(pid, job['wall'], cgroup)
+    result = {
+        'exit_code': os.WEXITSTATUS(status) if os.WIFEXITED(status) else None,
+        'signal': os.WTERMSIG(status) if os.WIFSIGNALED(status) else None,
+        'cpu': usage.ru_utime + usage.ru_stime,
+        'wall': time.monotonic() - started,
+        'maxrss': usage.ru_maxrss,
+        'timed_out': timed_out,
+        'oom_killed': False,
+    }
+    if cgroup:
+        peak = _read_int(os.path.join(cgroup, 'memory.peak'))
+        if peak:
+            result['maxrss'] = peak // 1024
+        result['oom_killed'] = _read_events(os.path.join(cgroup, 'memory.events')).get('oom_kill', 0) > 0
+        _remove_cgroup(cgroup)
+    return result
+
+
+def main():
+    reader = os.fdopen(os.dup(0), 'rb', buffering=0)
+    # The protocol pipes are only used through these private descriptors so
+    # that forked children can safely replace fds 0-2.
+    writer = os.dup(1)
+    os.dup2(os.open(os.devnull, os.O_RDWR), 0)
+    os.dup2(0, 1)
+    os.set_inheritable(reader.fileno(), False)
+    os.set_inheritable(writer, False)
+
+    def send(message):
+        os.write(writer, json.dumps(message).encode() + b'\n')
+
+    send({'ready': True, 'network_isolated': _isolate_network()})
+    buf = b''
+    while True:
+        chunk = reader.read(65536)
+        if not chunk:
+            break
+        buf += chunk
+        while b'\n' in buf:
+            line, buf = buf.split(b'\n', 1)
+            try:
+                result = run_job(json.loads(line), lambda pid: send({'started': pid}))
+            except Exception as e:
+                result = {'error': str(e)}
+            send(result)
+
+
+if __name__ == '__main__':
+    main()
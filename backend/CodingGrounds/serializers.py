@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db.models import Prefetch
 from django.contrib.auth import authenticate
 from .models import (
     CodingProfile,
@@ -74,13 +75,37 @@ class CodingProblemSerializer(serializers.ModelSerializer):
         model = CodingProblem
         fields = [
             'id', 'title', 'description', 'difficulty', 'created_by',
-            'time_limit', 'memory_limit', 'test_cases', 'tags'
+            'time_limit', 'memory_limit', 'test_cases', 'tags',
+            'checker', 'checker_epsilon'
         ]
-        read_only_fields = ['id']
+        # Custom checkers are set up with their source by staff, in the admin
+        read_only_fields = ['id', 'checker']
+
+    def get_difficulty(self, obj):
+        return obj.Difficulty(obj.difficulty).label
+
+    def validate(self, data):
+        checker = getattr(self.instance, 'checker', CodingProblem.Checker.TOKENS)
+        if checker == CodingProblem.Checker.CUSTOM and not self.instance.checker_source.strip():
+            raise serializers.ValidationError("A custom checker needs its source.")
+        return data
+
+class CodingProblemSummarySerializer(serializers.ModelSerializer):
+    """List view of a problem without description or test cases"""
+    difficulty = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CodingProblem
+        fields = ['id', 'title', 'difficulty']
+        read_only_fields = fields
 
     def get_difficulty(self, obj):
         return obj.Difficulty(obj.difficulty).label
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.only(*CodingProblemSummarySerializer.Meta.fields)
+
 class GameSessionSerializer(serializers.ModelSerializer):
     created_by = CodingProfileSerializer(read_only=True)
     participants = CodingProfileSerializer(many=True, read_only=True)
@@ -95,13 +120,66 @@ class GameSessionSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'start_time', 'end_time']
 
+    @staticmethod
+    def setup_eager_loading(queryset, prefix=''):
+        """Load everything this serializer touches, for sessions reached via prefix"""
+        return queryset.select_related(f'{prefix}created_by__user').prefetch_related(
+            Prefetch(f'{prefix}participants', queryset=CodingProfile.objects.select_related('user')),
+            f'{prefix}problems'
+        )
+
+class GameSessionSummarySerializer(serializers.ModelSerializer):
+    """List view of a session without nested participants or problems"""
+
+    class Meta:
+        model = GameSession
+        fields = [
+            'id', 'title', 'created_by', 'is_private', 'max_participants',
+            'is_active', 'start_time', 'end_time'
+        ]
+        read_only_fields = fields
+
 class BadgeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Badge
         fields = ['id', 'name', 'description', 'icon']
         read_only_fields = ['id']
 
-class SubmissionSerializer(serializers.ModelSerializer):
+class FieldProjectionMixin:
+    """Limits GET responses to the comma separated ``fields`` query parameter"""
+    # Columns that must stay loaded even when not rendered (e.g. pagination keys)
+    always_loaded = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = self.get_requested_fields(self.context.get('request'))
+        if requested is not None:
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+
+    @staticmethod
+    def get_requested_fields(request):
+        if request is None or request.method != 'GET':
+            return None
+        fields = request.query_params.get('fields')
+        if not fields:
+            return None
+        return {name.strip() for name in fields.split(',') if name.strip()}
+
+    @classmethod
+    def project(cls, queryset, request):
+        """Defer the columns of fields the caller didn't ask for"""
+        requested = cls.get_requested_fields(request)
+        if requested is None:
+            return queryset
+        skipped = [
+            field.name for field in cls.Meta.model._meta.concrete_fields
+            if not field.is_relation and not field.primary_key
+            and field.name not in requested and field.name not in cls.always_loaded
+        ]
+        return queryset.defer(*skipped)
+
+class SubmissionSerializer(FieldProjectionMixin, serializers.ModelSerializer):
     profile = CodingProfileSerializer(read_only=True)
     problem = CodingProblemSerializer(read_only=True)
     game_session = GameSessionSerializer(read_only=True)
@@ -110,13 +188,44 @@ class SubmissionSerializer(serializers.ModelSerializer):
         model = Submission
         fields = [
             'id', 'profile', 'problem', 'code', 'language',
-            'status', 'submitted_at', 'game_session'
+            'status', 'execution_time', 'memory_usage', 'results',
+            'submitted_at', 'game_session'
+        ]
+        read_only_fields = [
+            'id', 'profile', 'submitted_at', 'status',
+            'execution_time', 'memory_usage', 'results'
+        ]
+
+    always_loaded = ('submitted_at',)
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        queryset = queryset.select_related('profile__user', 'problem')
+        return GameSessionSerializer.setup_eager_loading(queryset, prefix='game_session__')
+
+class SubmissionSummarySerializer(FieldProjectionMixin, serializers.ModelSerializer):
+    """List view of a submission without code, results or nested sessions"""
+    problem = CodingProblemSummarySerializer(read_only=True)
+    always_loaded = ('submitted_at',)
+
+    class Meta:
+        model = Submission
+        fields = [
+            'id', 'problem', 'language', 'status', 'execution_time',
+            'memory_usage', 'submitted_at', 'game_session'
         ]
-        read_only_fields = ['id', 'profile', 'submitted_at', 'status']
+        read_only_fields = fields
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('problem').defer('code', 'results').defer(
+            *[f'problem__{field.name}' for field in CodingProblem._meta.concrete_fields
+              if field.name not in CodingProblemSummarySerializer.Meta.fields]
+        )
 
 class GameParticipationSerializer(serializers.ModelSerializer):
     profile = CodingProfileSerializer(read_only=True)
-    session = GameSessionSerializer(read_only=True)
+    session = GameSessionSerializer(source='game_session', read_only=True)
     
     class Meta:
         model = GameParticipation
@@ -126,6 +235,27 @@ class GameParticipationSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'profile', 'session', 'final_rank']
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        queryset = queryset.select_related('profile__user')
+        return GameSessionSerializer.setup_eager_loading(queryset, prefix='game_session__')
+
+class GameParticipationSummarySerializer(serializers.ModelSerializer):
+    """List view of a participation with the session summarized"""
+    session = GameSessionSummarySerializer(source='game_session', read_only=True)
+
+    class Meta:
+        model = GameParticipation
+        fields = [
+            'id', 'profile', 'session', 'problems_solved',
+            'total_time', 'score', 'is_ready', 'final_rank'
+        ]
+        read_only_fields = fields
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('game_session')
+
 class UserLoginSerializer(serializers.Serializer):
     username = serializers.CharField()
     password = serializers.CharField()
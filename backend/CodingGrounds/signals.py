@@ -0,0 +1,79 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_token
+from .membership import SessionMembership
+from .models import CodingProblem, CodingProfile, GameParticipation, GameSession
+from .problem_picker import invalidate_index
+
+
+def _forget_tokens(keys):
+    def forget():
+        for key in keys:
+            invalidate_token(key)
+
+    forget()
+    # A request racing this transaction can cache the old rows again until it commits
+    transaction.on_commit(forget)
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    _forget_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+def forget_changed_user_tokens(sender, instance, update_fields=None, **kwargs):
+    # Logins only touch last_login, which isn't cached
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    _forget_tokens(list(Token.objects.filter(user=instance).values_list('key', flat=True)))
+
+
+@receiver(post_save, sender=CodingProblem)
+@receiver(post_delete, sender=CodingProblem)
+def forget_problem_index(sender, **kwargs):
+    # Rebuilt on the next pick, problems change rarely
+    invalidate_index()
+
+
+def _add_members(session_id, profile_ids):
+    user_ids = list(CodingProfile.objects.filter(
+        pk__in=profile_ids, user__isnull=False
+    ).values_list('user_id', flat=True))
+    if user_ids:
+        transaction.on_commit(lambda: SessionMembership.add(session_id, user_ids))
+
+
+def _invalidate_members(session_id):
+    transaction.on_commit(lambda: SessionMembership.invalidate(session_id))
+
+
+@receiver(post_save, sender=GameParticipation)
+def cache_new_participant(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        _add_members(instance.game_session_id, [instance.profile_id])
+    elif update_fields is None:
+        # A full save could have moved the row to another profile or session
+        _invalidate_members(instance.game_session_id)
+
+
+@receiver(post_delete, sender=GameParticipation)
+def forget_removed_participant(sender, instance, **kwargs):
+    # Also sent per row by participants.remove()/clear() and cascades
+    _invalidate_members(instance.game_session_id)
+
+
+@receiver(m2m_changed, sender=GameSession.participants.through)
+def cache_added_participants(sender, instance, action, reverse, pk_set, **kwargs):
+    # participants.add() bulk-creates the rows without post_save
+    if action != 'post_add' or not pk_set:
+        return
+    if reverse:
+        for session_id in pk_set:
+            _add_members(session_id, [instance.pk])
+    else:
+        _add_members(instance.pk, pk_set)
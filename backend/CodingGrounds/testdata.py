@@ -0,0 +1,202 @@
+"""
+Content-addressed store for judge test data.
+
+Inputs and expected outputs are stored as files named by their SHA-256 under
+``JUDGE_TEST_DATA_DIR/objects``. A problem references its data through
+``CodingProblem.test_data``, which holds the hash of a manifest blob that lists
+each case's input and output. Identical files are stored once, and a changed
+test set gets a new manifest hash (so a new ``judge_version``).
+
+The judge points the sandbox's stdin straight at the input blob, and it reads
+the expected output back in chunks while comparing. Neither the database nor
+the web tier holds hidden test data, however large. ``CodingProblem.test_cases``
+keeps only the sample cases shown to players. A problem without a manifest is
+still judged against those inline cases. Only inline cases show their expected
+output in results.
+
+Load data with ``manage.py import_test_data``.
+"""
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+
+CHUNK_SIZE = 64 * 1024
+
+
+def render_input(value):
+    """Render a test case input the way it is fed to the program's stdin"""
+    if isinstance(value, str):
+        text = value
+    else:
+        text = json.dumps(value)
+    return text if text.endswith('\n') else text + '\n'
+
+
+class TestDataStore:
+    """Immutable blobs on local disk, addressed by their SHA-256"""
+
+    def __init__(self, root=None):
+        self.root = root or getattr(settings, 'JUDGE_TEST_DATA_DIR', None) or os.path.join(
+            tempfile.gettempdir(), 'judge-test-data'
+        )
+        os.makedirs(os.path.join(self.root, 'objects'), exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.root, 'objects', digest[:2], digest[2:])
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def put_stream(self, f):
+        """Store the contents of a binary file object, returning (digest, size)"""
+        digest = hashlib.sha256()
+        size = 0
+        fd, staging = tempfile.mkstemp(prefix='.staging-', dir=self.root)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            digest = digest.hexdigest()
+            path = self.path(digest)
+            if os.path.exists(path):
+                os.unlink(staging)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Not world-readable: the sandbox gets stdin opened for it and must not see outputs
+                os.chmod(staging, 0o440)
+                os.replace(staging, path)
+        except BaseException:
+            if os.path.exists(staging):
+                os.unlink(staging)
+            raise
+        return digest, size
+
+    def put_bytes(self, data):
+        return self.put_stream(io.BytesIO(data))
+
+    def open(self, digest):
+        return open(self.path(digest), 'rb')
+
+    def put_manifest(self, cases):
+        """
+        Store a manifest for cases given as dicts with 'input' and 'output'
+        digests and a 'format' ('text', or 'json' for structured expected
+        output). Returns the manifest digest.
+        """
+        for case in cases:
+            for key in ('input', 'output'):
+                if not self.exists(case[key]):
+                    raise ValueError(f"Unknown {key} blob: {case[key]}")
+        data = json.dumps({'version': 1, 'cases': cases}, sort_keys=True).encode()
+        return self.put_bytes(data)[0]
+
+    @lru_cache(maxsize=256)
+    def load_manifest(self, digest):
+        # Blobs never change, so a manifest can be cached forever
+        with self.open(digest) as f:
+            return tuple(StoredCase(self, case) for case in json.load(f)['cases'])
+
+    def put_inline_cases(self, test_cases):
+        """Move JSON test cases into the store, returning the manifest digest"""
+        cases = []
+        for test_case in test_cases:
+            expected = test_case.get('expected_output')
+            output = expected if isinstance(expected, str) else json.dumps(expected)
+            input_digest, input_size = self.put_bytes(render_input(test_case.get('input', '')).encode())
+            output_digest, output_size = self.put_bytes(output.encode())
+            cases.append({
+                'input': input_digest,
+                'input_size': input_size,
+                'output': output_digest,
+                'output_size': output_size,
+                'format': 'text' if isinstance(expected, str) else 'json'
+            })
+        return self.put_manifest(cases)
+
+
+class InlineCase:
+    """A test case kept as JSON on the problem row"""
+
+    def __init__(self, test_case):
+        self.test_case = test_case
+        expected = test_case.get('expected_output')
+        self.format = 'text' if isinstance(expected, str) else 'json'
+
+    def prepare_input(self, workdir, index):
+        path = os.path.join(workdir, f'input-{index}.txt')
+        with open(path, 'w') as f:
+            f.write(render_input(self.test_case.get('input', '')))
+        return path
+
+    def _expected_bytes(self):
+        expected = self.test_case.get('expected_output')
+        return (expected if self.format == 'text' else json.dumps(expected)).encode()
+
+    def open_expected(self):
+        return io.BytesIO(self._expected_bytes())
+
+    def prepare_expected(self, directory, index):
+        path = os.path.join(directory, f'expected-{index}.txt')
+        with open(path, 'wb') as f:
+            f.write(self._expected_bytes())
+        return path
+
+    def expected_preview(self):
+        return json.dumps(self.test_case.get('expected_output'))
+
+
+class StoredCase:
+    """A test case whose input and output live in the test data store"""
+
+    def __init__(self, store, entry):
+        self.store = store
+        self.input = entry['input']
+        self.output = entry['output']
+        self.format = entry.get('format', 'text')
+
+    def prepare_input(self, workdir, index):
+        # The sandbox opens its stdin before dropping privileges, so it reads the blob directly
+        return self.store.path(self.input)
+
+    def open_expected(self):
+        return self.store.open(self.output)
+
+    def prepare_expected(self, directory, index):
+        return self.store.path(self.output)
+
+    def expected_preview(self):
+        # Hidden tests: results must not give away any of the expected output
+        return None
+
+
+def load_cases(test_cases):
+    """Judge cases for a manifest digest or a list of JSON test cases"""
+    if isinstance(test_cases, str):
+        return get_test_data_store().load_manifest(test_cases)
+    return [InlineCase(test_case) for test_case in test_cases]
+
+
+def get_problem_cases(problem, stored=True):
+    """What the judge should run for a problem: its manifest, unless stored is False, or its inline cases"""
+    return (problem.test_data if stored else '') or problem.test_cases
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_test_data_store():
+    """Return the process-wide test data store"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TestDataStore()
+        return _store
@@ -1,3 +1,1052 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import addModuleCleanup, mock, skipIf
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .authentication import CachedTokenAuthentication
+from .build_cache import BuildCache
+from .checkers import _check_json, check_exact, check_float, get_problem_checker, iter_tokens, output_matches
+from .global_leaderboard import (
+    GLOBAL_KEY, get_board_version, get_tag_key, get_weekly_key, read_board, rebuild_boards, record_solve
+)
+from .heartbeat import HeartbeatWheel
+from .judge import Judge, JudgeError, SandboxPool, Verdict
+from .leaderboard import LiveLeaderboard, record_standing
+from .lifecycle import expire_session, sweep_sessions
+from .matchmaking import MatchmakingQueue
+from .membership import SessionMembership
+from .outbox import EventOutbox
+from .models import CodingProblem, CodingProfile, GameParticipation, GameSession, Submission
+from .pipeline import QUEUE_KEY, enqueue_submission, process_submission, record_verdict, requeue_pending
+from .problem_picker import pick_problems
+from .rankings import get_percentile
+from .testdata import TestDataStore
+from .verdict_cache import VerdictCache
+from .websocket_utils import WebSocketManager, encode_message
+from . import outbox as outbox_module, ratings, redis_client
+
+try:
+    import fakeredis
+except ImportError:  # test-only dependency, Redis-backed tests are skipped without it
+    fakeredis = None
+
+
+def setUpModule():
+    # Published events go nowhere: the real publisher thread would connect to Redis
+    patcher = mock.patch('CodingGrounds.websocket_utils.get_outbox')
+    patcher.start()
+    addModuleCleanup(patcher.stop)
+
+
+@skipIf(fakeredis is None, "fakeredis is not installed")
+class FakeRedisMixin:
+    """Points the shared Redis clients at an in-memory server"""
+
+    def setUp(self):
+        super().setUp()
+        self.redis_server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeRedis(server=self.redis_server)
+        patcher = mock.patch.object(redis_client, '_client', self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_async(self, coroutine):
+        loop = asyncio.new_event_loop()
+        redis_client._async_clients[loop] = fakeredis.FakeAsyncRedis(server=self.redis_server)
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+
+class ListQueryCountTests(TestCase):
+    """List endpoints must issue a constant number of queries as sessions grow"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='owner')
+        self.profile = CodingProfile.objects.create(user=self.user, display_name='owner')
+        self.problem = CodingProblem.objects.create(
+            title='Sum', description='Add numbers',
+            test_cases=[{'input': [1, 2], 'expected_output': 3}]
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.player_count = 0
+
+    def add_session(self, participants):
+        session = GameSession.objects.create(title='Race', created_by=self.profile)
+        session.problems.add(self.problem)
+        session.participants.add(self.profile)
+        for _ in range(participants):
+            self.player_count += 1
+            user = User.objects.create(username=f'player{self.player_count}')
+            session.participants.add(CodingProfile.objects.create(user=user, display_name=user.username))
+        Submission.objects.create(
+            profile=self.profile, problem=self.problem, code='print(3)',
+            language='python', game_session=session
+        )
+        return session
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assert_constant_queries(self, url):
+        self.add_session(participants=1)
+        small = self.count_queries(url)
+        expanded = self.count_queries(url + '?expand=1')
+        for _ in range(3):
+            self.add_session(participants=5)
+        self.assertEqual(self.count_queries(url), small)
+        self.assertEqual(self.count_queries(url + '?expand=1'), expanded)
+
+    def test_session_list(self):
+        self.assert_constant_queries('/api/sessions/')
+
+    def test_submission_list(self):
+        self.assert_constant_queries('/api/submissions/')
+
+    def test_participation_list(self):
+        self.assert_constant_queries('/api/participations/')
+        self.assertEqual(
+            len(self.client.get('/api/participations/').data),
+            GameParticipation.objects.filter(profile=self.profile).count()
+        )
+
+
+class ListSummaryTests(TestCase):
+    """List endpoints omit test cases and nested objects unless expanded"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='owner')
+        self.profile = CodingProfile.objects.create(user=self.user, display_name='owner')
+        self.problem = CodingProblem.objects.create(
+            title='Sum', description='Add numbers',
+            test_cases=[{'input': [1, 2], 'expected_output': 3}]
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_problem_lists(self):
+        for url in ('/api/problems/', '/api/solve/'):
+            self.assertEqual(
+                self.client.get(url).data,
+                [{'id': self.problem.id, 'title': 'Sum', 'difficulty': 'Easy'}]
+            )
+            self.assertIn('test_cases', self.client.get(url + '?expand=1').data[0])
+
+    def test_submission_list(self):
+        Submission.objects.create(profile=self.profile, problem=self.problem, code='print(3)', language='python')
+        row = self.client.get('/api/submissions/').data['results'][0]
+        self.assertNotIn('code', row)
+        self.assertEqual(row['problem'], {'id': self.problem.id, 'title': 'Sum', 'difficulty': 'Easy'})
+        self.assertIn('code', self.client.get('/api/submissions/?expand=1').data['results'][0])
+
+    def test_submission_history_pages(self):
+        for i in range(5):
+            Submission.objects.create(profile=self.profile, problem=self.problem, code=f'print({i})', language='python')
+        url, seen = '/api/submissions/?expand=1&page_size=2&fields=id,status,submitted_at', []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                data = self.client.get(url).data
+            self.assertFalse(any('"code"' in query['sql'] for query in queries.captured_queries))
+            self.assertTrue(all(set(row) == {'id', 'status', 'submitted_at'} for row in data['results']))
+            seen.extend(row['id'] for row in data['results'])
+            url = data['next']
+        self.assertEqual(seen, list(Submission.objects.order_by('-submitted_at').values_list('id', flat=True)))
+
+
+class SolveCounterTests(FakeRedisMixin, TestCase):
+    """Accepted verdicts bump counters in the database exactly once"""
+
+    def setUp(self):
+        super().setUp()
+        self.profile = CodingProfile.objects.create(user=User.objects.create(username='solver'), display_name='solver')
+        self.problem = CodingProblem.objects.create(title='Sum', description='Add numbers', test_cases=[])
+        self.session = GameSession.objects.create(start_time=timezone.now() - timedelta(seconds=30))
+        self.session.problems.add(self.problem)
+        self.participation = GameParticipation.objects.create(game_session=self.session, profile=self.profile)
+
+    def submit(self):
+        submission = Submission.objects.create(
+            profile=self.profile, problem=self.problem, code='print(3)',
+            language='python', game_session=self.session
+        )
+        record_verdict(submission, Verdict([{'status': Submission.Status.ACCEPTED}], 0.1, 1024))
+
+    def test_first_solve_counts_once(self):
+        # A stale in-memory profile must not overwrite the increment
+        self.submit()
+        self.profile.update_streak()
+        self.submit()
+        self.profile.refresh_from_db()
+        self.participation.refresh_from_db()
+        self.assertEqual(self.profile.problems_solved, 1)
+        self.assertEqual(self.participation.problems_solved, 1)
+        self.assertGreaterEqual(self.participation.total_time, 30)
+
+    def test_unstarted_session_rejects_submissions(self):
+        session = GameSession.objects.create()
+        session.problems.add(self.problem)
+        GameParticipation.objects.create(game_session=session, profile=self.profile)
+        client = APIClient()
+        client.force_authenticate(self.profile.user)
+        response = client.post(f'/api/solve/{self.problem.id}/submit/', {
+            'session_id': str(session.id), 'code': 'print(3)', 'language': 'python'
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Submission.objects.exists())
+
+        # A verdict that still lands on such a session is credited without a time
+        self.session = session
+        self.submit()
+        self.assertEqual(GameParticipation.objects.get(game_session=session).total_time, 0)
+
+    def test_session_ends_when_every_problem_is_solved(self):
+        second = CodingProblem.objects.create(title='Product', description='Multiply numbers', test_cases=[])
+        self.session.problems.add(second)
+        self.submit()
+        self.assertTrue(GameSession.objects.get(pk=self.session.pk).is_active)
+
+        self.problem = second
+        self.submit()
+        self.assertFalse(GameSession.objects.get(pk=self.session.pk).is_active)
+        self.participation.refresh_from_db()
+        self.assertEqual((self.participation.problems_solved, self.participation.final_rank), (2, 1))
+
+    def test_end_session_bulk_writes(self):
+        for rating, solved, total_time in ((1600, 0, 10), (1400, 2, 0), (1500, 1, 0)):
+            profile = CodingProfile.objects.create(
+                user=User.objects.create(username=f'p{rating}'), display_name=f'p{rating}', rating=rating
+            )
+            GameParticipation.objects.create(
+                game_session=self.session, profile=profile, problems_solved=solved, total_time=total_time
+            )
+        with CaptureQueriesContext(connection) as queries:
+            self.session.end_session()
+        # select, session update, three bulk updates, rank range, savepoints
+        self.assertLessEqual(len(queries), 13)
+        ranks = {
+            p.profile.display_name: (p.final_rank, p.score)
+            for p in self.session.participations.select_related('profile')
+        }
+        self.assertEqual(ranks, {'p1400': (1, 200), 'p1500': (2, 90), 'solver': (3, 0), 'p1600': (4, 0)})
+
+        # Global ranks match a full recompute
+        expected = sorted(CodingProfile.objects.values_list('rating', flat=True), reverse=True)
+        for profile in CodingProfile.objects.all():
+            self.assertEqual(profile.rank, expected.index(profile.rating) + 1)
+            self.assertEqual(get_percentile(profile)['rank'], profile.rank)
+
+        # The periodic rebuild agrees, and repairs ranks that drifted
+        CodingProfile.objects.update(rank=0)
+        call_command('rebuild_ranks', stdout=io.StringIO())
+        for profile in CodingProfile.objects.all():
+            self.assertEqual(profile.rank, expected.index(profile.rating) + 1)
+
+    def test_expired_session_ends_once(self):
+        GameSession.objects.filter(pk=self.session.pk).update(end_time=timezone.now() - timedelta(seconds=1))
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.assertTrue(expire_session(self.session.pk))
+        # The timer is cancelled and the end announced only after the commit
+        self.assertEqual(len(callbacks), 1)
+        self.assertIsNone(self.redis.zscore('session:timers', str(self.session.pk)))
+        self.assertFalse(expire_session(self.session.pk))
+        self.participation.refresh_from_db()
+        self.assertEqual(self.participation.final_rank, 1)
+        self.assertFalse(GameSession.objects.get(pk=self.session.pk).is_active)
+
+    def test_failed_ranking_leaves_session_active(self):
+        GameSession.objects.filter(pk=self.session.pk).update(end_time=timezone.now() - timedelta(seconds=1))
+        with mock.patch.object(GameSession, 'rank_participants', side_effect=RuntimeError('rating failed')):
+            with self.assertRaises(RuntimeError):
+                expire_session(self.session.pk)
+        self.assertTrue(GameSession.objects.get(pk=self.session.pk).is_active)
+
+        # The retried timer ends it, as does one for a session that ended unranked
+        self.assertTrue(expire_session(self.session.pk))
+        GameParticipation.objects.filter(pk=self.participation.pk).update(final_rank=None)
+        self.assertEqual(sweep_sessions(), (1, 1))
+        self.assertTrue(expire_session(self.session.pk))
+        self.participation.refresh_from_db()
+        self.assertEqual(self.participation.final_rank, 1)
+
+    def test_running_session_is_not_expired(self):
+        self.assertFalse(expire_session(self.session.pk))
+        self.assertTrue(GameSession.objects.get(pk=self.session.pk).is_active)
+
+
+class SessionMembershipTests(FakeRedisMixin, TestCase):
+    """The cached member set follows participation changes"""
+
+    def setUp(self):
+        super().setUp()
+        self.session = GameSession.objects.create()
+        self.first, self.second = (
+            CodingProfile.objects.create(user=User.objects.create(username=f'member{n}'), display_name=f'member{n}')
+            for n in range(2)
+        )
+
+    def is_member(self, profile):
+        return self.run_async(SessionMembership.is_member(self.session.id, profile.user_id))
+
+    def test_fill_racing_a_join_or_leave_is_discarded(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.session.participants.add(self.first)
+        version = self.run_async(SessionMembership.get_version(self.session.id))
+
+        # Joins after the connecting consumer read the database
+        with self.captureOnCommitCallbacks(execute=True):
+            self.session.add_participant(self.second)
+        self.assertFalse(self.run_async(SessionMembership.fill(self.session.id, [self.first.user_id], version)))
+        self.assertTrue(self.is_member(self.second))
+
+        version = self.run_async(SessionMembership.get_version(self.session.id))
+        user_ids = [self.first.user_id, self.second.user_id]
+        self.assertTrue(self.run_async(SessionMembership.fill(self.session.id, user_ids, version)))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.session.remove_participant(self.second)
+        # Dropped rather than trusted, the next connect reloads it
+        self.assertIsNone(self.is_member(self.second))
+        self.assertFalse(self.run_async(SessionMembership.fill(self.session.id, user_ids, version)))
+
+    def test_large_sessions_are_filled_in_chunks(self):
+        self.assertTrue(self.run_async(SessionMembership.fill(self.session.id, range(1, 10001), 0)))
+        self.assertTrue(self.run_async(SessionMembership.is_member(self.session.id, 10000)))
+        self.assertFalse(self.run_async(SessionMembership.is_member(self.session.id, 10001)))
+
+
+class LiveLeaderboardTests(FakeRedisMixin, TestCase):
+    @staticmethod
+    def standing(profile_id, problems_solved, total_time=0):
+        return SimpleNamespace(
+            profile=SimpleNamespace(id=profile_id, display_name=f'player{profile_id}'),
+            problems_solved=problems_solved, total_time=total_time, score=problems_solved * 100
+        )
+
+    def test_deltas_cover_moved_rows_of_large_sessions(self):
+        # Far more rows than a single unpack() in Lua can take
+        LiveLeaderboard.update(1, [self.standing(n, 1, n) for n in range(1, 10001)])
+        version = LiveLeaderboard.get_version(1)
+
+        new_version, rows = LiveLeaderboard.move(1, self.standing(0, 2))
+        self.assertEqual(new_version, version + 1)
+        self.assertEqual(len(rows), 10001)
+        self.assertEqual([row['profile_id'] for row in rows[:2]], [0, 1])
+        self.assertEqual([row['rank'] for row in rows[-2:]], [10000, 10001])
+
+        # Dropping one row only reports the rows below it
+        new_version, rows = LiveLeaderboard.move(1, self.standing(10000, 1, 0))
+        self.assertEqual(new_version, version + 2)
+        self.assertEqual([(row['profile_id'], row['rank']) for row in rows[:2]], [(10000, 2), (1, 3)])
+        self.assertEqual(len(rows), 10000)
+
+        new_version, rows = LiveLeaderboard.remove(1, 0)
+        self.assertEqual(new_version, version + 3)
+        self.assertEqual(len(rows), 10000)
+        self.assertEqual(rows[0], dict(LiveLeaderboard.to_row(self.standing(10000, 1, 0)), rank=1))
+        self.assertIsNone(LiveLeaderboard.move(2, self.standing(0, 1)))
+
+    def test_missing_board_is_rebuilt_from_database(self):
+        session = GameSession.objects.create(start_time=timezone.now())
+        for n, solved in enumerate((1, 2)):
+            profile = CodingProfile.objects.create(user=User.objects.create(username=f'r{n}'), display_name=f'r{n}')
+            participation = GameParticipation.objects.create(game_session=session, profile=profile, problems_solved=solved)
+        with mock.patch('CodingGrounds.leaderboard.publish_delta') as publish:
+            record_standing(participation)
+        version, rows = publish.call_args[0][1:]
+        self.assertEqual(version, LiveLeaderboard.get_version(session.id))
+        self.assertEqual([(row['username'], row['rank']) for row in rows], [('r1', 1), ('r0', 2)])
+        self.assertEqual([row['username'] for row in LiveLeaderboard.read(session.id)], ['r1', 'r0'])
+
+
+class BuildCacheTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.cache = BuildCache(self.root, max_bytes=10)
+
+    def build(self, key, content):
+        workdir = tempfile.mkdtemp(dir=self.root, prefix='.work-')
+        with open(os.path.join(workdir, 'main'), 'w') as f:
+            f.write(content)
+        self.cache.store(key, workdir, ['main'])
+        return workdir
+
+    def test_hits_misses_and_eviction(self):
+        key = BuildCache.make_key('c', ['gcc', 'main.c'], 'int main(){}')
+        self.assertEqual(self.cache.restore(key, self.root), (False, None))
+        workdir = self.build(key, '12345')
+        self.assertEqual(self.cache.restore(key, workdir), (True, None))
+
+        # A compile error is cached like a build
+        self.cache.store('broken', workdir, [], error='main.c:1: error')
+        self.assertEqual(self.cache.restore('broken', workdir), (True, 'main.c:1: error'))
+
+        # Over budget, the least recently used build goes first
+        os.utime(os.path.join(self.root, key), (0, 0))
+        self.build('other', '1234567')
+        self.assertEqual(self.cache.restore(key, workdir), (False, None))
+        self.assertEqual(self.cache.restore('other', workdir), (True, None))
+        self.assertEqual(BuildCache.stats(), {'hits': 3, 'misses': 2, 'evictions': 1})
+
+
+# Root can drop to nobody like production does, anyone else judges as themselves
+SANDBOX_SETTINGS = (
+    {'JUDGE_SANDBOX_UID': 65534, 'JUDGE_SANDBOX_GID': 65534} if os.getuid() == 0
+    else {'JUDGE_ALLOW_UNSANDBOXED': True}
+)
+
+
+@override_settings(**SANDBOX_SETTINGS)
+class JudgeTests(FakeRedisMixin, SimpleTestCase):
+    """Runs real submissions in the sandbox, for every installed toolchain"""
+
+    SUM = [{'input': '1 2', 'expected_output': '3'}]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.pool = SandboxPool(2)
+        cls.cache_dir = tempfile.mkdtemp()
+        cls.judge = Judge(pool=cls.pool, build_cache=BuildCache(cls.cache_dir))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+        shutil.rmtree(cls.cache_dir, ignore_errors=True)
+        super().tearDownClass()
+
+    def run_code(self, code, language, test_cases=SUM, **kwargs):
+        return self.judge.run(code, language, test_cases, **kwargs)
+
+    def test_every_language(self):
+        sources = {
+            'python': ([], "a, b = map(int, input().split())\nprint(a + b)"),
+            'c': (['gcc'], '#include <stdio.h>\nint main(){int a,b;scanf("%d %d",&a,&b);printf("%d\\n",a+b);}'),
+            'cpp': (['g++'], '#include <iostream>\nint main(){int a,b;std::cin>>a>>b;std::cout<<a+b<<"\\n";}'),
+            'java': (['javac', 'java'], 'import java.util.*;\npublic class Main{public static void main(String[] x)'
+                                        '{Scanner s=new Scanner(System.in);System.out.println(s.nextInt()+s.nextInt());}}'),
+            'go': (['go'], 'package main\nimport "fmt"\nfunc main(){var a,b int;fmt.Scan(&a,&b);fmt.Println(a+b)}'),
+        }
+        for language, (tools, code) in sources.items():
+            with self.subTest(language=language):
+                missing = [tool for tool in tools if shutil.which(tool) is None]
+                if missing:
+                    self.skipTest(f"{', '.join(missing)} not installed")
+                verdict = self.run_code(code, language, time_limit=5, memory_limit=256)
+                self.assertEqual(verdict.status, Submission.Status.ACCEPTED, verdict.results)
+
+    def test_verdicts(self):
+        Status = Submission.Status
+        cases = [
+            ("print(4)", 'python', {}, Status.WRONG_ANSWER),
+            ("while True: pass", 'python', {'time_limit': 0.5}, Status.TIME_LIMIT_EXCEEDED),
+            ("x = bytearray(256 * 1024 * 1024)", 'python', {'memory_limit': 64}, Status.MEMORY_LIMIT_EXCEEDED),
+            ("1 / 0", 'python', {}, Status.RUNTIME_ERROR),
+            ("def f(:", 'python', {}, Status.COMPILATION_ERROR),
+            ("print(3)", 'brainfuck', {}, Status.COMPILATION_ERROR),
+        ]
+        if shutil.which('gcc'):
+            cases += [
+                ('int main(){int*p=0;return *p;}', 'c', {}, Status.RUNTIME_ERROR),
+                ('int main({', 'c', {}, Status.COMPILATION_ERROR),
+            ]
+        if shutil.which('g++'):
+            cases.append((
+                '#include <vector>\n#include <cstdio>\nint main(){std::vector<char> v(256<<20,1);printf("%d",v.back());}',
+                'cpp', {'memory_limit': 64}, Status.MEMORY_LIMIT_EXCEEDED
+            ))
+        for code, language, kwargs, expected in cases:
+            with self.subTest(code=code):
+                self.assertEqual(self.run_code(code, language, **kwargs).status, expected)
+
+    @mock.patch.dict(os.environ, {'SECRET_KEY': 'leaked'})
+    def test_no_secrets_or_network(self):
+        verdict = self.run_code("import os\nprint(sorted(os.environ))", 'python', [
+            {'input': '', 'expected_output': "['GOCACHE', 'HOME', 'LANG', 'PATH']"}
+        ])
+        self.assertEqual(verdict.status, Submission.Status.ACCEPTED, verdict.results)
+
+        # Only root can create the network namespace
+        if shutil.which('gcc') and os.getuid() == 0:
+            code = (
+                '#include <stdio.h>\n#include <errno.h>\n#include <arpa/inet.h>\n#include <sys/socket.h>\n'
+                'int main(){struct sockaddr_in a={0};a.sin_family=AF_INET;a.sin_port=htons(6379);'
+                'a.sin_addr.s_addr=htonl(INADDR_LOOPBACK);int s=socket(AF_INET,SOCK_STREAM,0);'
+                'printf("%d\\n",connect(s,(struct sockaddr*)&a,sizeof a)<0&&errno==ENETUNREACH);}'
+            )
+            verdict = self.run_code(code, 'c', [{'input': '', 'expected_output': '1'}])
+            self.assertEqual(verdict.status, Submission.Status.ACCEPTED, verdict.results)
+
+        # Launchers themselves start without this process's environment
+        pool = SandboxPool(1)
+        try:
+            with pool.acquire() as launcher:
+                with open(f'/proc/{launcher.process.pid}/environ') as f:
+                    self.assertNotIn('SECRET_KEY', f.read())
+        finally:
+            pool.close()
+
+    def test_first_failure_cancels_the_rest(self):
+        code = "import time\nif input() == 'slow':\n    time.sleep(5)\nprint(1)"
+        test_cases = [{'input': 'fast', 'expected_output': '2'}] + [{'input': 'slow', 'expected_output': '1'}] * 3
+        started = time.monotonic()
+        verdict = self.run_code(code, 'python', test_cases)
+        self.assertLess(time.monotonic() - started, 4)
+        self.assertEqual(verdict.status, Submission.Status.WRONG_ANSWER)
+        self.assertEqual([r['status'] for r in verdict.results[1:]], [Submission.Status.PENDING] * 3)
+
+        # Practice runs report every case
+        verdict = self.run_code("print(1)", 'python', test_cases, run_all=True)
+        self.assertEqual([r['match'] for r in verdict.results], [False, True, True, True])
+
+
+class PipelineTests(FakeRedisMixin, TestCase):
+    """Submissions are queued, judged in the background and memoized"""
+
+    def setUp(self):
+        super().setUp()
+        self.profile = CodingProfile.objects.create(user=User.objects.create(username='coder'), display_name='coder')
+        self.problem = CodingProblem.objects.create(
+            title='Sum', description='Add numbers', test_cases=[{'input': '1 2', 'expected_output': '3'}]
+        )
+
+    def submit(self, language='python'):
+        return Submission.objects.create(profile=self.profile, problem=self.problem, code='print(3)', language=language)
+
+    def test_submissions_are_queued_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            submission = self.submit()
+            enqueue_submission(submission.id)
+        self.assertEqual(self.redis.llen(QUEUE_KEY), 0)
+        callbacks[0]()
+        self.assertEqual(self.redis.lrange(QUEUE_KEY, 0, -1), [str(submission.id).encode()])
+
+        # Workers starting up pick up anything still pending
+        self.assertEqual(requeue_pending(), 1)
+        self.assertEqual(self.redis.llen(QUEUE_KEY), 2)
+
+    @mock.patch('CodingGrounds.pipeline.sandbox_drops_privileges', return_value=True)
+    def test_identical_submissions_are_judged_once(self, _):
+        accepted = Verdict([{'status': Submission.Status.ACCEPTED}], 0.1, 1024)
+        with mock.patch('CodingGrounds.pipeline.run_submission', return_value=accepted) as run:
+            first = process_submission(self.submit().id)
+            # Language aliases share the cached verdict
+            second = process_submission(self.submit('py').id)
+            self.assertEqual(run.call_count, 1)
+
+            # New test cases change the judge_version, so nothing stale is served
+            self.problem.test_cases = [{'input': '2 2', 'expected_output': '4'}]
+            self.problem.save()
+            process_submission(self.submit().id)
+            self.assertEqual(run.call_count, 2)
+
+        for submission in (first, second):
+            submission.refresh_from_db()
+            self.assertEqual(submission.status, Submission.Status.ACCEPTED)
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.problems_solved, 1)
+
+    def test_practice_submissions_report_every_case(self):
+        client = APIClient()
+        client.force_authenticate(self.profile.user)
+        url = f'/api/solve/{self.problem.id}/submit/'
+        self.assertEqual(client.post(url, {'code': 'print(3)'}, format='json').status_code, 400)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(url, {'code': 'print(3)', 'practice': True}, format='json')
+        self.assertEqual(response.status_code, 202)
+        submission_id = int(self.redis.rpop(QUEUE_KEY))
+        self.assertEqual(submission_id, response.data['submission_id'])
+
+        accepted = Verdict([{'status': Submission.Status.ACCEPTED}], 0.1, 1024)
+        with mock.patch('CodingGrounds.pipeline.run_submission', return_value=accepted) as run, \
+                mock.patch('CodingGrounds.pipeline.WebSocketManager.notify_user') as notify:
+            submission = process_submission(submission_id)
+        self.assertIsNone(submission.game_session_id)
+        self.assertTrue(run.call_args.kwargs['run_all'])
+        self.assertEqual(notify.call_args[0][:2], (self.profile.user_id, 'verdict'))
+
+    def test_verdict_cache_keys(self):
+        cache = VerdictCache()
+        self.assertNotEqual(
+            cache.make_key(self.problem, 'python', 'print(3)'),
+            cache.make_key(self.problem, 'python', 'print(3)', run_all=True)
+        )
+        # Load dependent verdicts are always re-judged
+        cache.set(self.problem, 'python', 'while 1: pass', Verdict([{'status': Submission.Status.TIME_LIMIT_EXCEEDED}]))
+        self.assertIsNone(cache.get(self.problem, 'python', 'while 1: pass'))
+        cache.set(self.problem, 'python', 'print(4)', Verdict([{'status': Submission.Status.WRONG_ANSWER}], 0.1, 10))
+        self.assertEqual(cache.get(self.problem, 'python3', 'print(4)').status, Submission.Status.WRONG_ANSWER)
+
+
+class GlobalBoardTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.problems = [
+            CodingProblem.objects.create(title=f'p{n}', description='', test_cases=[], tags=tags)
+            for n, tags in enumerate((['dp'], ['dp', 'graphs']))
+        ]
+        self.profiles = [
+            CodingProfile.objects.create(user=User.objects.create(username=name), display_name=name)
+            for name in ('ann', 'bob', 'cat')
+        ]
+
+    def solve(self, profile, problem, days_ago=0):
+        submission = Submission.objects.create(
+            profile=profile, problem=problem, code='', language='python', status=Submission.Status.ACCEPTED
+        )
+        Submission.objects.filter(pk=submission.pk).update(submitted_at=timezone.now() - timedelta(days=days_ago))
+        submission.refresh_from_db()
+        record_solve(submission)
+
+    def board(self, key):
+        return [(row['rank'], row['username'], row['problems_solved']) for row in read_board(key)['results']]
+
+    def test_boards_match_a_rebuild(self):
+        ann, bob, cat = self.profiles
+        version = get_board_version(GLOBAL_KEY)
+        self.solve(ann, self.problems[0])
+        self.solve(ann, self.problems[1])
+        self.solve(bob, self.problems[1])
+        self.solve(cat, self.problems[0], days_ago=8)
+        self.assertEqual(get_board_version(GLOBAL_KEY), version + 4)
+
+        boards = {
+            GLOBAL_KEY: [(1, 'ann', 2), (2, 'bob', 1), (2, 'cat', 1)],
+            get_weekly_key(): [(1, 'ann', 2), (2, 'bob', 1)],
+            get_tag_key('graphs'): [(1, 'ann', 1), (1, 'bob', 1)],
+        }
+        for key, expected in boards.items():
+            self.assertEqual(sorted(self.board(key)), expected)
+
+        rebuild_boards()
+        for key, expected in boards.items():
+            self.assertEqual(sorted(self.board(key)), expected)
+        self.assertEqual(read_board(GLOBAL_KEY, page=2, page_size=2)['results'][0]['rank'], 2)
+
+
+class HeartbeatWheelTests(SimpleTestCase):
+    class Consumer:
+        session_id = 'test'
+
+        def __init__(self, last_ping):
+            self.last_ping = last_ping
+            self.frames = []
+
+        async def send(self, text_data):
+            self.frames.append(json.loads(text_data))
+
+    def test_only_quiet_connections_get_heartbeats(self):
+        async def scenario():
+            wheel = HeartbeatWheel(interval=30, slots=3)
+            quiet, chatty = self.Consumer(0), self.Consumer(time.monotonic())
+            wheel.register(quiet)
+            wheel.register(chatty)
+            wheel._task.cancel()
+            # Registered just behind the hand, so they come up after a full interval
+            self.assertEqual(wheel.buckets[-1], {quiet, chatty})
+            await wheel._beat(wheel.buckets[-1])
+            wheel.unregister(quiet)
+            return quiet.frames, chatty.frames, len(wheel)
+
+        quiet, chatty, remaining = asyncio.run(scenario())
+        self.assertEqual([frame['type'] for frame in quiet], ['heartbeat'])
+        self.assertEqual((chatty, remaining), ([], 1))
+
+
+class EncodeOnceTests(SimpleTestCase):
+    def test_events_are_encoded_once_per_group(self):
+        data = {'type': 'verdict', 'submission_id': 1, 'profile_id': 2, 'status': 'accepted', 'results': [1.5, 'é']}
+        self.assertEqual(json.loads(encode_message(data)), data)
+        self.assertNotIn(' ', encode_message({'a': [1, 2]}))
+
+        outbox = mock.Mock()
+        with mock.patch('CodingGrounds.websocket_utils.get_outbox', return_value=outbox):
+            WebSocketManager.notify_session_update('7', 'verdict', dict(data))
+            # Invalid events never reach the channel layer
+            WebSocketManager.notify_session_update('7', 'verdict', {'type': 'verdict'})
+        outbox.put.assert_called_once()
+        group_name, event = outbox.put.call_args[0]
+        self.assertEqual((group_name, event['type']), ('session_7', 'session_verdict'))
+        self.assertEqual(json.loads(event['text'])['results'], data['results'])
+
+
+class RatingTests(TestCase):
+    """Session ratings treat a ranking as pairwise games"""
+
+    def test_glicko2_matches_reference_example(self):
+        # Glickman's worked example: the 1500 player beats 1400, loses to 1550 and 1700
+        rating, deviation, volatility = ratings.glicko2(
+            [1500, 1400, 1550, 1700], [200, 30, 100, 300], [0.06] * 4, [3, 4, 2, 1]
+        )
+        self.assertAlmostEqual(rating[0], 1464.06, places=1)
+        self.assertAlmostEqual(deviation[0], 151.52, places=1)
+        self.assertAlmostEqual(volatility[0], 0.05999, places=4)
+
+    def test_elo_blocks_and_ties(self):
+        with self.settings(RATING_BLOCK_SIZE=3):
+            new = ratings.elo([1500] * 5, [1, 2, 2, 4, 5])
+        self.assertAlmostEqual(new.sum(), 7500)
+        self.assertEqual(new[1], new[2])
+        self.assertTrue((new[:-1] >= new[1:]).all())
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Token lookups are cached until the token or its user changes"""
+
+    url = '/api/participations/'
+
+    def setUp(self):
+        self.user = User.objects.create(username='owner')
+        CodingProfile.objects.create(user=self.user, display_name='owner')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_cached_request_skips_auth_queries(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        tables = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('authtoken_token', tables)
+        self.assertNotIn('"auth_user"', tables)
+        self.assertNotIn('"CodingGrounds_codingprofile"', tables)
+        self.assertEqual(self.client.get('/api/auth/me/').data['user']['username'], 'owner')
+
+    def test_cached_profile_loads_in_one_query(self):
+        user, _ = CachedTokenAuthentication().authenticate_credentials(self.token.key)
+        profile = user.coding_profile
+        with self.assertNumQueries(1):
+            self.assertEqual((profile.display_name, profile.rating, profile.bio), ('owner', 1500, ''))
+
+        # Other deferred loads keep Django's field by field behaviour
+        profile = CodingProfile.objects.only('id').get(user=self.user)
+        with self.assertNumQueries(2):
+            profile.display_name, profile.bio
+
+    def test_deactivation_and_deletion_invalidate(self):
+        self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+        self.user.is_active = True
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.token.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_tokens_are_forgotten_again_after_commit(self):
+        key = self.token.key
+        for change in (self.user.save, self.token.delete):
+            with self.captureOnCommitCallbacks() as callbacks:
+                change()
+            # Whatever a concurrent request cached meanwhile is dropped once the change is visible
+            with mock.patch('CodingGrounds.signals.invalidate_token') as invalidate:
+                for callback in callbacks:
+                    callback()
+            invalidate.assert_called_once_with(key)
+
+
+class FlakyChannelLayer:
+    def __init__(self):
+        self.sent = []
+        self.failures = 2
+
+    async def group_send(self, group_name, event):
+        if group_name == 'session_1' and self.failures:
+            self.failures -= 1
+            raise OSError('connection reset')
+        await asyncio.sleep(0)
+        self.sent.append((group_name, event['n']))
+
+
+class EventOutboxTests(FakeRedisMixin, TestCase):
+    def make_outbox(self, **kwargs):
+        outbox = EventOutbox(**kwargs)
+        # Stopped while Redis is still the fake one
+        self.addCleanup(outbox.close)
+        return outbox
+
+    def test_retries_and_keeps_session_order(self):
+        layer = FlakyChannelLayer()
+        outbox = self.make_outbox(batch_size=3)
+        with mock.patch('CodingGrounds.outbox.get_channel_layer', return_value=layer):
+            for n in range(6):
+                outbox.put(f"session_{n % 2}", {'type': 'session_update', 'n': n})
+            self.assertTrue(outbox.flush())
+
+        self.assertEqual([n for group, n in layer.sent if group == 'session_1'], [1, 3, 5])
+        self.assertEqual([n for group, n in layer.sent if group == 'session_0'], [0, 2, 4])
+
+    def test_undelivered_events_are_spilled_and_recovered(self):
+        layer = FlakyChannelLayer()
+        layer.failures = 100
+        outbox = self.make_outbox(max_size=2, batch_size=10, retries=1, poll_interval=0.05)
+        with mock.patch('CodingGrounds.outbox.get_channel_layer', return_value=layer):
+            for n in range(3):
+                outbox.put('session_1', {'type': 'session_update', 'n': n})
+            outbox.close()
+            # Whatever could not be sent is kept in Redis
+            spilled = [json.loads(item) for item in self.redis.lrange(outbox_module.SPILL_KEY, 0, -1)]
+            self.assertEqual([event['n'] for _, event in spilled], [0, 1, 2])
+            self.assertEqual(layer.sent, [])
+
+            layer.failures = 0
+            outbox.put('session_0', {'type': 'session_update', 'n': 3})
+            deadline = time.monotonic() + 5
+            while len(layer.sent) < 4 and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        self.assertEqual([n for group, n in layer.sent if group == 'session_1'], [0, 1, 2])
+        self.assertEqual(self.redis.llen(outbox_module.SPILL_KEY), 0)
+        outbox.close()
+        stats = self.redis.hgetall(outbox_module.STATS_KEY)
+        self.assertEqual(int(stats[b'sent']), 4)
+        # Held events are retried while the channel layer is still down
+        self.assertGreaterEqual(int(stats[b'recovered']), 3)
+        self.assertNotIn(b'dropped', stats)
+
+    def test_sessions_wait_for_their_spilled_events(self):
+        outbox = EventOutbox()
+        event = {'type': 'session_update'}
+        # Event 5 was spilled because the queue was full
+        outbox._spill([(5, 'session_1', dict(event, n=5))])
+        batch = [(3, 'session_1', dict(event, n=3)), (7, 'session_1', dict(event, n=7)), (8, 'session_0', dict(event, n=8))]
+        # Older events still go out directly, newer ones queue up behind the spilled one
+        self.assertEqual([item[2]['n'] for item in outbox._hold_back(batch)], [3, 8])
+        self.assertEqual([event['n'] for _, _, event in outbox._recover()], [5, 7])
+
+        # Once its spilled events are published the session is sent directly again
+        self.assertEqual(self.redis.hgetall(outbox_module.HELD_KEY), {})
+        self.assertEqual(len(outbox._hold_back([(9, 'session_1', dict(event, n=9))])), 1)
+        self.assertEqual(outbox._held, {})
+
+
+class MatchmakingQueueTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.queue = MatchmakingQueue(session_size=2, band_width=100, widen_interval=10, max_bands=3, tick=60)
+
+    async def enqueue(self, *tickets):
+        for profile_id, rating, difficulty in tickets:
+            await self.queue.add(profile_id, profile_id, rating, difficulty)
+        self.queue._task.cancel()
+
+    def test_bands_widen_with_waiting_time(self):
+        async def scenario():
+            await self.enqueue((1, 1500, 2), (2, 1750, 2), (3, 1520, 3), (4, 1990, 2), (5, 1540, 2))
+            first = await self.queue.match()
+            # After 25 seconds 1750 reaches three bands, 300 points either way
+            started = (await self.queue.get_ticket(2)).enqueued_at
+            later = await self.queue.match(started + 25)
+            return first, later, await self.queue.count()
+
+        first, later, waiting = self.run_async(scenario())
+        self.assertEqual([[t.profile_id for t in batch] for batch in first], [[1, 5]])
+        self.assertEqual([[t.profile_id for t in batch] for batch in later], [[2, 4]])
+        # Another difficulty is never matched, however long the wait
+        self.assertEqual(waiting, 1)
+        self.assertEqual(self.redis.zrange('matchmaking:band:3:15', 0, -1), [b'3'])
+
+    def test_newcomers_meet_players_who_waited(self):
+        async def scenario():
+            await self.enqueue((1, 1500, 1))
+            started = (await self.queue.get_ticket(1)).enqueued_at
+            self.assertEqual(await self.queue.match(started + 60), [])
+            # Nobody is looked at again until someone new arrives
+            self.assertEqual(self.redis.zscore('matchmaking:due', 1), float('inf'))
+            await self.enqueue((2, 1780, 1))
+            with mock.patch.object(self.queue, 'get_tickets', wraps=self.queue.get_tickets) as get_tickets:
+                batches = await self.queue.match(started + 60)
+            # Only the newcomer and the bands around it were read
+            self.assertEqual([call.args[0] for call in get_tickets.call_args_list], [[], [b'2'], [1]])
+            return [[t.profile_id for t in batch] for batch in batches]
+
+        self.assertEqual(self.run_async(scenario()), [[1, 2]])
+
+    def test_each_player_is_claimed_once(self):
+        async def scenario():
+            await self.enqueue((1, 1500, 1), (2, 1510, 1))
+            other = MatchmakingQueue(session_size=2, band_width=100)
+            # Both processes see the same tickets, only the first claim wins
+            batch = [await self.queue.get_ticket(1), await self.queue.get_ticket(2)]
+            claims = [await self.queue.claim(batch), await other.claim(batch)]
+
+            # A player who left and queued again is not matched on the old ticket
+            await self.enqueue((3, 1500, 1), (4, 1510, 1))
+            stale = [await self.queue.get_ticket(3), await self.queue.get_ticket(4)]
+            await self.queue.remove(4)
+            await self.queue.add(4, 4, 1510, 2)
+            self.queue._task.cancel()
+            return claims, await self.queue.claim(stale), await self.queue.count()
+
+        self.assertEqual(self.run_async(scenario()), ([True, False], False, 2))
+        # Claims and removals leave nothing behind in the bands
+        self.assertEqual(self.redis.zrange('matchmaking:band:1:15', 0, -1), [b'3'])
+        self.assertEqual(self.redis.zrange('matchmaking:band:2:15', 0, -1), [b'4'])
+
+    def test_stale_tickets_expire(self):
+        async def scenario():
+            await self.enqueue((1, 1500, 1))
+            ticket = await self.queue.get_ticket(1)
+            with mock.patch('CodingGrounds.matchmaking.WebSocketManager.notify_user') as notify:
+                await self.queue.match(ticket.enqueued_at + self.queue.ticket_ttl + 1)
+            return notify.call_args[0][:2], await self.queue.count()
+
+        self.assertEqual(self.run_async(scenario()), ((1, 'matchmaking_expired'), 0))
+        self.assertEqual(self.redis.keys('matchmaking:*'), [])
+
+
+class ProblemPickerTests(TestCase):
+    def test_picks_unsolved_problems_per_difficulty(self):
+        profile = CodingProfile.objects.create(user=User.objects.create(username='picker'), display_name='picker')
+        solved, fresh, hard = [
+            CodingProblem.objects.create(title=title, description='', test_cases=[], difficulty=difficulty)
+            for title, difficulty in (('solved', 1), ('fresh', 1), ('hard', 3))
+        ]
+        Submission.objects.create(
+            profile=profile, problem=solved, code='', language='python', status=Submission.Status.ACCEPTED
+        )
+        for _ in range(5):
+            self.assertEqual(pick_problems([profile.id], [3, 1]), [hard.id, fresh.id])
+        # Never the same problem twice, even when it's the only one left
+        self.assertEqual(sorted(pick_problems([profile.id], [1, 1, 1])), [solved.id, fresh.id])
+
+
+class ProblemPickerIndexTests(FakeRedisMixin, TestCase):
+    def test_finds_the_last_unsolved_problem(self):
+        profile = CodingProfile.objects.create(user=User.objects.create(username='picker'), display_name='picker')
+        problems = [
+            CodingProblem.objects.create(title=f"p{i}", description='', test_cases=[], difficulty=1)
+            for i in range(60)
+        ]
+        for problem in problems[1:]:
+            Submission.objects.create(
+                profile=profile, problem=problem, code='', language='python', status=Submission.Status.ACCEPTED
+            )
+        # Far more solved problems than a few random samples cover
+        for _ in range(5):
+            self.assertEqual(pick_problems([profile.id], [1]), [problems[0].id])
+        # Solved problems only once every problem of the pool is solved
+        picked = pick_problems([profile.id], [1, 1])
+        self.assertEqual(picked[0], problems[0].id)
+        self.assertIn(picked[1], {problem.id for problem in problems[1:]})
+
+
+class TestDataStoreTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = TestDataStore(self.root)
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+
+    def test_tokens_span_chunks(self):
+        tokens = list(iter_tokens(io.BytesIO(b'12 345\n  6789 0'), chunk_size=4))
+        self.assertEqual(tokens, [b'12', b'345', b'6789', b'0'])
+
+    def test_stored_cases_match_like_inline_ones(self):
+        manifest = self.store.put_inline_cases([
+            {'input': '1 2', 'expected_output': '3\n4'},
+            {'input': [1, 2], 'expected_output': [1, 2]},
+        ])
+        # Same content, same blobs and manifest
+        self.assertEqual(self.store.put_inline_cases([
+            {'input': '1 2', 'expected_output': '3\n4'},
+            {'input': [1, 2], 'expected_output': [1, 2]},
+        ]), manifest)
+        text_case, json_case = self.store.load_manifest(manifest)
+        with open(text_case.prepare_input(self.root, 0)) as f:
+            self.assertEqual(f.read(), '1 2\n')
+        # Stored cases are hidden, so results never show their expected output
+        self.assertIsNone(text_case.expected_preview())
+
+        output_path = f'{self.root}/output.txt'
+        for output, case, expected in (
+            (b'3 4\n', text_case, True),
+            (b'3 4 5', text_case, False),
+            (b'[1,2]', json_case, True),
+            (b'[2, 1]', json_case, False),
+        ):
+            with open(output_path, 'wb') as f:
+                f.write(output)
+            self.assertEqual(output_matches(output_path, case), expected, output)
+
+
+class CheckerTests(TestCase):
+    def test_builtin_checkers(self):
+        self.assertTrue(check_exact(io.BytesIO(b'1 2\n' * 5), io.BytesIO(b'1 2\n' * 5), chunk_size=3))
+        self.assertFalse(check_exact(io.BytesIO(b'1 2\n'), io.BytesIO(b'1 2'), chunk_size=3))
+        self.assertTrue(check_float(io.BytesIO(b'0.3333333 1e6 yes'), io.BytesIO(b'0.33333334 1000000.5 yes')))
+        self.assertFalse(check_float(io.BytesIO(b'0.33 1e6 yes'), io.BytesIO(b'0.3333 1000000 yes')))
+        self.assertFalse(check_float(io.BytesIO(b'nan 1'), io.BytesIO(b'nan 1 2')))
+
+    def test_mismatch_stops_reading(self):
+        class Endless(io.RawIOBase):
+            def readable(self):
+                return True
+
+            def readinto(self, buffer):
+                buffer[:] = b'7 ' * (len(buffer) // 2) + b' ' * (len(buffer) % 2)
+                return len(buffer)
+
+        # A program printing forever is rejected at its first wrong chunk
+        self.assertFalse(check_exact(Endless(), io.BytesIO(b'7 ' * 10)))
+        self.assertFalse(check_float(Endless(), io.BytesIO(b'7 7 8')))
+        self.assertFalse(_check_json(Endless(), io.BytesIO(b'[7, 7]')))
+
+    def test_long_tokens_are_compared_by_digest(self):
+        tokens = list(iter_tokens(io.BytesIO(b'ab abcdef abcdefgh x'), chunk_size=3, max_length=4))
+        self.assertEqual(tokens[0], b'ab')
+        self.assertEqual([token.length for token in tokens[1:3]], [6, 8])
+        self.assertEqual(tokens, list(iter_tokens(io.BytesIO(b' ab\nabcdef\tabcdefgh  x'), max_length=4)))
+        self.assertNotEqual(tokens, list(iter_tokens(io.BytesIO(b'ab abcdeg abcdefgh x'), max_length=4)))
+
+        # One huge token takes linear time, whether it matches or not
+        huge = b'9' * (16 * 1024 * 1024)
+        started = time.monotonic()
+        self.assertTrue(check_float(io.BytesIO(huge + b' 1.0'), io.BytesIO(huge + b' 1')))
+        self.assertFalse(check_float(io.BytesIO(huge), io.BytesIO(b'9')))
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_custom_checker_needs_source(self):
+        problem = CodingProblem(title='Sum', description='', test_cases=[], checker='custom', checker_source=' ')
+        with self.assertRaises(ValidationError):
+            problem.full_clean()
+        with self.assertRaises(JudgeError):
+            Judge(pool=mock.Mock(), build_cache=mock.Mock()).run(
+                "print(3)", 'python', [{'input': '', 'expected_output': '3'}], checker=get_problem_checker(problem)
+            )
+
+        # Players can't switch a problem to a checker that has no source
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='setter'))
+        response = client.post('/api/problems/', {
+            'title': 'Sum', 'description': 'Add numbers', 'test_cases': [], 'checker': 'custom'
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(CodingProblem.objects.get(pk=response.data['id']).checker, 'tokens')
+
+    def test_json_checker(self):
+        self.assertTrue(_check_json(io.BytesIO(b'{"a": [1,\n 2]}\n'), io.BytesIO(b'{"a": [1, 2]}')))
+        self.assertFalse(_check_json(io.BytesIO(b'{"a": [2, 1]}'), io.BytesIO(b'{"a": [1, 2]}')))
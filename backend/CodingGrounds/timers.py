@@ -0,0 +1,65 @@
+"""
+Delayed session timers kept in Redis.
+
+Every running session has an entry in the ``session:timers`` sorted set,
+scored by its ``end_time`` as a Unix timestamp. The timer service
+(``lifecycle.py``) reads due entries and claims each one with ZREM. Only
+the caller that actually removed the entry ends the session, so several
+services can share the set.
+"""
+import logging
+
+from redis.exceptions import RedisError
+
+from .redis_client import get_async_redis, get_redis
+
+logger = logging.getLogger(__name__)
+
+TIMERS_KEY = 'session:timers'
+BATCH_SIZE = 1000
+
+
+class SessionTimers:
+    """Redis sorted set of session ids scored by when they end"""
+
+    @staticmethod
+    def schedule(session_id, end_time):
+        try:
+            get_redis().zadd(TIMERS_KEY, {str(session_id): end_time.timestamp()})
+        except RedisError as e:
+            # The timer service picks the session up on its next startup sweep
+            logger.error(f"Error scheduling session end - Session: {session_id}, Error: {str(e)}")
+
+    @staticmethod
+    def schedule_many(end_times):
+        """Schedule {session_id: end_time} in pipelined batches"""
+        items = [(str(session_id), end_time.timestamp()) for session_id, end_time in end_times.items()]
+        pipe = get_redis().pipeline(transaction=False)
+        for start in range(0, len(items), BATCH_SIZE):
+            pipe.zadd(TIMERS_KEY, dict(items[start:start + BATCH_SIZE]))
+        pipe.execute()
+
+    @staticmethod
+    def cancel(session_id):
+        try:
+            get_redis().zrem(TIMERS_KEY, str(session_id))
+        except RedisError as e:
+            # A stale timer finds the session already ended and does nothing
+            logger.error(f"Error cancelling session timer - Session: {session_id}, Error: {str(e)}")
+
+    @staticmethod
+    async def due(now, limit):
+        """Session ids whose timers expired by ``now`` and the next pending deadline"""
+        pipe = get_async_redis().pipeline(transaction=False)
+        pipe.zrangebyscore(TIMERS_KEY, '-inf', now, start=0, num=limit)
+        pipe.zrangebyscore(TIMERS_KEY, f"({now}", '+inf', start=0, num=1, withscores=True)
+        due, upcoming = await pipe.execute()
+        return [member.decode() for member in due], upcoming[0][1] if upcoming else None
+
+    @staticmethod
+    async def claim(session_id):
+        return await get_async_redis().zrem(TIMERS_KEY, session_id) == 1
+
+    @staticmethod
+    async def retry(session_id, when):
+        await get_async_redis().zadd(TIMERS_KEY, {session_id: when})
@@ -0,0 +1,83 @@
+"""
+Memoized verdicts for byte-identical submissions.
+
+Verdicts are stored in Redis under (problem id, problem judge_version,
+language, code hash, judging mode). ``CodingProblem.judge_version`` changes
+whenever test cases or limits change, so stale entries are simply never
+looked up again and expire with their TTL.
+"""
+import hashlib
+import json
+import logging
+import threading
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from .judge import Verdict, normalize_language
+from .models import Submission
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Time limits depend on machine load, so those verdicts are always re-judged
+UNCACHEABLE_STATUSES = {
+    Submission.Status.PENDING,
+    Submission.Status.TIME_LIMIT_EXCEEDED,
+}
+
+
+class VerdictCache:
+    """Redis-backed cache of judge verdicts"""
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl or getattr(settings, 'JUDGE_VERDICT_CACHE_TTL', 24 * 60 * 60)
+
+    @staticmethod
+    def make_key(problem, language, code, run_all=False):
+        code_hash = hashlib.sha256(code.encode('utf-8', errors='surrogatepass')).hexdigest()
+        language = normalize_language(language) or (language or '').strip().lower()
+        mode = 'all' if run_all else 'first'
+        return f"verdict:{problem.id}:{problem.judge_version}:{language}:{mode}:{code_hash}"
+
+    def get(self, problem, language, code, run_all=False):
+        """Return the cached Verdict for this exact submission, or None"""
+        if not problem.judge_version:
+            return None
+        try:
+            raw = get_redis().get(self.make_key(problem, language, code, run_all))
+        except RedisError as e:
+            logger.error(f"Error reading verdict cache: {str(e)}")
+            return None
+        if raw is None:
+            return None
+
+        data = json.loads(raw)
+        return Verdict(data['results'], data['execution_time'], data['memory_usage'])
+
+    def set(self, problem, language, code, verdict, run_all=False):
+        """Remember a verdict unless it depends on machine load"""
+        if not problem.judge_version or verdict.status in UNCACHEABLE_STATUSES:
+            return
+        data = json.dumps({
+            'results': verdict.results,
+            'execution_time': verdict.execution_time,
+            'memory_usage': verdict.memory_usage,
+        })
+        try:
+            get_redis().set(self.make_key(problem, language, code, run_all), data, ex=self.ttl)
+        except RedisError as e:
+            logger.error(f"Error writing verdict cache: {str(e)}")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_verdict_cache():
+    """Return the process-wide verdict cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = VerdictCache()
+        return _cache
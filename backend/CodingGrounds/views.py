@@ -5,7 +5,7 @@ from django.http import HttpResponse, JsonResponse
 import requests
 import time
 import json
-import random
+import logging
 
 # Create your views here.
 from rest_framework import viewsets,status
@@ -25,9 +25,13 @@ from .serializers import (
     BadgeSerializer,
     CodingProfileSerializer,
     CodingProblemSerializer,
+    CodingProblemSummarySerializer,
     SubmissionSerializer,
+    SubmissionSummarySerializer,
     GameSessionSerializer,
+    GameSessionSummarySerializer,
     GameParticipationSerializer,
+    GameParticipationSummarySerializer,
     UserLoginSerializer
 )
 
@@ -35,10 +39,52 @@ from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 from django.db import models
 from .websocket_utils import WebSocketManager
+from .judge import run_submission
+from .pipeline import enqueue_submission, record_verdict
+from .verdict_cache import get_verdict_cache
+from .pagination import SubmissionCursorPagination
+from .problem_picker import MAX_SESSION_PROBLEMS, pick_problems
+from .rankings import get_percentile, publish_ratings
+from .global_leaderboard import (
+    GLOBAL_KEY,
+    ensure_built,
+    get_board_version,
+    get_tag_key,
+    get_weekly_key,
+    read_board
+)
+from .leaderboard import (
+    get_leaderboard_data,
+    get_leaderboard_version,
+    record_standing,
+    remove_standing,
+    reset_leaderboard
+)
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
 
 def mainView(request):
     return render(request,"coding-grounds-app.html")
 
+def expand_requested(request):
+    """List endpoints return summaries unless ?expand=1 is passed"""
+    return request.query_params.get('expand', '').lower() in ('1', 'true', 'yes')
+
+def requested_difficulties(data):
+    """One entry per problem to pick: a list of difficulties, or 'count' problems of any difficulty"""
+    difficulties = data.get('difficulties')
+    if difficulties is None:
+        difficulties = [None] * int(data.get('count', 1))
+    elif not isinstance(difficulties, list):
+        raise ValueError("difficulties must be a list")
+    if not 1 <= len(difficulties) <= MAX_SESSION_PROBLEMS:
+        raise ValueError(f"A session has between 1 and {MAX_SESSION_PROBLEMS} problems")
+    for difficulty in difficulties:
+        if difficulty is not None and difficulty not in CodingProblem.Difficulty.values:
+            raise ValueError(f"Invalid difficulty: {difficulty}")
+    return difficulties
+
 class UserRegistrationView(APIView):
     permission_classes = [AllowAny]
     
@@ -78,6 +124,7 @@ class UserRegistrationView(APIView):
         serializer = CodingProfileSerializer(data=request.data)
         if serializer.is_valid():
             profile = serializer.save()
+            publish_ratings([profile])
             token, _ = Token.objects.get_or_create(user=profile.user)
             return Response({
                 'token': token.key,
@@ -154,25 +201,58 @@ class CodingProfileView(viewsets.ModelViewSet):
             return CodingProfile.objects.filter(user=self.request.user)
         return super().get_queryset()
 
+    @action(detail=True)
+    def percentile(self, request, pk=None):
+        """Global rank and rating percentile of a profile"""
+        profile = self.get_object()
+        try:
+            return Response(get_percentile(profile))
+        except RedisError as e:
+            logger.error(f"Error reading rating index - Profile: {profile.id}, Error: {str(e)}")
+            return Response(
+                {"detail": "Rankings are temporarily unavailable"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+
 class CodingProblemView(viewsets.ModelViewSet):
     serializer_class = CodingProblemSerializer
     queryset = CodingProblem.objects.all()
     permission_classes = [IsAuthenticated]
 
+    def get_serializer_class(self):
+        if self.action == 'list' and not expand_requested(self.request):
+            return CodingProblemSummarySerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.get_serializer_class() is CodingProblemSummarySerializer:
+            queryset = CodingProblemSummarySerializer.setup_eager_loading(queryset)
+        return queryset
+
 class SubmissionView(viewsets.ModelViewSet):
     serializer_class = SubmissionSerializer
     queryset = Submission.objects.all()
     permission_classes = [IsAuthenticated]
+    pagination_class = SubmissionCursorPagination
+
+    def get_serializer_class(self):
+        if self.action == 'list' and not expand_requested(self.request):
+            return SubmissionSummarySerializer
+        return super().get_serializer_class()
 
     def get_queryset(self):
         """Only show submissions for the current user"""
-        return self.queryset.filter(profile=self.request.user.coding_profile)
+        queryset = self.queryset.filter(profile=self.request.user.coding_profile)
+        serializer_class = self.get_serializer_class()
+        queryset = serializer_class.setup_eager_loading(queryset)
+        return serializer_class.project(queryset, self.request)
 
     def list(self, request, *args, **kwargs):
-        """List all submissions for the current user"""
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        """List the current user's submissions, newest first, one page at a time"""
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     def retrieve(self, request, *args, **kwargs):
         """Get details of a specific submission"""
@@ -194,28 +274,24 @@ class GameSessionView(viewsets.ModelViewSet):
     def get_queryset(self):
         profile = self.request.user.coding_profile
         # Show sessions where user is either creator or participant
-        return GameSession.objects.filter(
+        queryset = GameSession.objects.filter(
             models.Q(created_by=profile) | 
             models.Q(participants=profile)
         ).distinct()
+        # Summaries and actions like join/ready only need the session row itself
+        if self.action in ('list', 'retrieve', 'update', 'partial_update') \
+                and self.get_serializer_class() is GameSessionSerializer:
+            queryset = GameSessionSerializer.setup_eager_loading(queryset)
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'list' and not expand_requested(self.request):
+            return GameSessionSummarySerializer
+        return super().get_serializer_class()
 
     def get_leaderboard_data(self, session):
         """Helper method to get leaderboard data"""
-        participants_data = []
-        for participation in GameParticipation.objects.filter(game_session=session).order_by('-problems_solved', 'total_time'):
-            minutes, seconds = divmod(participation.total_time, 60)
-            formatted_time = f"{minutes:02d}:{seconds:02d}"
-            
-            participant_data = {
-                'profile_id': participation.profile.id,
-                'username': participation.profile.display_name,
-                'problems_solved': participation.problems_solved,
-                'total_time': participation.total_time,
-                'formatted_time': formatted_time,
-                'score': participation.score
-            }
-            participants_data.append(participant_data)
-        return participants_data
+        return get_leaderboard_data(session)
     
     def create(self, request, *args, **kwargs):
         try:
@@ -284,6 +360,11 @@ class GameSessionView(viewsets.ModelViewSet):
             
             # Add as participant
             session.participants.add(profile)
+            if session.start_time:
+                record_standing(GameParticipation.objects.select_related('profile').get(
+                    game_session=session,
+                    profile=profile
+                ))
             
             # Notify other participants
             WebSocketManager.notify_session_update(pk, 'join', {
@@ -320,6 +401,8 @@ class GameSessionView(viewsets.ModelViewSet):
             )
         
         session.participants.remove(profile)
+        if session.start_time:
+            remove_standing(session.id, profile.id)
         WebSocketManager.notify_session_update(pk, 'leave', {
             'type': 'participant_left',
             'profile': CodingProfileSerializer(profile).data
@@ -347,7 +430,7 @@ class GameSessionView(viewsets.ModelViewSet):
             profile=profile
         )
         participation.is_ready = True
-        participation.save()
+        participation.save(update_fields=['is_ready'])
         
         # Check if all participants are ready
         all_ready = session.all_participants_ready()
@@ -386,31 +469,44 @@ class GameSessionView(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Select a random problem
-        problems = CodingProblem.objects.all()
-        if not problems.exists():
+        try:
+            difficulties = requested_difficulties(request.data)
+        except (TypeError, ValueError) as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Picked from the id index, only the chosen rows are loaded
+        problem_ids = pick_problems(
+            session.participations.values_list('profile_id', flat=True),
+            difficulties,
+            tag=request.data.get('tag')
+        )
+        if not problem_ids:
             return Response(
                 {"detail": "No problems available"}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        random_problem = random.choice(problems)
-        session.problems.clear()
-        session.problems.add(random_problem)
+        picked = CodingProblem.objects.in_bulk(problem_ids)
+        problems = [picked[problem_id] for problem_id in problem_ids]
+        session.problems.set(problems)
         
         session.is_active = True
         session.start_time = timezone.now()
         session.save()
+        reset_leaderboard(session)
         
+        problems_data = CodingProblemSerializer(problems, many=True).data
         WebSocketManager.notify_session_update(pk, 'start', {
             'type': 'session_started',
             'start_time': session.start_time.isoformat(),
-            'problem': CodingProblemSerializer(random_problem).data
+            'problem': problems_data[0],
+            'problems': problems_data
         })
         
         return Response({
             "detail": "Session started",
-            "problem": CodingProblemSerializer(random_problem).data
+            "problem": problems_data[0],
+            "problems": problems_data
         }, status=status.HTTP_200_OK)
     
     @action(detail=True)
@@ -438,16 +534,27 @@ class GameSessionView(viewsets.ModelViewSet):
     def leaderboard(self, request, pk=None):
         """Get leaderboard for this session"""
         session = self.get_object()
+        # Read the version first so the snapshot is never older than it
+        version = get_leaderboard_version(session)
         leaderboard_data = self.get_leaderboard_data(session)
-        return Response(leaderboard_data)
+        response = Response(leaderboard_data)
+        if version is not None:
+            response['X-Leaderboard-Version'] = str(version)
+        return response
 
 class GameParticipationView(viewsets.ModelViewSet):
     serializer_class = GameParticipationSerializer
     queryset = GameParticipation.objects.all()
     permission_classes = [IsAuthenticated]
 
+    def get_serializer_class(self):
+        if self.action == 'list' and not expand_requested(self.request):
+            return GameParticipationSummarySerializer
+        return super().get_serializer_class()
+
     def get_queryset(self):
-        return self.queryset.filter(profile=self.request.user.coding_profile)
+        queryset = self.queryset.filter(profile=self.request.user.coding_profile)
+        return self.get_serializer_class().setup_eager_loading(queryset)
 
 class SolveProblemView(viewsets.ModelViewSet):
     serializer_class = SubmissionSerializer
@@ -456,52 +563,19 @@ class SolveProblemView(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     http_method_names = ['get', 'post']  # Allow GET and POST for Swagger visibility
 
-    def coderunner(self, source_code, language, test_cases):
-        # Dummy implementation for testing
-
-        status_choices = [
-            Submission.Status.PENDING,
-            Submission.Status.ACCEPTED,
-            Submission.Status.WRONG_ANSWER,
-            Submission.Status.TIME_LIMIT_EXCEEDED,
-            Submission.Status.MEMORY_LIMIT_EXCEEDED,
-            Submission.Status.RUNTIME_ERROR,
-            Submission.Status.COMPILATION_ERROR
-        ]
-
-        final_results = []
-        for i, test_case in enumerate(test_cases):
-            # Randomly select a status
-            status = random.choice(status_choices)
-            
-            # Generate dummy output based on status
-            if status == Submission.Status.ACCEPTED:
-                output = json.dumps(test_case['expected_output'])
-                error = None
-            else:
-                output = "No output"
-                error = "Dummy error message" if status in [
-                    Submission.Status.RUNTIME_ERROR,
-                    Submission.Status.COMPILATION_ERROR
-                ] else None
-
-            final_results.append({
-                "test_case": i + 1,
-                "output": output,
-                "expected": json.dumps(test_case['expected_output']),
-                "match": status == Submission.Status.ACCEPTED,
-                "error": error,
-                "status": status,
-                "time": f"{random.uniform(0.1, 2.0):.2f}s",
-                "memory": f"{random.randint(100, 1000)}KB"
-            })
-
-        return final_results
+    def coderunner(self, source_code, language, test_cases, time_limit=1.0, memory_limit=128, run_all=False,
+                   checker=None):
+        """Judge source code against the test cases in the sandbox pool"""
+        return run_submission(source_code, language, test_cases, time_limit, memory_limit, run_all=run_all,
+                              checker=checker)
 
     def list(self, request):
         """List all problems available for solving"""
-        problems = CodingProblem.objects.all()
-        serializer = CodingProblemSerializer(problems, many=True)
+        if expand_requested(request):
+            serializer = CodingProblemSerializer(CodingProblem.objects.all(), many=True)
+        else:
+            problems = CodingProblemSummarySerializer.setup_eager_loading(CodingProblem.objects.all())
+            serializer = CodingProblemSummarySerializer(problems, many=True)
         return Response(serializer.data)
 
     @action(detail=True, methods=['get'])
@@ -515,6 +589,11 @@ class SolveProblemView(viewsets.ModelViewSet):
     def submit(self, request, problem_id=None):
         """Submit a solution for a problem"""
         problem = get_object_or_404(CodingProblem, id=problem_id)
+        profile = request.user.coding_profile
+        
+        # Practice runs outside any session and reports every test case
+        if str(request.data.get('practice', '')).lower() in ('1', 'true', 'yes'):
+            return self._judge(request, problem, profile, session=None)
         
         # Get session_id from request data
         session_id = request.data.get('session_id')
@@ -525,7 +604,6 @@ class SolveProblemView(viewsets.ModelViewSet):
             )
             
         session = get_object_or_404(GameSession, id=session_id)
-        profile = request.user.coding_profile
         
         # Check if user is a participant in the session
         if not session.participants.filter(id=profile.id).exists():
@@ -534,6 +612,13 @@ class SolveProblemView(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
+        # Only the session's own problems count towards it
+        if not session.problems.filter(id=problem.id).exists():
+            return Response(
+                {"detail": "Problem is not part of this session"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
         # Check if session is active
         if not session.is_active or (session.end_time and session.end_time < timezone.now()):
             return Response(
@@ -541,6 +626,15 @@ class SolveProblemView(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        if not session.start_time or session.start_time > timezone.now():
+            return Response(
+                {"detail": "Session hasn't started yet"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return self._judge(request, problem, profile, session)
+
+    def _judge(self, request, problem, profile, session):
         # Create submission
         submission = Submission.objects.create(
             profile=profile,
@@ -550,81 +644,28 @@ class SolveProblemView(viewsets.ModelViewSet):
             game_session=session
         )
         
-        # # Run the code
-        # result = self.coderunner(
-        #     submission.code, 
-        #     submission.language, 
-        #     problem.test_cases
-        # )
-        
-        # Dummy result with all test cases passing
-        result = [
-            {'status': Submission.Status.ACCEPTED, 'output': 'Test case 1 passed'},
-            {'status': Submission.Status.ACCEPTED, 'output': 'Test case 2 passed'},
-            {'status': Submission.Status.ACCEPTED, 'output': 'Test case 3 passed'}
-        ]
-
-        # Update submission status based on result
-        if all(r['status'] == Submission.Status.ACCEPTED for r in result):
-            submission.status = Submission.Status.ACCEPTED
-            
-            # Get the participation record
-            participation = GameParticipation.objects.get(
-                game_session=session,
-                profile=profile
-            )
-            
-            # Check if this is the first time this user solved this problem in this session
-            previous_accepted = Submission.objects.filter(
-                profile=profile,
-                problem=problem,
-                game_session=session,
-                status=Submission.Status.ACCEPTED
-            ).exclude(pk=submission.pk).exists()
-            
-            if not previous_accepted:
-                # Update participation statistics
-                participation.problems_solved += 1
-                
-                # Calculate time since session start
-                time_delta = submission.submitted_at - session.start_time
-                seconds = int(time_delta.total_seconds())
-                
-                # Add to total time (used for tie-breaking)
-                participation.total_time += seconds
-                participation.save()
-                
-                # End the session since someone solved it
-                session.end_time = timezone.now()
-                session.is_active = False
-                session.save()
-                
-                # Notify all participants of session end
-                WebSocketManager.notify_session_update(
-                    session_id,
-                    'end',
-                    {
-                        'type': 'session_end',
-                        'detail': "Session has ended - problem solved!",
-                        'winner': profile.display_name,
-                        'leaderboard': GameSessionView().get_leaderboard_data(session)
-                    }
-                )
-        else:
-            submission.status = Submission.Status.WRONG_ANSWER
+        # Byte-identical resubmissions reuse the earlier verdict
+        verdict = get_verdict_cache().get(problem, submission.language, submission.code, run_all=session is None)
+        if verdict is not None:
+            record_verdict(submission, verdict)
+            profile.update_streak()
+            return Response({
+                'submission_id': submission.id,
+                'status': submission.status,
+                'results': verdict.results,
+                'cached': True
+            }, status=status.HTTP_201_CREATED)
         
-        # Save the updated submission
-        submission.save()
+        # Judge asynchronously; the verdict is pushed over the session (or user) WebSocket
+        enqueue_submission(submission.id)
         
         # Update user profile
         profile.update_streak()
         
         return Response({
-            'submission': SubmissionSerializer(submission).data,
-            'result': result,
-            'session_ended': submission.status == Submission.Status.ACCEPTED,
-            'leaderboard': GameSessionView().get_leaderboard_data(session) if submission.status == Submission.Status.ACCEPTED else None
-        }, status=status.HTTP_201_CREATED)
+            'submission_id': submission.id,
+            'status': submission.status
+        }, status=status.HTTP_202_ACCEPTED)
 
     # Override standard methods to return 405
     def retrieve(self, request, *args, **kwargs):
@@ -639,6 +680,47 @@ class SolveProblemView(viewsets.ModelViewSet):
             status=status.HTTP_405_METHOD_NOT_ALLOWED
         )
 
+class LeaderboardView(viewsets.ViewSet):
+    """Global, weekly and per-tag leaderboards by problems solved"""
+    permission_classes = [IsAuthenticated]
+    max_page_size = 200
+
+    def list(self, request):
+        return self._board_response(request, GLOBAL_KEY)
+
+    @action(detail=False)
+    def weekly(self, request):
+        return self._board_response(request, get_weekly_key())
+
+    @action(detail=False, url_path=r'tags/(?P<tag>[^/]+)')
+    def tag(self, request, tag=None):
+        return self._board_response(request, get_tag_key(tag))
+
+    def _board_response(self, request, key):
+        try:
+            page = max(1, int(request.query_params.get('page', 1)))
+            page_size = min(self.max_page_size, max(1, int(request.query_params.get('page_size', 50))))
+        except ValueError:
+            return Response(
+                {"detail": "page and page_size must be integers"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            ensure_built()
+            # Read before the page so a racing update only makes the ETag older
+            etag = f'"{key}:{get_board_version(key)}:{page}:{page_size}"'
+            if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+            data = read_board(key, page, page_size)
+        except RedisError as e:
+            logger.error(f"Error reading leaderboard {key}: {str(e)}")
+            return Response(
+                {"detail": "Leaderboards are temporarily unavailable"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        return Response(data, headers={'ETag': etag})
+
 @api_view(['GET'])
 def current_user(request):
     if request.user.is_authenticated:
@@ -1,5 +1,3 @@
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
 from django.core.exceptions import ValidationError
 from typing import Dict, Any
 import json
@@ -7,8 +5,22 @@ import time
 from datetime import datetime
 import logging
 
+try:
+    import orjson
+except ImportError:  # optional, several times faster than the json module
+    orjson = None
+
+from .outbox import get_outbox
+
 logger = logging.getLogger(__name__)
 
+
+def encode_message(data: Dict[str, Any]) -> str:
+    """Encode a WebSocket message as compact JSON text"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(data, separators=(',', ':'))
+
 class WebSocketManager:
     """Manages WebSocket connections and notifications"""
     
@@ -25,7 +37,11 @@ class WebSocketManager:
             'leave': ['type', 'profile'],
             'ready': ['type', 'profile', 'all_ready'],
             'start': ['type', 'start_time', 'problem'],
-            'end': ['type', 'detail', 'winner', 'leaderboard']
+            'end': ['type', 'detail', 'winner', 'leaderboard'],
+            'verdict': ['type', 'submission_id', 'profile_id', 'status'],
+            'leaderboard_delta': ['type', 'version', 'rows'],
+            'match_found': ['type', 'session_id', 'problem'],
+            'matchmaking_expired': ['type']
         }
         
         if event_type not in required_fields:
@@ -35,31 +51,39 @@ class WebSocketManager:
         if missing_fields:
             raise ValidationError(f"Missing required fields: {missing_fields}")
     
+    @staticmethod
+    def get_user_group_name(user_id) -> str:
+        """Get the group every WebSocket connection of a user joins"""
+        return f"user_{user_id}"
+    
     @staticmethod
     def notify_session_update(session_id: str, event_type: str, data: Dict[str, Any]) -> None:
         """Send a notification to all session participants"""
+        WebSocketManager.publish(WebSocketManager.get_group_name(session_id), f'session_{event_type}', event_type, data)
+    
+    @staticmethod
+    def notify_user(user_id, event_type: str, data: Dict[str, Any]) -> None:
+        """Send a notification to every connection of one user"""
+        WebSocketManager.publish(WebSocketManager.get_user_group_name(user_id), f'user_{event_type}', event_type, data)
+    
+    @staticmethod
+    def publish(group_name: str, handler: str, event_type: str, data: Dict[str, Any]) -> None:
+        """Validate, encode and queue a message for a group"""
         try:
-            # Log outgoing message
-            logger.info(f"Outgoing WebSocket message - Session: {session_id}, Type: {event_type}, Data: {json.dumps(data)}")
-            
             # Validate message format
             WebSocketManager.validate_message(event_type, data)
             
             # Add timestamp to message
             data['timestamp'] = datetime.now().isoformat()
             
-            # Get channel layer
-            channel_layer = get_channel_layer()
-            group_name = WebSocketManager.get_group_name(session_id)
+            # Encode once here; consumers forward the text as is
+            text = encode_message(data)
+            
+            # Log outgoing message
+            logger.info(f"Outgoing WebSocket message - Group: {group_name}, Type: {event_type}, Data: {text}")
             
-            # Send message to group
-            async_to_sync(channel_layer.group_send)(
-                group_name,
-                {
-                    'type': f'session_{event_type}',
-                    'message': data
-                }
-            )
+            # Published in the background so callers never wait on the channel layer
+            get_outbox().put(group_name, {'type': handler, 'text': text})
             
         except Exception as e:
             # Log the error but don't raise it to prevent breaking the main flow
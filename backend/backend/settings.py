@@ -159,7 +159,7 @@ CORS_ALLOW_ALL_ORIGINS = True
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'CodingGrounds.authentication.CachedTokenAuthentication',
         # ...
     ],
 }
@@ -174,6 +174,9 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Redis used directly by the app (judge queue, caches, leaderboards)
+REDIS_URL = env('REDIS_URL', default='redis://127.0.0.1:6379/0')
+
 # Logging configuration
 LOGGING = {
     'version': 1,
@@ -237,5 +240,54 @@ SWAGGER_SETTINGS = {
 
 # WebSocket settings
 WEBSOCKET_HEARTBEAT_INTERVAL = 30  # seconds
+WEBSOCKET_HEARTBEAT_SLOTS = 30  # buckets of the shared heartbeat wheel, one tick per interval / slots
 WEBSOCKET_MAX_MESSAGE_SIZE = 1024 * 1024  # 1MB
 WEBSOCKET_RATE_LIMIT = 100  # messages per minute
+WEBSOCKET_OUTBOX_SIZE = 10000  # events queued for the background publisher before new ones are dropped
+WEBSOCKET_OUTBOX_BATCH = 200  # events published per round
+WEBSOCKET_OUTBOX_RETRIES = 5  # send attempts per event before it is spilled to Redis
+WEBSOCKET_OUTBOX_SPILL_SIZE = 100000  # undelivered events kept in Redis, oldest dropped first
+WEBSOCKET_OUTBOX_POLL_INTERVAL = 1  # seconds idle before the publisher drains spilled events
+
+# Session timer settings
+SESSION_TIMER_POLL_INTERVAL = 1  # seconds between checks for sessions past their end_time
+SESSION_TIMER_BATCH = 100  # due sessions ended per check
+
+# Matchmaking settings
+MATCHMAKING_SESSION_SIZE = 2  # players per matched session
+MATCHMAKING_BAND_WIDTH = 100  # rating points per band, also the initial search range either way
+MATCHMAKING_WIDEN_INTERVAL = 10  # seconds of waiting per extra band searched
+MATCHMAKING_MAX_BANDS = 5  # widest search range, in bands
+MATCHMAKING_TICK = 1  # seconds between matching rounds
+MATCHMAKING_TICKET_TTL = 15 * 60  # seconds a player waits before the ticket is dropped
+
+# Judge settings
+JUDGE_MAX_WORKERS = env.int('JUDGE_MAX_WORKERS', default=os.cpu_count() or 2)  # concurrent sandboxes per process
+JUDGE_WORK_DIR = env('JUDGE_WORK_DIR', default=None)  # scratch space for sources and outputs
+JUDGE_CGROUP_ROOT = env('JUDGE_CGROUP_ROOT', default=None)  # delegated cgroup v2 directory, enables memory.peak accounting
+JUDGE_CGROUP_PIDS_MAX = 64
+JUDGE_SANDBOX_UID = env.int('JUDGE_SANDBOX_UID', default=None)  # required: dedicated user submitted code runs as
+JUDGE_SANDBOX_GID = env.int('JUDGE_SANDBOX_GID', default=None)  # required: dedicated group submitted code runs as
+JUDGE_ALLOW_UNSANDBOXED = env.bool('JUDGE_ALLOW_UNSANDBOXED', default=False)  # development only: judge as this process's user, without stored test data
+JUDGE_COMPILE_TIME_LIMIT = 10  # seconds
+JUDGE_COMPILE_MEMORY_LIMIT = 1024  # MB
+JUDGE_ADDRESS_SPACE_SLACK = 64  # MB of RLIMIT_AS on top of the problem's memory limit
+JUDGE_OUTPUT_LIMIT = 64 * 1024 * 1024  # bytes
+JUDGE_QUEUE_POLL_TIMEOUT = 2  # seconds a worker blocks waiting for a job, keep below the Redis socket timeout
+JUDGE_BUILD_CACHE_DIR = env('JUDGE_BUILD_CACHE_DIR', default=None)  # defaults to a directory in the system temp dir
+JUDGE_BUILD_CACHE_BYTES = 512 * 1024 * 1024  # disk budget for cached compiler output
+JUDGE_CHECKER_TIME_LIMIT = 10  # CPU seconds for a custom checker on one test case
+JUDGE_CHECKER_MEMORY_LIMIT = 512  # MB for a custom checker
+JUDGE_TEST_DATA_DIR = env('JUDGE_TEST_DATA_DIR', default=str(BASE_DIR / 'testdata'))  # content-addressed test inputs and outputs, shared by web and judge hosts
+JUDGE_VERDICT_CACHE_TTL = 24 * 60 * 60  # seconds a memoized verdict is kept
+
+# Rating settings
+RATING_SYSTEM = env('RATING_SYSTEM', default='glicko2')  # 'elo' or 'glicko2'
+RATING_ELO_K = 32
+RATING_GLICKO2_TAU = 0.5  # constrains volatility changes, 0.3-1.2 per Glickman
+RATING_BLOCK_SIZE = 1024  # rows of the pairwise matrix computed at once
+
+# Token authentication cache
+AUTH_CACHE_TTL = 60  # seconds a resolved token is kept in Redis
+AUTH_CACHE_LOCAL_TTL = 5  # seconds a process trusts its own copy, bounds staleness after revocation
+AUTH_CACHE_LOCAL_ENTRIES = 10000
@@ -16,6 +16,7 @@ from CodingGrounds.views import (
     SubmissionView,
     GameParticipationView,
     GameSessionView,
+    LeaderboardView,
     SolveProblemView,
     UserLoginView,
     UserRegistrationView,
@@ -32,6 +33,7 @@ router.register(r'submissions', SubmissionView, basename='submission')
 router.register(r'sessions', GameSessionView, basename='session')
 router.register(r'participations', GameParticipationView, basename='participation')
 router.register(r'solve', SolveProblemView, basename='solve')
+router.register(r'leaderboard', LeaderboardView, basename='leaderboard')
 
 urlpatterns = [
     path('admin/', admin.site.urls),